@@ -0,0 +1,20 @@
+'''
+ScaleNPU software models
+
+Python reference models of the hs_npu datapath, importable from testbenches
+and host-side tools.
+'''
+from .params import DEFAULT_PARAMS, NpuParams, wrap
+from .golden import DenseLayer, accumulate, activate, dense, matmul, run_network
+from .cycle import FifoBank, GatekeeperChain, MmUnit, SystolicArray
+from .compiler import Job, LayerCsrs, Schedule, compile_dense
+from .image import Image, MemoryImage
+from .csr import Csr, CsrField, CsrMap, ExitCode
+from .importer import import_h5, load_layers, pack, quantize, read_h5
+from .container import ContainerReader, write_container
+from .overflow import LayerRange, analyze
+from .latency import Latency, Timing, calibrate, predict, predict_dense
+from .transaction import Access, JobResult, TransactionModel
+from .fusion import Stage, compile_chain, compile_stage, plan
+from .planner import Buffer, MemoryPlan, allocate
+from .conv import ConvLayer, ConvSchedule, Patches, compile_conv, conv2d
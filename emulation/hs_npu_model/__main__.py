@@ -0,0 +1,30 @@
+'''
+Command line tools of the software models
+
+    python -m hs_npu_model importer model/model_scaled.weights.h5 -o iris.pack
+    python -m hs_npu_model planner iris.hsnw --rows 256
+
+Each tool is the main() of the module it is named after. They go through
+the package rather than python -m hs_npu_model.<tool>: the package imports
+every module, so runpy would find the tool already loaded and warn.
+'''
+import importlib
+import sys
+
+TOOLS = ['importer', 'overflow', 'latency', 'fusion', 'planner']
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv or argv[0] not in TOOLS:
+        print(f'usage: python -m hs_npu_model {{{",".join(TOOLS)}}} ...', file=sys.stderr)
+        return 2
+
+    # Usage lines name the tool, not __main__.py
+    tool = argv[0]
+    sys.argv[0] = f'python -m hs_npu_model {tool}'
+    return importlib.import_module(f'.{tool}', __package__).main(argv[1:])
+
+
+if __name__ == '__main__':
+    sys.exit(main())
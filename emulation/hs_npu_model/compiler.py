@@ -0,0 +1,347 @@
+'''
+Dense layer compiler
+
+Splits an arbitrary (M x K) @ (K x N) layer into a schedule of NPU jobs, each
+one a set of CSR values plus the memory it expects at BASE_MEMADDR.
+
+hs_npu_memory_ordering reads a job's operands as one contiguous stream
+starting at the base address: weight rows (skipped with REWEIGHT), input rows
+(skipped with REINPUT), then SIZE bias words (USE_BIAS) and SIZE sum words
+(USE_SUMM). Results are written as SIZE sign extended words per input row.
+
+Tiles are ordered weight-stationary: every weight tile is fetched once and
+all rows that need it run back to back with REWEIGHT set. Layers deeper than
+SIZE chain partial sums through USE_SUMM, each partial job writing its result
+straight into the sums slot of the next one. The sums vector is shared by all
+rows of a job, so those jobs carry a single input row each, and partial sums
+pass through the activation unit, so they must fit ACTIVATION_OUTPUT_WIDTH.
+The hardware silently truncates them, compile_dense computes every partial
+sum up front and raises ValueError for layers that would not fit.
+'''
+import dataclasses
+
+import numpy as np
+
+from .golden import accumulate, matmul
+from .params import DEFAULT_PARAMS, wrap
+
+WORD_BYTES = 4
+
+# Input rows per block when checking partial sums, bounds the copies taken
+# out of lazy inputs
+CHECK_ROWS = 1024
+
+
+@dataclasses.dataclass
+class LayerCsrs:
+    '''Per-job CSR values, named after the hs_npu_executive outputs.'''
+    num_input_rows: int
+    num_input_columns: int
+    num_weight_rows: int
+    num_weight_columns: int
+    reuse_inputs: bool = False
+    reuse_weights: bool = False
+    save_outputs: bool = True
+    use_bias: bool = False
+    use_sum: bool = False
+    shift_amount: int = 0
+    activation_select: bool = False
+    base_address: int = 0
+    result_address: int = 0
+
+    def traffic(self, params=DEFAULT_PARAMS):
+        '''AXI bytes read and written by a job with these CSRs.'''
+        read = WORD_BYTES * params.SIZE * (int(self.use_bias) + int(self.use_sum))
+        if not self.reuse_weights:
+            read += self.num_weight_rows * params.line_bytes
+        if not self.reuse_inputs:
+            read += self.num_input_rows * params.line_bytes
+
+        write = WORD_BYTES * params.SIZE * self.num_input_rows if self.save_outputs else 0
+        return read, write
+
+
+@dataclasses.dataclass
+class Job:
+    '''
+    One NPU run
+
+    weights and inputs are int8 rows in memory order (weights bottom-up,
+    inputs right-aligned over SIZE lanes), bias is SIZE words. inputs taken
+    from a lazy matrix are an InputTile instead. Payloads the job does not
+    fetch are None. The sums of USE_SUMM jobs are not host data,
+    the previous partial job writes them right after the job's other operands.
+    '''
+    csrs: LayerCsrs
+    rows: slice
+    depth: slice
+    columns: slice
+    weights: np.ndarray = None
+    inputs: np.ndarray = None
+    bias: np.ndarray = None
+
+    def segments(self):
+        '''(address, kind, payload) in the order the job reads them.'''
+        address = self.csrs.base_address
+        for kind in ('weights', 'inputs', 'bias'):
+            payload = getattr(self, kind)
+            if payload is not None:
+                yield address, kind, payload
+                address += payload.nbytes
+
+
+class InputTile:
+    '''
+    A job's input rows left inside a lazy matrix such as conv.Patches
+
+    Stands in for the int8 rows with their shape, dtype and nbytes. The rows
+    are only gathered by np.asarray(), as the schedule writes them to memory,
+    so no more than one tile is ever copied out at a time.
+    '''
+    dtype = np.dtype(np.int8)
+
+    def __init__(self, source, rows, depth, size):
+        self.source = source
+        self.rows = rows
+        self.depth = depth
+        self.shape = (rows.stop - rows.start, size)
+
+    @property
+    def nbytes(self):
+        return self.shape[0] * self.shape[1]
+
+    def __array__(self, dtype=None, copy=None):
+        tile = np.zeros(self.shape, dtype=np.int8)
+        tile[:, self.shape[1] - (self.depth.stop - self.depth.start):] = \
+            self.source[self.rows, self.depth]
+        return tile if dtype is None else tile.astype(dtype)
+
+
+@dataclasses.dataclass
+class Schedule:
+    '''Jobs for one layer and the memory region they span.'''
+    jobs: list
+    base_address: int
+    end_address: int
+    output_address: int
+    output_shape: tuple
+    params: object = DEFAULT_PARAMS
+
+    @property
+    def size(self):
+        return self.end_address - self.base_address
+
+    def segments(self):
+        '''Host-provided payloads, as (address, kind, array).'''
+        for job in self.jobs:
+            yield from job.segments()
+
+    def write(self, memory, offset=0):
+        '''Place every payload into a writable buffer mapped at offset.'''
+        memory = np.frombuffer(memory, dtype=np.uint8)
+        for address, _, payload in self.segments():
+            start = address - offset
+            memory[start:start + payload.nbytes] = np.asarray(payload).view(np.uint8).reshape(-1)
+
+    def output_view(self, memory, offset=0):
+        '''Output tiles as written by the NPU, (column tiles, M, SIZE) words.'''
+        rows, columns = self.output_shape
+        tiles = -(-columns // self.params.SIZE)
+        return np.frombuffer(memory, dtype='<i4', count=tiles * rows * self.params.SIZE,
+                             offset=self.output_address - offset) \
+            .reshape(tiles, rows, self.params.SIZE)
+
+    def read_output(self, memory, offset=0):
+        '''Reassemble the (M, N) layer output from the output tiles.'''
+        rows, columns = self.output_shape
+        tiles = self.output_view(memory, offset)
+        return tiles.transpose(1, 0, 2).reshape(rows, -1)[:, :columns].astype(np.int64)
+
+    def relocate_output(self, address):
+        '''
+        The same schedule writing its output tiles at address instead. Partial
+        sums still go to the operand region, base_address to end_address
+        then only spans the operands.
+        '''
+        jobs = []
+        for job in self.jobs:
+            csrs = job.csrs
+            if csrs.save_outputs and csrs.result_address >= self.output_address:
+                csrs = dataclasses.replace(csrs, result_address=csrs.result_address -
+                                           self.output_address + address)
+            jobs.append(dataclasses.replace(job, csrs=csrs))
+
+        return dataclasses.replace(self, jobs=jobs, end_address=self.output_address,
+                                   output_address=address)
+
+    def traffic(self):
+        '''AXI bytes read and written by the whole schedule.'''
+        read, write = zip(*(job.csrs.traffic(self.params) for job in self.jobs))
+        return sum(read), sum(write)
+
+
+def _check_int8(name, values):
+    values = np.asarray(values)
+    if values.size and (values.min() < -128 or values.max() > 127):
+        raise ValueError(f'{name} must be int8 values, memory operands are bytes')
+    return values.astype(np.int64)
+
+
+def _check_inputs(inputs):
+    # Lazy matrices such as conv.Patches only support shape and 2D slicing,
+    # jobs keep InputTiles of them
+    if hasattr(inputs, 'shape') and not isinstance(inputs, np.ndarray):
+        return inputs
+    return _check_int8('inputs', np.atleast_2d(inputs))
+
+
+def _align(address, alignment):
+    return -(-address // alignment) * alignment
+
+
+def _tiles(length, tile):
+    return [slice(start, min(start + tile, length)) for start in range(0, length, tile)]
+
+
+def _check_partial_sums(inputs, weights, bias, depth_tiles, params):
+    '''Raise if a partial sum of a chained layer leaves ACTIVATION_OUTPUT_WIDTH.'''
+    width = params.ACTIVATION_OUTPUT_WIDTH
+    limit = 1 << (width - 1)
+    rows, columns = inputs.shape[0], weights.shape[1]
+    for block in _tiles(rows, CHECK_ROWS):
+        sums = accumulate(np.zeros((block.stop - block.start, columns), dtype=np.int64), bias, params)
+        for depth_tile in depth_tiles[:-1]:
+            sums = wrap(sums + matmul(inputs[block, depth_tile], weights[depth_tile], params=params),
+                        params.OUTPUT_DATA_WIDTH)
+            wrong = np.argwhere((sums < -limit) | (sums >= limit))
+            if len(wrong):
+                row, column = wrong[0]
+                raise ValueError(
+                    f'partial sum over depth 0-{depth_tile.stop} of row {block.start + row}, '
+                    f'column {column} is {sums[row, column]}, it does not fit the {width} bit '
+                    f'activation output it passes through between depth tiles')
+
+
+def _tile_lengths(length, tile):
+    # (first tile, {length: count} of the tiles after it) of _tiles(length, tile)
+    first = min(length, tile)
+    rest = length - first
+    counts = {tile: rest // tile} if rest // tile else {}
+    if rest % tile:
+        counts[rest % tile] = 1
+    return first, counts
+
+
+def count_jobs(rows, depth, columns, bias=True, params=DEFAULT_PARAMS):
+    '''
+    (LayerCsrs, count) pairs covering the jobs compile_dense emits for a
+    rows x depth @ depth x columns layer, without building any of them.
+    Addresses are left at zero, everything else matches.
+    '''
+    size = params.SIZE
+    first_depth, later_depths = _tile_lengths(depth, size)
+    first_row, later_rows = _tile_lengths(rows, 1 if depth > size else params.BUFFER_SIZE)
+    first_column, later_columns = _tile_lengths(columns, size)
+
+    def tiles(first, later):
+        return [(first, 1, True)] + [(length, count, False) for length, count in later.items()]
+
+    jobs = []
+    for column_length, column_count, _ in tiles(first_column, later_columns):
+        for depth_length, depth_count, first in tiles(first_depth, later_depths):
+            for row_length, row_count, weights in tiles(first_row, later_rows):
+                csrs = LayerCsrs(num_input_rows=row_length, num_input_columns=depth_length,
+                                 num_weight_rows=depth_length, num_weight_columns=column_length,
+                                 reuse_weights=not weights, use_bias=first and bias,
+                                 use_sum=not first)
+                jobs.append((csrs, column_count * depth_count * row_count))
+    return jobs
+
+
+def compile_dense(inputs, weights, bias=None, shift=0, relu=False, base_address=0,
+                  params=DEFAULT_PARAMS):
+    '''Build the job schedule of inputs @ weights + bias, then ReLU and shift.'''
+    size = params.SIZE
+    if params.line_bytes != size:
+        raise ValueError('hs_npu_memory_ordering reads one 4 * BURST_SIZE byte line per '
+                         'matrix row, SIZE must equal 4 * BURST_SIZE')
+
+    inputs = _check_inputs(inputs)
+    weights = _check_int8('weights', weights)
+    rows, depth = inputs.shape
+    if weights.shape[0] != depth:
+        raise ValueError(f'cannot multiply {inputs.shape} inputs by {weights.shape} weights')
+
+    columns = weights.shape[1]
+    if bias is not None:
+        bias = np.asarray(bias, dtype=np.int64)
+
+    depth_tiles = _tiles(depth, size)
+    column_tiles = _tiles(columns, size)
+    chained = len(depth_tiles) > 1
+    row_tiles = _tiles(rows, 1 if chained else params.BUFFER_SIZE)
+    if chained:
+        _check_partial_sums(inputs, weights, bias, depth_tiles, params)
+
+    # Operand regions first, then one output tile of rows x SIZE words per
+    # column tile. Partial results land inside the next job's region.
+    plan = []
+    address = _align(base_address, params.line_bytes)
+    for n, column_tile in enumerate(column_tiles):
+        for k, depth_tile in enumerate(depth_tiles):
+            for i, row_tile in enumerate(row_tiles):
+                first, last = k == 0, k == len(depth_tiles) - 1
+                job = Job(
+                    csrs=LayerCsrs(
+                        num_input_rows=row_tile.stop - row_tile.start,
+                        num_input_columns=depth_tile.stop - depth_tile.start,
+                        num_weight_rows=depth_tile.stop - depth_tile.start,
+                        num_weight_columns=column_tile.stop - column_tile.start,
+                        reuse_weights=i > 0,
+                        use_bias=first and bias is not None,
+                        use_sum=not first,
+                        shift_amount=shift if last else 0,
+                        activation_select=relu if last else False,
+                        base_address=address,
+                    ),
+                    rows=row_tile, depth=depth_tile, columns=column_tile,
+                )
+
+                if i == 0:
+                    tile = np.zeros((job.csrs.num_weight_rows, size), dtype=np.int8)
+                    tile[:, :job.csrs.num_weight_columns] = weights[depth_tile, column_tile]
+                    job.weights = tile[::-1].copy()
+
+                if isinstance(inputs, np.ndarray):
+                    job.inputs = np.zeros((job.csrs.num_input_rows, size), dtype=np.int8)
+                    job.inputs[:, size - job.csrs.num_input_columns:] = inputs[row_tile, depth_tile]
+                else:
+                    job.inputs = InputTile(inputs, row_tile, depth_tile, size)
+
+                if job.csrs.use_bias:
+                    job.bias = np.zeros(size, dtype='<i4')
+                    job.bias[:job.csrs.num_weight_columns] = bias[column_tile]
+
+                address += sum(payload.nbytes for *_, payload in job.segments())
+                if job.csrs.use_sum:
+                    address += WORD_BYTES * size
+
+                plan.append((n, k, i, job, address))
+
+    output_address = _align(address, params.line_bytes)
+    row_bytes = WORD_BYTES * size
+
+    by_tile = {(n, k, i): end for n, k, i, _, end in plan}
+    for n, k, i, job, _ in plan:
+        following = by_tile.get((n, k + 1, i))
+        if following is not None:
+            # Partial sum goes straight into the sums slot of the next depth tile
+            job.csrs.result_address = following - row_bytes
+        else:
+            job.csrs.result_address = output_address + \
+                row_bytes * (n * rows + job.rows.start)
+
+    return Schedule(jobs=[job for *_, job, _ in plan], base_address=base_address,
+                    end_address=output_address + row_bytes * rows * len(column_tiles),
+                    output_address=output_address, output_shape=(rows, columns),
+                    params=params)
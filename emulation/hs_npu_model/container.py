@@ -0,0 +1,213 @@
+'''
+Weight container
+
+A compact binary file holding a network's dense layers, readable from
+Python and from C (model/load_utility.c) alike. All fields are little-endian:
+
+    header   magic "HSNW", u16 version, u16 header size, u32 layer count,
+             u32 index entry size
+    index    one entry per layer: char name[32], u32 rows, u32 columns,
+             u32 weights offset, u32 bias offset, u8 weights dtype,
+             u8 bias dtype, u8 shift, u8 flags, u32 reserved[3]
+    data     weights as (rows, columns) row-major, then bias, each starting
+             on an 8 byte boundary
+
+Offsets are from the start of the file. Dtype codes are 1 int8, 2 int16 and
+3 int32, a bias dtype of 0 means the layer has none. Flag bit 0 is the ReLU.
+Readers skip index entry bytes they do not know, so fields can be added at
+the end of an entry without bumping the version.
+
+ContainerReader maps the file and hands out layers as NumPy views of the
+mapping, so opening a large model reads nothing but the index.
+'''
+import mmap
+
+import numpy as np
+
+from .golden import DenseLayer
+
+MAGIC = b'HSNW'
+VERSION = 1
+ALIGNMENT = 8
+NAME_BYTES = 32
+
+FLAG_RELU = 1 << 0
+
+DTYPES = {
+    1: np.dtype('i1'),
+    2: np.dtype('<i2'),
+    3: np.dtype('<i4'),
+}
+_CODES = {dtype: code for code, dtype in DTYPES.items()}
+
+HEADER = np.dtype([
+    ('magic', 'S4'),
+    ('version', '<u2'),
+    ('header_size', '<u2'),
+    ('count', '<u4'),
+    ('entry_size', '<u4'),
+])
+
+ENTRY = np.dtype([
+    ('name', f'S{NAME_BYTES}'),
+    ('rows', '<u4'),
+    ('columns', '<u4'),
+    ('weights_offset', '<u4'),
+    ('bias_offset', '<u4'),
+    ('weights_dtype', 'u1'),
+    ('bias_dtype', 'u1'),
+    ('shift', 'u1'),
+    ('flags', 'u1'),
+    ('reserved', '<u4', 3),
+])
+
+
+def _align(offset):
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+def _narrowest(values, choices):
+    for dtype in choices:
+        info = np.iinfo(dtype)
+        if values.size == 0 or (values.min() >= info.min and values.max() <= info.max):
+            return dtype
+    raise ValueError(f'values do not fit in {choices[-1]}')
+
+
+def write_container(path, layers):
+    '''Write {name: DenseLayer} to path, weights in the narrowest dtype that holds them.'''
+    entries = np.zeros(len(layers), dtype=ENTRY)
+    chunks = []
+    offset = _align(HEADER.itemsize + entries.nbytes)
+
+    for entry, (name, layer) in zip(entries, layers.items()):
+        encoded = name.encode()
+        if len(encoded) > NAME_BYTES:
+            raise ValueError(f'layer name {name!r} longer than {NAME_BYTES} bytes')
+
+        weights = np.asarray(layer.weights, dtype=np.int64)
+        if weights.ndim != 2:
+            raise ValueError(f'{name}: weights must be (inputs, outputs), got {weights.shape}')
+        dtype = _narrowest(weights, [DTYPES[1], DTYPES[2], DTYPES[3]])
+
+        entry['name'] = encoded
+        entry['rows'], entry['columns'] = weights.shape
+        entry['weights_offset'] = offset
+        entry['weights_dtype'] = _CODES[dtype]
+        entry['shift'] = layer.shift
+        entry['flags'] = FLAG_RELU if layer.relu else 0
+        chunks.append((offset, weights.astype(dtype).tobytes()))
+        offset = _align(offset + weights.size * dtype.itemsize)
+
+        if layer.bias is not None:
+            bias = np.asarray(layer.bias, dtype=np.int64)
+            if bias.shape != (weights.shape[1],):
+                raise ValueError(f'{name}: bias shape {bias.shape} does not match {weights.shape[1]} outputs')
+            entry['bias_offset'] = offset
+            entry['bias_dtype'] = _CODES[DTYPES[3]]
+            chunks.append((offset, bias.astype(DTYPES[3]).tobytes()))
+            offset = _align(offset + bias.nbytes)
+
+    header = np.zeros((), dtype=HEADER)
+    header['magic'] = MAGIC
+    header['version'] = VERSION
+    header['header_size'] = HEADER.itemsize
+    header['count'] = len(layers)
+    header['entry_size'] = ENTRY.itemsize
+
+    data = bytearray(offset)
+    data[:HEADER.itemsize] = header.tobytes()
+    data[HEADER.itemsize:HEADER.itemsize + entries.nbytes] = entries.tobytes()
+    for start, chunk in chunks:
+        data[start:start + len(chunk)] = chunk
+
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+class ContainerReader:
+    '''
+    Read-only view of a weight container
+
+    Layers come back as DenseLayer whose weights and bias are read-only views
+    into the mapped file, created on first access. Use as a context manager
+    or call close(). Views still held then keep the mapping alive and stay
+    valid, it is unmapped once the last of them is dropped.
+    '''
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if len(self._map) < HEADER.itemsize:
+            raise ValueError(f'{path}: too short for a weight container')
+        header = np.frombuffer(self._map, dtype=HEADER, count=1)[0]
+        if header['magic'] != MAGIC:
+            raise ValueError(f'{path}: not a weight container')
+        if header['version'] != VERSION:
+            raise ValueError(f'{path}: unsupported container version {header["version"]}')
+        if header['entry_size'] < ENTRY.itemsize:
+            raise ValueError(f'{path}: index entries of {header["entry_size"]} bytes, '
+                             f'{ENTRY.itemsize} needed')
+
+        self.version = int(header['version'])
+        count = int(header['count'])
+        self.index = np.ndarray((count,), dtype=ENTRY, buffer=self._map,
+                                offset=int(header['header_size']),
+                                strides=(int(header['entry_size']),))
+        self._entries = {entry['name'].decode(): entry for entry in self.index}
+        self._layers = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._layers.clear()
+        self._entries.clear()
+        self.index = None
+        try:
+            self._map.close()
+        except BufferError:
+            # Arrays handed out are still alive, they hold a reference to
+            # the mapping and garbage collection unmaps it after them
+            pass
+        self._map = None
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __iter__(self):
+        return iter(self._entries)
+
+    def __contains__(self, name):
+        return name in self._entries
+
+    def keys(self):
+        return self._entries.keys()
+
+    def items(self):
+        return ((name, self[name]) for name in self._entries)
+
+    def _view(self, offset, dtype_code, shape):
+        dtype = DTYPES[int(dtype_code)]
+        return np.frombuffer(self._map, dtype=dtype, count=int(np.prod(shape)),
+                             offset=int(offset)).reshape(shape)
+
+    def __getitem__(self, name):
+        if name not in self._layers:
+            entry = self._entries[name]
+            shape = (int(entry['rows']), int(entry['columns']))
+            weights = self._view(entry['weights_offset'], entry['weights_dtype'], shape)
+            bias = None
+            if entry['bias_dtype']:
+                bias = self._view(entry['bias_offset'], entry['bias_dtype'], shape[1:])
+            self._layers[name] = DenseLayer(weights, bias, shift=int(entry['shift']),
+                                            relu=bool(entry['flags'] & FLAG_RELU))
+        return self._layers[name]
+
+    def layers(self):
+        '''{name: DenseLayer} in file order, as importer.pack() takes them.'''
+        return dict(self.items())
@@ -0,0 +1,158 @@
+'''
+Conv2D lowering to NPU matmul jobs
+
+A convolution is one dense layer over its im2col matrix: a row per output
+pixel (n, y, x) and a column per kernel tap (ky, kx, c). The kernel, in Keras
+(KH, KW, Cin, Cout) layout, reshapes to the matching (KH * KW * Cin, Cout)
+weights. Patches is a read-only strided view of the padded input, which is
+the only host copy of the whole tensor. Jobs keep their inputs as
+compiler.InputTile references into it, and Schedule.write gathers each tile
+straight into memory, one at a time. The memory image itself does hold the
+im2col matrix, padded to SIZE lanes, once per column tile of Cout: every
+job reads its operands as one contiguous stream of its own.
+
+Limits:
+
+- Kernels with more than SIZE taps (KH * KW * Cin), every 3x3 kernel among
+  them, chain partial sums as any deep compile_dense layer does. They fall
+  back to one output pixel per job and depth tile, a 3x3 kernel on 8x8
+  outputs takes 128 jobs.
+- Those partial sums pass through the 16 bit activation output. Full range
+  int8 inputs and kernels rarely fit, and compile_dense refuses them with a
+  ValueError naming the offending output pixel by its im2col row.
+
+Stride, dilation and padding ('valid', 'same' as in Keras, or explicit
+per-side pixel counts) follow tf.keras.layers.Conv2D, on NHWC tensors.
+'''
+import dataclasses
+
+import numpy as np
+
+from .compiler import compile_dense
+from .golden import dense
+from .params import DEFAULT_PARAMS
+
+
+@dataclasses.dataclass
+class ConvLayer:
+    '''One Conv2D layer, kernel in Keras (KH, KW, Cin, Cout) layout.'''
+    weights: np.ndarray
+    bias: np.ndarray = None
+    stride: tuple = (1, 1)
+    padding: object = 'valid'
+    dilation: tuple = (1, 1)
+    shift: int = 0
+    relu: bool = False
+
+    @property
+    def kernel(self):
+        '''Weights as the dense layer over the im2col matrix.'''
+        weights = np.asarray(self.weights)
+        return weights.reshape(-1, weights.shape[-1])
+
+
+def _pair(value):
+    return (value, value) if np.isscalar(value) else tuple(value)
+
+
+def _padding(padding, size, kernel, stride, dilation):
+    '''(before, after) pixels along one axis for 'valid' or 'same'.'''
+    if padding == 'valid':
+        return 0, 0
+    if padding != 'same':
+        raise ValueError(f"padding must be 'valid', 'same' or pixel counts, not {padding!r}")
+
+    span = dilation * (kernel - 1) + 1
+    total = max((-(-size // stride) - 1) * stride + span - size, 0)
+    return total // 2, total - total // 2
+
+
+class Patches:
+    '''
+    im2col matrix of an NHWC int8 tensor, without building it
+
+    shape is (N * OH * OW, KH * KW * C). Indexing with a (rows, columns)
+    pair of slices gathers only those rows out of the strided
+    (N, OH, OW, KH, KW, C) view.
+    '''
+
+    def __init__(self, inputs, kernel_size, stride=1, padding='valid', dilation=1):
+        inputs = np.asarray(inputs)
+        if inputs.ndim != 4:
+            raise ValueError(f'inputs must be NHWC, got shape {inputs.shape}')
+        if inputs.size and (inputs.min() < -128 or inputs.max() > 127):
+            raise ValueError('inputs must be int8 values, memory operands are bytes')
+
+        kh, kw = _pair(kernel_size)
+        sy, sx = _pair(stride)
+        dy, dx = _pair(dilation)
+        n, h, w, c = inputs.shape
+        if isinstance(padding, str):
+            pad_y = _padding(padding, h, kh, sy, dy)
+            pad_x = _padding(padding, w, kw, sx, dx)
+        else:
+            pad_y, pad_x = (_pair(pad) for pad in _pair(padding))
+
+        padded = np.pad(inputs.astype(np.int8), ((0, 0), pad_y, pad_x, (0, 0)))
+        out_h = (padded.shape[1] - dy * (kh - 1) - 1) // sy + 1
+        out_w = (padded.shape[2] - dx * (kw - 1) - 1) // sx + 1
+        if out_h <= 0 or out_w <= 0:
+            raise ValueError(f'{kh}x{kw} kernel does not fit {h}x{w} inputs')
+
+        bn, by, bx, bc = padded.strides
+        self.view = np.lib.stride_tricks.as_strided(
+            padded, shape=(n, out_h, out_w, kh, kw, c),
+            strides=(bn, by * sy, bx * sx, by * dy, bx * dx, bc), writeable=False)
+
+    @property
+    def output_shape(self):
+        '''(N, OH, OW) of the convolution.'''
+        return self.view.shape[:3]
+
+    @property
+    def shape(self):
+        n, out_h, out_w, kh, kw, c = self.view.shape
+        return n * out_h * out_w, kh * kw * c
+
+    def __getitem__(self, index):
+        rows, columns = index
+        pixels = np.unravel_index(np.arange(*rows.indices(self.shape[0])), self.output_shape)
+        return self.view[pixels].reshape(len(pixels[0]), -1)[:, columns].astype(np.int64)
+
+    def __array__(self, dtype=None):
+        # Only for references and debugging, this is the copy Patches avoids
+        return self[:, :].astype(dtype or np.int64)
+
+
+@dataclasses.dataclass
+class ConvSchedule:
+    '''A compiled Schedule plus the NHWC shape its (pixels, Cout) output maps to.'''
+    schedule: object
+    output_shape: tuple
+
+    def write(self, memory, offset=0):
+        self.schedule.write(memory, offset)
+
+    def read_output(self, memory, offset=0):
+        return self.schedule.read_output(memory, offset).reshape(self.output_shape)
+
+
+def compile_conv(inputs, layer, base_address=0, params=DEFAULT_PARAMS):
+    '''Lower a ConvLayer on NHWC int8 inputs to compile_dense jobs.'''
+    kernel = np.asarray(layer.weights)
+    if kernel.ndim != 4 or kernel.shape[2] != np.shape(inputs)[-1]:
+        raise ValueError(f'cannot convolve {np.shape(inputs)} inputs with a {kernel.shape} kernel')
+
+    patches = Patches(inputs, kernel.shape[:2], layer.stride, layer.padding, layer.dilation)
+    schedule = compile_dense(patches, layer.kernel, layer.bias, shift=layer.shift, relu=layer.relu,
+                             base_address=base_address, params=params)
+    return ConvSchedule(schedule, (*patches.output_shape, kernel.shape[-1]))
+
+
+def conv2d(inputs, layer, params=DEFAULT_PARAMS):
+    '''Golden NHWC output of a ConvLayer, through the materialized im2col matrix.'''
+    kernel = np.asarray(layer.weights)
+    patches = Patches(inputs, kernel.shape[:2], layer.stride, layer.padding, layer.dilation)
+    outputs = dense(np.asarray(patches), layer.kernel, layer.bias, shift=layer.shift,
+                    relu=layer.relu, params=params)
+    return outputs.reshape(*patches.output_shape, kernel.shape[-1])
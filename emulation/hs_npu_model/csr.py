@@ -0,0 +1,127 @@
+'''
+Control and status register map
+
+Reads register addresses and fields from hs_npu_ctrlstatus_regs.rdl, so
+host code and testbenches follow the RTL instead of keeping their own
+offset tables. Only the subset of SystemRDL the file uses is understood:
+nested regfile/reg/field blocks with explicit @ offsets and [msb:lsb] bits.
+'''
+import dataclasses
+import enum
+import pathlib
+import re
+
+RDL = pathlib.Path(__file__).resolve().parents[2] / 'rtl' / 'hs_npu' / 'hs_npu_ctrlstatus_regs.rdl'
+
+_COMMENT = re.compile(r'//[^\n]*|/\*.*?\*/', re.S)
+_STRING = re.compile(r'"(?:[^"\\]|\\.)*"')
+_TOKEN = re.compile(r'\b(addrmap|regfile|reg|field)\b[^{;]*\{'
+                    r'|\}\s*(\w+)?\s*(?:\[(\d+)(?::(\d+))?\])?\s*(?:=\s*[^;@]+)?(?:@\s*(\w+))?\s*;')
+
+# LayerCsrs field to register, in the order the driver programs them
+LAYER_REGISTERS = {
+    'num_input_rows':     'DIMS.INROWS',
+    'num_input_columns':  'DIMS.INCOLS',
+    'num_weight_rows':    'DIMS.WGHTROWS',
+    'num_weight_columns': 'DIMS.WGHTCOLS',
+    'reuse_inputs':       'CTRL.REINPUTS',
+    'reuse_weights':      'CTRL.REWEIGHTS',
+    'save_outputs':       'CTRL.SAVEOUT',
+    'use_bias':           'CTRL.USEBIAS',
+    'use_sum':            'CTRL.USESUMM',
+    'shift_amount':       'CTRL.SHIFTAMT',
+    'activation_select':  'CTRL.ACTFN',
+    'base_address':       'MEMADDRS.BASE',
+    'result_address':     'MEMADDRS.RESULT',
+}
+
+
+class ExitCode(enum.IntEnum):
+    '''MAINCTRL.EXITCODE values.'''
+    UNUSED = 0b00
+    SUCCESS = 0b01
+    MEM_ERR = 0b10
+    CPU_ERR = 0b11
+
+
+@dataclasses.dataclass(frozen=True)
+class CsrField:
+    name: str
+    lsb: int
+    width: int
+
+    @property
+    def mask(self):
+        return ((1 << self.width) - 1) << self.lsb
+
+
+@dataclasses.dataclass(frozen=True)
+class Csr:
+    name: str
+    address: int
+    fields: tuple
+
+
+class CsrMap:
+    '''
+    Registers by dotted path (MAINCTRL.INIT)
+
+    Lookups also accept the bare register name when it is unique.
+    '''
+
+    def __init__(self, registers):
+        self.registers = {register.name: register for register in registers}
+
+        names = {}
+        for register in registers:
+            names.setdefault(register.name.rsplit('.', 1)[-1], []).append(register)
+        self._short = {name: found[0] for name, found in names.items() if len(found) == 1}
+
+    @classmethod
+    def from_rdl(cls, path=RDL):
+        text = _STRING.sub('""', _COMMENT.sub('', pathlib.Path(path).read_text()))
+
+        # Blocks close innermost first, so children are collected with
+        # offsets relative to their parent and rebased when it closes
+        stack = [[]]
+        kinds = []
+        for match in _TOKEN.finditer(text):
+            kind, name, msb, lsb, offset = match.groups()
+            if kind:
+                kinds.append(kind)
+                stack.append([])
+                continue
+
+            kind = kinds.pop()
+            children = stack.pop()
+            offset = int(offset, 0) if offset else 0
+            if kind == 'field':
+                msb = int(msb) if msb else 0
+                lsb = int(lsb) if lsb else msb
+                stack[-1].append(CsrField(name, lsb, msb - lsb + 1))
+            elif kind == 'reg':
+                stack[-1].append(Csr(name, offset, tuple(children)))
+            elif kind == 'regfile':
+                stack[-1].extend(Csr(f'{name}.{csr.name}', offset + csr.address, csr.fields)
+                                 for csr in children)
+            else:
+                stack[-1].extend(children)
+
+        return cls(stack[0])
+
+    def __getitem__(self, name):
+        if name in self.registers:
+            return self.registers[name]
+        return self._short[name]
+
+    def __iter__(self):
+        return iter(self.registers.values())
+
+    def address(self, name):
+        return self[name].address
+
+    def layer_writes(self, csrs):
+        '''(address, value) pairs programming a LayerCsrs, INIT excluded.'''
+        return [(self.address(register), int(getattr(csrs, field)))
+                for field, register in LAYER_REGISTERS.items()]
+
@@ -0,0 +1,263 @@
+'''
+Cycle-accurate model of the matrix multiplication unit
+
+Python counterparts of hs_npu_fifo, hs_npu_gatekeeper and hs_npu_systolic,
+plus hs_npu_mm_unit wiring them together. State lives in preallocated NumPy
+arrays (one row per lane, one cell per MAC) and every call to step() is one
+rising clock edge for the whole bank, so a SIZE x SIZE array advances with a
+handful of vectorized operations instead of one object per MAC.
+
+Combinational outputs are properties of the current state, the same values a
+testbench would sample right after the clock edge.
+'''
+import numpy as np
+
+from .params import DEFAULT_PARAMS, wrap
+
+
+class FifoBank:
+    '''
+    A bank of hs_npu_fifo instances sharing write controls
+
+    Each lane has its own pointers and read handshake, as in hs_npu_mm_unit
+    where every input FIFO is drained by its own gatekeeper.
+    '''
+
+    def __init__(self, lanes, depth, width):
+        self.lanes = lanes
+        self.depth = depth
+        self.width = width
+
+        self.fifo = np.zeros((lanes, depth), dtype=np.int64)
+        self.read_ptr = np.zeros(lanes, dtype=np.int64)
+        self.write_ptr = np.zeros(lanes, dtype=np.int64)
+        self.valid_o = np.zeros(lanes, dtype=bool)
+        self.read_data = np.zeros(lanes, dtype=np.int64)
+        self.stall_data = np.zeros(lanes, dtype=np.int64)
+        self.was_stalled = np.zeros(lanes, dtype=bool)
+
+        self._lane = np.arange(lanes)
+
+    def reset(self):
+        self.read_ptr[:] = 0
+        self.write_ptr[:] = 0
+        self.valid_o[:] = False
+
+    @property
+    def out(self):
+        return np.where(self.was_stalled, self.stall_data, self.read_data)
+
+    @property
+    def can_read(self):
+        return self.read_ptr != self.write_ptr
+
+    @property
+    def ready_o(self):
+        return (self.write_ptr + 1) % self.depth != self.read_ptr
+
+    @property
+    def occupancy(self):
+        '''Entries written and not yet popped, per lane.'''
+        return (self.write_ptr - self.read_ptr) % self.depth
+
+    def step(self, valid_i, data_in, ready_i, flush=False, reread=False):
+        ready_i = np.broadcast_to(np.asarray(ready_i, dtype=bool), self.lanes)
+        can_read = self.can_read
+        can_write = self.ready_o
+        out_stall = ~ready_i & self.valid_o
+
+        write_ptr = np.where(can_write & bool(valid_i), (self.write_ptr + 1) % self.depth,
+                             self.write_ptr)
+        read_ptr = np.where(~out_stall & can_read, (self.read_ptr + 1) % self.depth,
+                            self.read_ptr)
+        valid_o = np.where(out_stall, self.valid_o, can_read)
+
+        if flush:
+            read_ptr[:] = 0
+            write_ptr[:] = 0
+            valid_o[:] = False
+
+        if reread:
+            read_ptr[:] = 0
+
+        # Memory side: the read port samples before this edge's write lands
+        read_data = self.fifo[self._lane, self.read_ptr]
+        self.stall_data = np.where(self.was_stalled, self.stall_data, self.read_data)
+        self.read_data = read_data
+        self.was_stalled = out_stall
+
+        lanes = self._lane[can_write]
+        self.fifo[lanes, self.write_ptr[can_write]] = \
+            wrap(np.broadcast_to(data_in, self.lanes), self.width)[can_write]
+
+        self.read_ptr = read_ptr
+        self.write_ptr = write_ptr
+        self.valid_o = valid_o
+
+
+class GatekeeperChain:
+    '''
+    A cascade of hs_npu_gatekeeper instances
+
+    The start pulse ripples one lane per cycle, which is what skews inputs
+    into and results out of the systolic array.
+    '''
+
+    def __init__(self, lanes):
+        self.lanes = lanes
+        self.enable_cycles = np.zeros(lanes, dtype=np.int64)
+        self.start_out = np.zeros(lanes, dtype=bool)
+
+    def reset(self):
+        self.enable_cycles[:] = 0
+
+    @property
+    def active(self):
+        return self.enable_cycles > 0
+
+    def output_data(self, input_data):
+        return np.where(self.active, input_data, 0)
+
+    def step(self, start_in, enable_cycles_in):
+        start = np.concatenate(([bool(start_in)], self.start_out[:-1]))
+
+        enable_cycles = np.where(start, enable_cycles_in, self.enable_cycles)
+        self.enable_cycles = np.where(self.active, self.enable_cycles - 1, enable_cycles)
+        self.start_out = start
+
+
+class SystolicArray:
+    '''
+    hs_npu_systolic as three SIZE x SIZE register files
+
+    Arrays are indexed [row, column]: inputs enter row r from the left and
+    move right, weights and partial sums enter column c from the top and move
+    down, result[c] is the bottom MAC of column c.
+    '''
+
+    def __init__(self, size, params=DEFAULT_PARAMS):
+        self.size = size
+        self.params = params
+
+        self.a = np.zeros((size, size), dtype=np.int64)
+        self.b = np.zeros((size, size), dtype=np.int64)
+        self.sum = np.zeros((size, size), dtype=np.int64)
+
+        self._a_in = np.zeros((size, size), dtype=np.int64)
+        self._b_in = np.zeros((size, size), dtype=np.int64)
+        self._sum_in = np.zeros((size, size), dtype=np.int64)
+
+    @property
+    def result(self):
+        return self.sum[-1]
+
+    def step(self, matrix_a, matrix_b, sum_in, enable_in):
+        params = self.params
+
+        self._a_in[:, 0] = wrap(matrix_a, params.INPUT_DATA_WIDTH)
+        self._a_in[:, 1:] = self.a[:, :-1]
+
+        self._sum_in[0] = wrap(sum_in, params.OUTPUT_DATA_WIDTH)
+        self._sum_in[1:] = self.sum[:-1]
+
+        # result <= (a_in * b_ff) + sum, using the weight held before this edge
+        self.sum = wrap(self._a_in * self.b + self._sum_in, params.OUTPUT_DATA_WIDTH)
+        self.a, self._a_in = self._a_in, self.a
+
+        if enable_in:
+            self._b_in[0] = wrap(matrix_b, params.WEIGHT_DATA_WIDTH)
+            self._b_in[1:] = self.b[:-1]
+            self.b, self._b_in = self._b_in, self.b
+
+    def dump(self):
+        '''Per-MAC text table in the format of emulation/mac_matrix_info.txt.'''
+        lines = []
+        for row in range(self.size):
+            ids = range(row * self.size, (row + 1) * self.size)
+            lines.append(''.join(f'MAC {i:<12} | ' for i in ids))
+            for label, values in (('Input ', self.a[row]), ('Weight', self.b[row]),
+                                  ('Result', self.sum[row])):
+                lines.append(''.join(f'{label} = {v:<7} | ' for v in values))
+            lines.append('-' * 20 * self.size)
+
+        return '\n'.join(lines) + '\n'
+
+
+class MmUnit:
+    '''hs_npu_mm_unit: input/weight FIFOs, gatekeepers and the systolic array.'''
+
+    def __init__(self, params=DEFAULT_PARAMS):
+        size = params.SIZE
+        self.params = params
+        self.cycles = 0
+
+        self.input_fifos = FifoBank(size, params.INPUT_FIFO_DEPTH, params.INPUT_DATA_WIDTH)
+        self.weight_fifos = FifoBank(size, params.WEIGHT_FIFO_DEPTH, params.WEIGHT_DATA_WIDTH)
+        self.input_gatekeepers = GatekeeperChain(size)
+        self.output_gatekeepers = GatekeeperChain(size)
+        self.systolic = SystolicArray(size, params)
+
+    def reset(self):
+        for block in (self.input_fifos, self.weight_fifos,
+                      self.input_gatekeepers, self.output_gatekeepers):
+            block.reset()
+
+    @property
+    def output_data(self):
+        return self.output_gatekeepers.output_data(self.systolic.result)
+
+    @property
+    def valid_o(self):
+        return self.output_gatekeepers.active
+
+    def step(self, input_matrix_row=0, input_fifo_valid_i=False, weight_matrix_row=0,
+             weight_fifo_valid_i=False, input_sums=0, enable_weights=False,
+             start_input_gatekeeper=False, start_output_gatekeeper=False,
+             enable_cycles_in=0, flush_input_fifos=False, flush_weight_fifos=False):
+        input_active = self.input_gatekeepers.active
+        input_systolic = self.input_gatekeepers.output_data(self.input_fifos.out)
+        weight_systolic = self.weight_fifos.out
+
+        self.input_fifos.step(input_fifo_valid_i, input_matrix_row, input_active,
+                              flush=flush_input_fifos)
+        self.weight_fifos.step(weight_fifo_valid_i, weight_matrix_row, enable_weights,
+                               flush=flush_weight_fifos)
+        self.input_gatekeepers.step(start_input_gatekeeper, enable_cycles_in)
+        self.output_gatekeepers.step(start_output_gatekeeper, enable_cycles_in)
+        self.systolic.step(input_systolic, weight_systolic, input_sums, enable_weights)
+
+        self.cycles += 1
+
+    def run(self, weight_rows, input_rows, sums=0):
+        '''
+        Run one job with the READY_TO_COMPUTE timing of hs_npu_memory_ordering.
+
+        Rows are given in memory order: weight rows bottom-up and inputs
+        right-aligned across SIZE lanes, as hs_npu_memory_ordering feeds them.
+        Returns the (rows, SIZE) systolic results.
+        '''
+        size = self.params.SIZE
+        rows = len(input_rows)
+
+        for row in weight_rows:
+            self.step(weight_matrix_row=row, weight_fifo_valid_i=True)
+        for row in input_rows:
+            self.step(input_matrix_row=row, input_fifo_valid_i=True)
+
+        # computation_cycles == 0 raises weight_enable, SIZE starts the input
+        # gatekeepers and 2 * SIZE the output ones, each a single cycle later
+        self.step(input_sums=sums)
+        for _ in range(size):
+            self.step(input_sums=sums, enable_weights=len(weight_rows) > 0)
+
+        results = [[] for _ in range(size)]
+        for cycle in range(2 * size + rows):
+            valid = self.valid_o
+            for lane in np.flatnonzero(valid):
+                results[lane].append(self.output_data[lane])
+
+            self.step(input_sums=sums, enable_cycles_in=rows,
+                      start_input_gatekeeper=cycle == 0,
+                      start_output_gatekeeper=cycle == size)
+
+        return np.array(results, dtype=np.int64).T
@@ -0,0 +1,241 @@
+'''
+Layer fusion through REINPUT
+
+A sequential network normally runs layer by layer: every layer writes its
+outputs back to memory and the host saturates them to int8 rows for the
+next one. When consecutive layers each fit a single job per row batch
+(depth and columns within SIZE), their intermediates can stay in the output
+FIFOs instead. Hidden layers run with SAVEOUT cleared and the next layer
+reads them back with REINPUT. Only the last layer of such a chain writes
+to memory.
+
+A fused chain runs the whole chain for one row batch before starting the
+next, so each batch fetches every layer's weights again. That costs less
+than the intermediates' round trip unless batches are tiny. plan() only
+fuses chains that save bytes. Intermediates are not saturated to int8:
+REINPUT feeds the full activation outputs to the next layer, as
+run_network() does.
+
+    python -m hs_npu_model fusion iris.hsnw --rows 256
+'''
+import argparse
+import dataclasses
+import pathlib
+
+import numpy as np
+
+from .compiler import WORD_BYTES, Job, LayerCsrs, Schedule, _align, _check_int8, _tiles, compile_dense
+from .params import DEFAULT_PARAMS
+
+
+@dataclasses.dataclass
+class Stage:
+    '''Consecutive layers compiled into one schedule, fused or a single layer.'''
+    names: list
+    fused: bool = False
+
+    @property
+    def name(self):
+        return '+'.join(self.names)
+
+
+def batch_rows(params=DEFAULT_PARAMS):
+    '''
+    Rows per fused batch. A job holds BUFFER_SIZE rows, but the output FIFOs
+    only read back DEPTH - 1: with all DEPTH written the reread pointer lands
+    on the write pointer and they look empty.
+    '''
+    return min(params.BUFFER_SIZE, params.OUTPUT_FIFO_DEPTH - 1)
+
+
+def fusable(layer, params=DEFAULT_PARAMS):
+    '''Whether a layer runs as one job per row batch.'''
+    depth, columns = np.shape(layer.weights)
+    return depth <= params.SIZE and columns <= params.SIZE
+
+
+def _placeholder(layer, rows):
+    return np.zeros((rows, np.shape(layer.weights)[0]), dtype=np.int64)
+
+
+def compile_chain(inputs, layers, base_address=0, params=DEFAULT_PARAMS):
+    '''
+    Schedule of a chain of DenseLayers run back to back through REINPUT
+
+    The first layer reads inputs from memory like compile_dense. The
+    REINPUT layers take all SIZE output lanes of the job before them and
+    load a full SIZE row weight tile. Their own padding rows are zero, so
+    stale array rows and input lanes do not leak in. Those layers read the
+    same weights and bias every batch, so their operands are laid out once
+    and shared by all batches.
+    '''
+    size = params.SIZE
+    if params.line_bytes != size:
+        raise ValueError('hs_npu_memory_ordering reads one 4 * BURST_SIZE byte line per '
+                         'matrix row, SIZE must equal 4 * BURST_SIZE')
+
+    inputs = _check_int8('inputs', np.atleast_2d(inputs))
+    rows = inputs.shape[0]
+    width = inputs.shape[1]
+    for layer in layers:
+        weights = _check_int8('weights', layer.weights)
+        if weights.shape[0] != width:
+            raise ValueError(f'cannot chain {width} outputs into {weights.shape} weights')
+        if not fusable(layer, params):
+            raise ValueError(f'{weights.shape} weights do not fit a single job, SIZE is {size}')
+        width = weights.shape[1]
+
+    def operands(job, layer, depth):
+        columns = job.csrs.num_weight_columns
+        tile = np.zeros((depth, size), dtype=np.int8)
+        tile[:np.shape(layer.weights)[0], :columns] = layer.weights
+        job.weights = tile[::-1].copy()
+        if layer.bias is not None:
+            job.bias = np.zeros(size, dtype='<i4')
+            job.bias[:columns] = layer.bias
+
+    def csrs(layer, rows, last):
+        depth, columns = np.shape(layer.weights)
+        return LayerCsrs(num_input_rows=rows, num_input_columns=depth, num_weight_rows=depth,
+                         num_weight_columns=columns, save_outputs=last,
+                         use_bias=layer.bias is not None, shift_amount=layer.shift,
+                         activation_select=layer.relu)
+
+    address = _align(base_address, params.line_bytes)
+    shared = []
+    for layer in layers[1:]:
+        job = Job(csrs=csrs(layer, 0, False), rows=slice(0, 0),
+                  depth=slice(0, np.shape(layer.weights)[0]),
+                  columns=slice(0, np.shape(layer.weights)[1]))
+        operands(job, layer, size)
+        shared.append((address, job))
+        address += sum(payload.nbytes for *_, payload in job.segments())
+
+    jobs = []
+    first = layers[0]
+    for n, batch in enumerate(_tiles(rows, batch_rows(params))):
+        count = batch.stop - batch.start
+        job = Job(csrs=csrs(first, count, len(layers) == 1), rows=batch,
+                  depth=slice(0, inputs.shape[1]), columns=slice(0, np.shape(first.weights)[1]))
+        job.csrs.base_address = address
+        operands(job, first, inputs.shape[1])
+        job.inputs = np.zeros((count, size), dtype=np.int8)
+        job.inputs[:, size - inputs.shape[1]:] = inputs[batch]
+        address += sum(payload.nbytes for *_, payload in job.segments())
+        jobs.append(job)
+
+        for index, (base, template) in enumerate(shared):
+            job = dataclasses.replace(template, rows=batch, weights=None, bias=None)
+            job.csrs = dataclasses.replace(template.csrs, num_input_rows=count,
+                                           num_input_columns=size, num_weight_rows=size,
+                                           reuse_inputs=True, base_address=base,
+                                           save_outputs=index == len(shared) - 1)
+            if n == 0:
+                job.weights, job.bias = template.weights, template.bias
+            jobs.append(job)
+
+    output_address = _align(address, params.line_bytes)
+    row_bytes = WORD_BYTES * size
+    for job in jobs:
+        if job.csrs.save_outputs:
+            job.csrs.result_address = output_address + row_bytes * job.rows.start
+
+    return Schedule(jobs=jobs, base_address=base_address,
+                    end_address=output_address + row_bytes * rows, output_address=output_address,
+                    output_shape=(rows, width), params=params)
+
+
+def compile_stage(stage, inputs, layers, base_address=0, params=DEFAULT_PARAMS):
+    '''Schedule of a Stage over the {name: DenseLayer} it was planned from.'''
+    if stage.fused:
+        return compile_chain(inputs, [layers[name] for name in stage.names], base_address, params)
+
+    layer = layers[stage.names[0]]
+    return compile_dense(inputs, layer.weights, layer.bias, shift=layer.shift, relu=layer.relu,
+                         base_address=base_address, params=params)
+
+
+def _traffic(stage, layers, rows, params):
+    first = layers[stage.names[0]]
+    schedule = compile_stage(stage, _placeholder(first, rows), layers, params=params)
+    return schedule.traffic()
+
+
+def _unfused(names):
+    return [Stage([name]) for name in names]
+
+
+def _fuse(names, layers, rows, params):
+    stage = Stage(names, fused=True)
+    if len(names) < 2:
+        return _unfused(names)
+
+    fused = sum(_traffic(stage, layers, rows, params))
+    unfused = sum(sum(_traffic(single, layers, rows, params)) for single in _unfused(names))
+    return [stage] if fused < unfused else _unfused(names)
+
+
+def plan(layers, rows, params=DEFAULT_PARAMS):
+    '''
+    Stages for {name: DenseLayer} run on rows inputs: maximal runs of
+    fusable layers become one fused Stage if that moves fewer AXI bytes,
+    every other layer is a Stage of its own.
+    '''
+    stages = []
+    run = []
+    for name, layer in layers.items():
+        if fusable(layer, params):
+            run.append(name)
+            continue
+
+        stages += _fuse(run, layers, rows, params)
+        stages.append(Stage([name]))
+        run = []
+
+    return stages + _fuse(run, layers, rows, params)
+
+
+def report(stages, layers, rows, params=DEFAULT_PARAMS):
+    '''Per stage AXI bytes fused and layer by layer, and the bytes saved.'''
+    results = []
+    for stage in stages:
+        read, write = _traffic(stage, layers, rows, params)
+        unfused = [_traffic(single, layers, rows, params) for single in _unfused(stage.names)]
+        unfused_read = sum(r for r, _ in unfused)
+        unfused_write = sum(w for _, w in unfused)
+        results.append({
+            'stage': stage.name,
+            'fused': stage.fused,
+            'read_bytes': read,
+            'write_bytes': write,
+            'unfused_read_bytes': unfused_read,
+            'unfused_write_bytes': unfused_write,
+            'saved_bytes': unfused_read + unfused_write - read - write,
+        })
+    return results
+
+
+def main(argv=None):
+    from .importer import load_layers
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('model', type=pathlib.Path, help='weight container or Keras .weights.h5')
+    parser.add_argument('--rows', type=int, default=DEFAULT_PARAMS.BUFFER_SIZE,
+                        help='inferences per run')
+    args = parser.parse_args(argv)
+
+    layers = load_layers(args.model)
+    results = report(plan(layers, args.rows), layers, args.rows)
+
+    header = ['stage', 'fused', 'read', 'write', 'unfused read', 'unfused write', 'saved']
+    rows = [header] + [[r['stage'], 'yes' if r['fused'] else 'no', r['read_bytes'], r['write_bytes'],
+                        r['unfused_read_bytes'], r['unfused_write_bytes'], r['saved_bytes']]
+                       for r in results]
+    widths = [max(len(str(row[i])) for row in rows) for i in range(len(header))]
+    print('\n'.join('  '.join(str(cell).rjust(width) for cell, width in zip(row, widths))
+                    for row in rows))
+    print(f'{sum(r["saved_bytes"] for r in results)} AXI bytes saved for {args.rows} rows')
+
+
+if __name__ == '__main__':
+    main()
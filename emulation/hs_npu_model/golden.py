@@ -0,0 +1,95 @@
+'''
+Golden model of the ScaleNPU datapath
+
+Bit-accurate NumPy reference of what one NPU layer computes: the systolic
+array matrix product plus initial sums, the accumulator bias and the
+activation unit (ReLU, arithmetic right shift and truncation). Every function
+is vectorized over any number of leading batch axes, so thousands of
+reference inferences are a single call.
+
+Shapes follow the testbenches: inputs are (..., rows, K), weights are
+(..., K, N) and per-column vectors (bias, sums) are (..., N).
+'''
+import dataclasses
+
+import numpy as np
+
+from .params import DEFAULT_PARAMS, wrap
+
+
+@dataclasses.dataclass
+class DenseLayer:
+    '''One dense layer as programmed into the NPU CSRs.'''
+    weights: np.ndarray
+    bias: np.ndarray = None
+    shift: int = 0
+    relu: bool = False
+
+
+def _exact_matmul(inputs, weights, params):
+    # Floating point products are exact as long as every partial sum fits in
+    # the 53 bit mantissa, which lets NumPy use BLAS instead of integer loops
+    depth = inputs.shape[-1]
+    product_bits = params.INPUT_DATA_WIDTH + params.WEIGHT_DATA_WIDTH - 2
+    if depth * (1 << product_bits) < (1 << 53):
+        return np.matmul(inputs.astype(np.float64), weights.astype(np.float64)).astype(np.int64)
+
+    return np.matmul(inputs, weights)
+
+
+def _per_job(values):
+    # Scalars or per-batch values broadcast over (rows, columns)
+    return np.asarray(values)[..., None, None]
+
+
+def matmul(inputs, weights, sums=None, params=DEFAULT_PARAMS):
+    '''Systolic array result: inputs @ weights + sums, as OUTPUT_DATA_WIDTH words.'''
+    inputs = wrap(inputs, params.INPUT_DATA_WIDTH)
+    weights = wrap(weights, params.WEIGHT_DATA_WIDTH)
+
+    result = _exact_matmul(inputs, weights, params)
+    if sums is not None:
+        result = result + wrap(sums, params.OUTPUT_DATA_WIDTH)[..., None, :]
+
+    return wrap(result, params.OUTPUT_DATA_WIDTH)
+
+
+def accumulate(values, bias=None, params=DEFAULT_PARAMS):
+    '''hs_npu_accumulator: add the per-column bias.'''
+    if bias is None:
+        return wrap(values, params.OUTPUT_DATA_WIDTH)
+
+    return wrap(np.asarray(values) + wrap(bias, params.OUTPUT_DATA_WIDTH)[..., None, :],
+                params.OUTPUT_DATA_WIDTH)
+
+
+def activate(values, shift=0, relu=False, params=DEFAULT_PARAMS):
+    '''hs_npu_activation: optional ReLU, arithmetic shift, truncation.'''
+    values = wrap(values, params.OUTPUT_DATA_WIDTH)
+    values = np.where(_per_job(relu).astype(bool), np.maximum(values, 0), values)
+
+    # '>>>' by the full width or more only replicates the sign bit
+    shift = np.minimum(_per_job(shift), params.OUTPUT_DATA_WIDTH - 1)
+    return wrap(values >> shift, params.ACTIVATION_OUTPUT_WIDTH)
+
+
+def dense(inputs, weights, bias=None, sums=None, shift=0, relu=False, params=DEFAULT_PARAMS):
+    '''One NPU layer, as read back from the output FIFOs.'''
+    result = matmul(inputs, weights, sums, params)
+    result = accumulate(result, bias, params)
+    return activate(result, shift, relu, params)
+
+
+def run_network(inputs, layers, params=DEFAULT_PARAMS, intermediates=False):
+    '''
+    Chain dense layers the way REINPUT does: each layer's activation output
+    is fed back as the next layer's input. Returns the last output, or every
+    layer output if intermediates is set.
+    '''
+    outputs = []
+    for layer in layers:
+        inputs = dense(inputs, layer.weights, layer.bias,
+                       shift=layer.shift, relu=layer.relu, params=params)
+        outputs.append(inputs)
+
+    return outputs if intermediates else inputs
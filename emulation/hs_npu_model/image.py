@@ -0,0 +1,144 @@
+'''
+Memory image builder
+
+Lays out the DDR image the NPU reads (int8 weight and input rows, int32
+little-endian bias, sum and result words) in one preallocated buffer. The
+layout is a NumPy structured dtype with one field per region, so filling the
+image is one vectorized assignment per region and every region can be read
+back later as a typed, zero-copy view.
+'''
+import bisect
+import mmap
+
+import numpy as np
+
+from .params import DEFAULT_PARAMS
+
+INT8 = np.dtype('i1')
+WORD = np.dtype('<i4')
+
+
+class MemoryImage:
+    '''
+    Collects named regions, then builds the image with build()
+
+    Regions are placed one after the other unless an explicit address is
+    given, and start on a multiple of alignment (a memory line by default).
+    '''
+
+    def __init__(self, alignment=None, params=DEFAULT_PARAMS):
+        self.params = params
+        self.alignment = alignment or params.line_bytes
+        self.size = 0
+        self._regions = {}
+        self._extents = []
+
+    def _add(self, name, dtype, shape, data=None, at=None):
+        if name in self._regions:
+            raise ValueError(f'region {name!r} already defined')
+
+        dtype = np.dtype(dtype)
+        shape = tuple(shape)
+        nbytes = dtype.itemsize * int(np.prod(shape, dtype=np.int64))
+
+        if at is None:
+            at = -(-self.size // self.alignment) * self.alignment
+        extent = (at, at + nbytes, name)
+        index = bisect.bisect(self._extents, extent)
+        for start, end, other in self._extents[max(index - 1, 0):index + 1]:
+            if at < end and start < at + nbytes:
+                raise ValueError(f'region {name!r} overlaps {other!r}')
+
+        self._extents.insert(index, extent)
+        self._regions[name] = (at, dtype, shape, data)
+        self.size = max(self.size, at + nbytes)
+        return at
+
+    def weights(self, name, values, at=None):
+        '''int8 weight rows, already in memory order.'''
+        values = np.atleast_2d(values)
+        return self._add(name, INT8, values.shape, values, at)
+
+    def inputs(self, name, values, at=None):
+        '''int8 input rows, already aligned to the systolic lanes.'''
+        values = np.atleast_2d(values)
+        return self._add(name, INT8, values.shape, values, at)
+
+    def words(self, name, values, at=None):
+        '''int32 words, for bias and sums vectors.'''
+        values = np.atleast_1d(values)
+        return self._add(name, WORD, values.shape, values, at)
+
+    def reserve(self, name, shape, dtype=WORD, at=None):
+        '''Zero-filled region the NPU writes, results by default.'''
+        return self._add(name, dtype, np.atleast_1d(shape), None, at)
+
+    def schedule(self, name, schedule):
+        '''Regions of a compiled layer at the addresses it was compiled for.'''
+        for index, job in enumerate(schedule.jobs):
+            for address, kind, payload in job.segments():
+                self._add(f'{name}.{index}.{kind}', payload.dtype, payload.shape, payload, address)
+
+        rows, columns = schedule.output_shape
+        tiles = -(-columns // schedule.params.SIZE)
+        return self.reserve(f'{name}.output', (tiles, rows, schedule.params.SIZE),
+                            at=schedule.output_address)
+
+    @property
+    def layout(self):
+        '''Structured dtype describing the whole image.'''
+        names = list(self._regions)
+        return np.dtype({
+            'names': names,
+            'formats': [(self._regions[n][1], self._regions[n][2]) for n in names],
+            'offsets': [self._regions[n][0] for n in names],
+            'itemsize': max(self.size, 1),
+        })
+
+    def build(self, buffer=None):
+        '''Fill a new (or the given, zeroed) buffer and return its Image.'''
+        layout = self.layout
+        if buffer is None:
+            buffer = bytearray(layout.itemsize)
+
+        image = Image(buffer, layout)
+        record = image.record
+        for name, (_, _, _, data) in self._regions.items():
+            if data is not None:
+                record[name] = data
+
+        return image
+
+    def build_file(self, path):
+        '''Build into a file and return the image over a shared mapping of it.'''
+        with open(path, 'w+b') as f:
+            f.truncate(self.layout.itemsize)
+            buffer = mmap.mmap(f.fileno(), 0)
+
+        return self.build(buffer)
+
+
+class Image:
+    '''A built memory image: the raw buffer plus typed views of its regions.'''
+
+    def __init__(self, buffer, layout):
+        self.buffer = buffer
+        self.layout = layout
+        self.record = np.frombuffer(buffer, dtype=layout, count=1)[0]
+
+    def __getitem__(self, name):
+        return self.record[name]
+
+    @property
+    def symbols(self):
+        '''Region name to byte offset.'''
+        return {name: offset for name, (_, offset) in self.layout.fields.items()}
+
+    @property
+    def memory(self):
+        '''Writable memoryview, as taken by AXI4Agent.'''
+        return memoryview(self.buffer)
+
+    def words(self, address, count):
+        '''int32 words at an arbitrary address, as a zero-copy view.'''
+        return np.frombuffer(self.buffer, dtype=WORD, count=count, offset=address)
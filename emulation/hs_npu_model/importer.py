@@ -0,0 +1,207 @@
+'''
+Keras weight importer
+
+Reads the dense layers of a Keras .weights.h5 file and turns them into NPU
+layers: int8 weights, int32 bias and a per-layer SHIFT_AMT that keeps each
+layer's output inside the range the next one can take.
+
+Float weights are quantized symmetrically per tensor and the bias is scaled
+to the accumulator (input scale times weight scale). Layers that are
+already integer valued, as in model_scaled.weights.h5, are taken as they are.
+Shift amounts come from calibration inputs when given and from the worst
+case int8 input otherwise.
+
+    python -m hs_npu_model importer model/model_scaled.weights.h5 -o iris.pack
+'''
+import argparse
+import dataclasses
+import json
+import pathlib
+import re
+
+import numpy as np
+
+from .compiler import compile_dense
+from .container import ContainerReader, write_container
+from .golden import DenseLayer, accumulate, matmul, dense
+from .image import MemoryImage
+from .params import DEFAULT_PARAMS
+
+INT8_MAX = 127
+
+
+def _layer_order(name):
+    # dense, dense_1, ..., dense_10: Keras numbers layers in creation order
+    match = re.fullmatch(r'(.*?)(?:_(\d+))?', name)
+    return int(match.group(2) or 0), name
+
+
+def read_h5(path):
+    '''{layer name: (kernel, bias)} as float arrays, in model order.'''
+    import h5py
+
+    layers = {}
+    with h5py.File(path, 'r') as f:
+        if 'layer_names' in f.attrs:
+            # Keras 2 HDF5 weights: model_weights/<layer>/<layer>/kernel:0
+            root = f['model_weights'] if 'model_weights' in f else f
+            for name in (n.decode() if isinstance(n, bytes) else n for n in f.attrs['layer_names']):
+                group = root[name]
+                names = [n.decode() if isinstance(n, bytes) else n for n in group.attrs['weight_names']]
+                values = [np.array(group[n]) for n in names]
+                if values:
+                    layers[name] = (values[0], values[1] if len(values) > 1 else None)
+        else:
+            # Keras 3 .weights.h5: layers/<layer>/vars/<index>
+            for name in sorted(f['layers'], key=_layer_order):
+                variables = f['layers'][name].get('vars', {})
+                values = [np.array(variables[str(i)]) for i in range(len(variables))]
+                if values:
+                    layers[name] = (values[0], values[1] if len(values) > 1 else None)
+
+    return layers
+
+
+def _is_int8(values):
+    return np.array_equal(values, np.round(values)) and \
+        values.min() >= -INT8_MAX - 1 and values.max() <= INT8_MAX
+
+
+def choose_shift(accumulated, limit, relu=False):
+    '''Smallest arithmetic shift bringing every accumulated value within +-limit.'''
+    high = int(np.max(accumulated, initial=0))
+    low = 0 if relu else int(np.min(accumulated, initial=0))
+
+    shift = 0
+    while (high >> shift) > limit or (low >> shift) < -limit - 1:
+        shift += 1
+    return shift
+
+
+def quantize(layers, calibration=None, relu=None, input_scale=1.0, params=DEFAULT_PARAMS):
+    '''
+    {name: DenseLayer} from {name: (kernel, bias)} float layers.
+
+    calibration is a (samples, inputs) int8 array fed through the quantized
+    layers to size each shift. relu lists which layers end in a ReLU, by
+    default all but the last. Hidden layers are shifted to int8 outputs, the
+    last one to ACTIVATION_OUTPUT_WIDTH.
+    '''
+    if relu is None:
+        relu = [True] * (len(layers) - 1) + [False]
+
+    scale = input_scale
+    inputs = None if calibration is None else np.asarray(calibration, dtype=np.int64)
+    quantized = {}
+    for index, (name, (kernel, bias)) in enumerate(layers.items()):
+        kernel = np.asarray(kernel, dtype=np.float64)
+        bias = None if bias is None else np.asarray(bias, dtype=np.float64)
+        if _is_int8(kernel) and (bias is None or np.array_equal(bias, np.round(bias))):
+            # Already quantized, the bias is added to the accumulator as is
+            weights = kernel.astype(np.int64)
+            bias = None if bias is None else bias.astype(np.int64)
+        else:
+            kernel_scale = np.abs(kernel).max() / INT8_MAX or 1.0
+            weights = np.clip(np.round(kernel / kernel_scale), -INT8_MAX - 1, INT8_MAX).astype(np.int64)
+            scale *= kernel_scale
+            if bias is not None:
+                bias = np.round(bias / scale).astype(np.int64)
+
+        if inputs is None:
+            # Worst case int8 input: every product at its largest magnitude
+            reach = (INT8_MAX + 1) * np.abs(weights).sum(axis=0)
+            accumulated = np.stack([-reach, reach]) + (bias if bias is not None else 0)
+        else:
+            accumulated = accumulate(matmul(inputs, weights, params=params), bias, params)
+
+        last = index == len(layers) - 1
+        limit = (1 << (params.ACTIVATION_OUTPUT_WIDTH - 1)) - 1 if last else INT8_MAX
+        shift = choose_shift(accumulated, limit, relu[index])
+
+        quantized[name] = DenseLayer(weights, bias, shift=shift, relu=relu[index])
+        scale *= 1 << shift
+        if inputs is not None:
+            inputs = dense(inputs, weights, bias, shift=shift, relu=relu[index], params=params)
+
+    return quantized
+
+
+def import_h5(path, calibration=None, relu=None, input_scale=1.0, params=DEFAULT_PARAMS):
+    return quantize(read_h5(path), calibration, relu, input_scale, params)
+
+
+def pack(layers, rows, base_address=0, params=DEFAULT_PARAMS):
+    '''
+    Memory image and CSR schedule for running layers over rows inputs
+
+    Layers are compiled back to back from base_address. Input regions are
+    left zeroed: the host fills the first layer's and copies each layer's
+    saturated output into the next one's.
+    '''
+    image = MemoryImage(params=params)
+    schedule = []
+    address = base_address
+    for name, layer in layers.items():
+        placeholder = np.zeros((rows, layer.weights.shape[0]), dtype=np.int64)
+        compiled = compile_dense(placeholder, layer.weights, layer.bias, shift=layer.shift,
+                                 relu=layer.relu, base_address=address, params=params)
+        image.schedule(name, compiled)
+        address = compiled.end_address
+
+        schedule.append({
+            'layer': name,
+            'shift': layer.shift,
+            'relu': layer.relu,
+            'output_address': compiled.output_address,
+            'output_shape': list(compiled.output_shape),
+            'jobs': [dataclasses.asdict(job.csrs) for job in compiled.jobs],
+        })
+
+    return image, schedule
+
+
+def load_layers(path):
+    '''{name: DenseLayer} from a weight container or a Keras .weights.h5 file.'''
+    if path.suffix == '.h5':
+        return import_h5(path)
+    with ContainerReader(path) as container:
+        return {name: dataclasses.replace(layer, weights=np.array(layer.weights),
+                                          bias=None if layer.bias is None else np.array(layer.bias))
+                for name, layer in container.items()}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('weights', type=pathlib.Path, help='Keras .weights.h5 file')
+    parser.add_argument('-o', '--output', type=pathlib.Path, required=True,
+                        help='memory image to write, the CSR schedule goes next to it as .json')
+    parser.add_argument('--rows', type=int, default=DEFAULT_PARAMS.BUFFER_SIZE,
+                        help='inferences per run')
+    parser.add_argument('--container', type=pathlib.Path,
+                        help='also write the quantized layers as a weight container')
+    parser.add_argument('--calibration', type=pathlib.Path,
+                        help='CSV of int8 input vectors used to size the shifts')
+    args = parser.parse_args(argv)
+
+    calibration = None
+    if args.calibration:
+        calibration = np.loadtxt(args.calibration, delimiter=',', ndmin=2, dtype=np.int64)
+
+    layers = import_h5(args.weights, calibration)
+    if args.container:
+        write_container(args.container, layers)
+
+    image, schedule = pack(layers, args.rows)
+    built = image.build_file(args.output)
+    built.buffer.flush()
+
+    with open(args.output.with_suffix('.json'), 'w') as f:
+        json.dump({'symbols': built.symbols, 'layers': schedule}, f, indent=2)
+
+    for name, layer in layers.items():
+        print(f'{name}: {layer.weights.shape[0]}x{layer.weights.shape[1]} '
+              f'shift {layer.shift}{" relu" if layer.relu else ""}')
+
+
+if __name__ == '__main__':
+    main()
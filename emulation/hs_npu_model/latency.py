@@ -0,0 +1,244 @@
+'''
+Analytic latency model of NPU jobs
+
+Predicts the cycles of one job from its CSRs and the elaboration parameters,
+split as LayerProfiler splits a measured job: fetch (LOADING_WEIGHTS through
+LOADING_SUMS), compute (READY_TO_COMPUTE: weight shift-in, systolic fill and
+drain), writeback (SAVING) and the IDLE cycles between INIT and the irq.
+The state machine's structure gives the shape of each term, Timing holds the
+constants that depend on the memory system and are fitted from simulation.
+
+    python -m hs_npu_model latency calibrate sim_build/*/latency_samples.json --json timing.json
+    python -m hs_npu_model latency predict 32x32x16 --timing timing.json
+'''
+import argparse
+import dataclasses
+import json
+import pathlib
+
+import numpy as np
+
+from .compiler import LayerCsrs, count_jobs
+from .params import DEFAULT_PARAMS, NpuParams
+
+
+@dataclasses.dataclass(frozen=True)
+class Timing:
+    '''
+    Memory system dependent constants, in cycles
+
+    read_burst is one line read through hs_npu_memory_interface and the AXI
+    slave, write_burst one line written. reinput_row is an input row taken
+    from the output FIFOs. The overheads are the fixed cycles of each phase:
+    one per loading state, the READY_TO_COMPUTE exit, the last SAVING
+    capture and the INIT and irq handshakes around the state machine.
+    '''
+    read_burst: float = 5
+    reinput_row: float = 1
+    fetch_overhead: float = 4
+    compute_overhead: float = 1
+    write_burst: float = 4
+    writeback_row: float = 1
+    writeback_overhead: float = 1
+    overhead: float = 4
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            return cls(**json.load(f))
+
+    def save(self, path):
+        with open(path, 'w') as f:
+            json.dump(dataclasses.asdict(self), f, indent=2)
+
+
+@dataclasses.dataclass
+class Latency:
+    '''Predicted cycles of one or more jobs, by phase.'''
+    fetch: float = 0
+    compute: float = 0
+    writeback: float = 0
+    overhead: float = 0
+
+    @property
+    def total(self):
+        return self.fetch + self.compute + self.writeback + self.overhead
+
+    def __add__(self, other):
+        return Latency(*(a + b for a, b in zip(dataclasses.astuple(self), dataclasses.astuple(other))))
+
+
+def features(csrs, params=DEFAULT_PARAMS):
+    '''
+    Per phase, the counts Timing constants multiply and the cycles that are
+    fixed by the RTL alone: {phase: ({constant: count}, fixed)}.
+    '''
+    size = params.SIZE
+    rows = csrs.num_input_rows
+    read, write = csrs.traffic(params)
+    saved_rows = rows if csrs.save_outputs else 0
+
+    return {
+        'fetch': ({'read_burst': read // params.line_bytes,
+                   'reinput_row': rows if csrs.reuse_inputs else 0,
+                   'fetch_overhead': 1}, 0),
+        'compute': ({'compute_overhead': 1}, 3 * size + rows),
+        'writeback': ({'write_burst': write // params.line_bytes,
+                       'writeback_row': saved_rows,
+                       'writeback_overhead': 1}, 0),
+        'overhead': ({'overhead': 1}, 0),
+    }
+
+
+def predict(csrs, params=DEFAULT_PARAMS, timing=Timing()):
+    '''Latency of one job. Jobs the executive rejects only cost the overhead.'''
+    if csrs.num_input_rows > params.BUFFER_SIZE:
+        return Latency(overhead=timing.overhead)
+
+    phases = {}
+    for phase, (counts, fixed) in features(csrs, params).items():
+        phases[phase] = fixed + sum(getattr(timing, name) * count for name, count in counts.items())
+    return Latency(**phases)
+
+
+def predict_jobs(jobs, params=DEFAULT_PARAMS, timing=Timing()):
+    '''Summed Latency of LayerCsrs, or Jobs as in Schedule.jobs.'''
+    total = Latency()
+    for job in jobs:
+        total += predict(getattr(job, 'csrs', job), params, timing)
+    return total
+
+
+def predict_dense(rows, depth, columns, bias=True, params=DEFAULT_PARAMS, timing=Timing()):
+    '''
+    Latency of a rows x depth @ depth x columns layer as compile_dense tiles
+    it, from the count of each distinct job rather than the schedule itself.
+    '''
+    total = Latency()
+    for csrs, count in count_jobs(rows, depth, columns, bias, params):
+        latency = predict(csrs, params, timing)
+        total += Latency(*(count * value for value in dataclasses.astuple(latency)))
+    return total
+
+
+def load_samples(paths):
+    '''(params, LayerCsrs, measured phases) per job of the tb's latency_samples.json files.'''
+    samples = []
+    for path in paths:
+        with open(path) as f:
+            run = json.load(f)
+        params = NpuParams(**run['params'])
+        for job in run['jobs']:
+            if job['cycles'] is not None:
+                samples.append((params, LayerCsrs(**job['csrs']), job['phases']))
+    return samples
+
+
+def _measured(phases):
+    return {
+        'fetch': phases['weight_load'] + phases['input_load'] + phases['vector_load'],
+        'compute': phases['compute'],
+        'writeback': phases['writeback'],
+        'overhead': phases['idle'],
+    }
+
+
+def calibrate(samples):
+    '''Least squares Timing for samples as returned by load_samples.'''
+    fitted = {}
+    for phase in ('fetch', 'compute', 'writeback', 'overhead'):
+        names = None
+        matrix, target = [], []
+        for params, csrs, phases in samples:
+            if csrs.num_input_rows > params.BUFFER_SIZE:
+                continue
+            counts, fixed = features(csrs, params)[phase]
+            names = list(counts)
+            matrix.append([counts[name] for name in names])
+            target.append(_measured(phases)[phase] - fixed)
+
+        if names is None:
+            continue
+        # Counts that never vary are not identifiable, lstsq keeps them small
+        solution, *_ = np.linalg.lstsq(np.array(matrix, dtype=np.float64),
+                                       np.array(target, dtype=np.float64), rcond=None)
+        fitted.update(zip(names, solution.tolist()))
+
+    return Timing(**fitted)
+
+
+def errors(samples, timing):
+    '''Per phase and in total: (mean absolute cycles, mean and worst relative error).'''
+    predicted, measured = [], []
+    for params, csrs, phases in samples:
+        latency = predict(csrs, params, timing)
+        measured_phases = _measured(phases)
+        predicted.append([*dataclasses.astuple(latency), latency.total])
+        measured.append([*measured_phases.values(), sum(measured_phases.values())])
+
+    predicted = np.array(predicted)
+    measured = np.array(measured)
+    absolute = np.abs(predicted - measured)
+    relative = absolute / np.maximum(measured, 1)
+
+    report = {}
+    for n, phase in enumerate(['fetch', 'compute', 'writeback', 'overhead', 'total']):
+        report[phase] = (absolute[:, n].mean(), relative[:, n].mean(), relative[:, n].max())
+    return report
+
+
+def _table(rows):
+    widths = [max(len(str(row[i])) for row in rows) for i in range(len(rows[0]))]
+    return '\n'.join('  '.join(str(cell).rjust(width) for cell, width in zip(row, widths))
+                     for row in rows)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    fit = commands.add_parser('calibrate', help='fit Timing to measured jobs and report the error')
+    fit.add_argument('samples', type=pathlib.Path, nargs='+', help='latency_samples.json files')
+    fit.add_argument('--json', type=pathlib.Path, help='write the fitted Timing here')
+
+    layer = commands.add_parser('predict', help='predict layers as compile_dense schedules them')
+    layer.add_argument('layers', nargs='+', help='ROWSxDEPTHxCOLUMNS')
+    layer.add_argument('--timing', type=pathlib.Path, help='Timing JSON from calibrate')
+    layer.add_argument('--param', action='append', default=[], metavar='NAME=VALUE',
+                       help='elaboration parameter over the RTL defaults')
+    layer.add_argument('--no-bias', action='store_true')
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'calibrate':
+        samples = load_samples(args.samples)
+        before = errors(samples, Timing())
+        timing = calibrate(samples)
+        after = errors(samples, timing)
+
+        print(f'{len(samples)} jobs')
+        print(_table([['constant', 'value'],
+                      *([name, f'{value:.3f}'] for name, value in dataclasses.asdict(timing).items())]))
+        print()
+        print(_table([['phase', 'mean |err|', 'mean rel', 'max rel', 'default mean rel'],
+                      *([phase, f'{a:.2f}', f'{m:.2%}', f'{w:.2%}', f'{before[phase][1]:.2%}']
+                        for phase, (a, m, w) in after.items())]))
+        if args.json:
+            timing.save(args.json)
+        return
+
+    overrides = dict(item.split('=') for item in args.param)
+    params = NpuParams.from_rtl(**{name: int(value, 0) for name, value in overrides.items()})
+    timing = Timing.load(args.timing) if args.timing else Timing()
+
+    rows = [['layer', 'fetch', 'compute', 'writeback', 'overhead', 'total']]
+    for shape in args.layers:
+        latency = predict_dense(*(int(x) for x in shape.split('x')), bias=not args.no_bias,
+                                params=params, timing=timing)
+        rows.append([shape, *(f'{value:.0f}' for value in dataclasses.astuple(latency)),
+                     f'{latency.total:.0f}'])
+    print(_table(rows))
+
+
+if __name__ == '__main__':
+    main()
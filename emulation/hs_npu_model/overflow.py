@@ -0,0 +1,179 @@
+'''
+Overflow and saturation analyzer
+
+Streams calibration inputs through a network with the golden model and
+records, per layer, the exact accumulator range against OUTPUT_DATA_WIDTH
+and the activation output range against ACTIVATION_OUTPUT_WIDTH and, for
+hidden layers, the int8 the next layer reads. From the accumulator range it
+recommends the smallest SHIFT_AMT that fits, which keeps the most precision.
+
+Layers deeper than SIZE run as chained depth tiles whose partial sums pass
+unshifted through the activation output (see compiler). Their range is
+reported too, no shift helps there: compile_dense refuses such layers when
+a partial sum does not fit ACTIVATION_OUTPUT_WIDTH.
+
+Layers are analyzed in order, each on the previous one's int8 outputs under
+the recommended shifts (or the configured ones with propagate='current'),
+so every recommendation holds for the shifts chosen before it.
+
+    python -m hs_npu_model overflow iris.hsnw calibration.csv
+'''
+import argparse
+import dataclasses
+import json
+import pathlib
+
+import numpy as np
+
+from .golden import activate
+from .importer import INT8_MAX, choose_shift, load_layers
+from .params import DEFAULT_PARAMS
+
+
+@dataclasses.dataclass
+class LayerRange:
+    '''Ranges seen by one layer over the whole calibration set.'''
+    name: str
+    shift: int
+    relu: bool
+    limit: int
+    samples: int = 0
+    accumulator_min: int = 0
+    accumulator_max: int = 0
+    accumulator_overflows: int = 0
+    output_min: int = 0
+    output_max: int = 0
+    output_overflows: int = 0
+    partial_min: int = None
+    partial_max: int = None
+    partial_overflows: int = 0
+    recommended_shift: int = None
+
+    def update(self, accumulated, outputs, params):
+        accumulator_half = 1 << (params.OUTPUT_DATA_WIDTH - 1)
+        self.samples += len(accumulated)
+        self.accumulator_min = min(self.accumulator_min, int(accumulated.min(initial=0)))
+        self.accumulator_max = max(self.accumulator_max, int(accumulated.max(initial=0)))
+        self.accumulator_overflows += int(np.count_nonzero(
+            (accumulated < -accumulator_half) | (accumulated >= accumulator_half)))
+
+        self.output_min = min(self.output_min, int(outputs.min(initial=0)))
+        self.output_max = max(self.output_max, int(outputs.max(initial=0)))
+        self.output_overflows += int(np.count_nonzero((outputs < -self.limit - 1) | (outputs > self.limit)))
+
+    def update_partial(self, partial, params):
+        '''Record the sums a chained layer passes between depth tiles.'''
+        half = 1 << (params.ACTIVATION_OUTPUT_WIDTH - 1)
+        self.partial_min = min(self.partial_min or 0, int(partial.min(initial=0)))
+        self.partial_max = max(self.partial_max or 0, int(partial.max(initial=0)))
+        self.partial_overflows += int(np.count_nonzero((partial < -half) | (partial >= half)))
+
+    @property
+    def headroom_bits(self):
+        '''Unused bits above the largest shifted magnitude at the recommended shift.'''
+        if self.recommended_shift is None:
+            return None
+        low = 0 if self.relu else -self.accumulator_min - 1
+        peak = max(self.accumulator_max, low, 0) >> self.recommended_shift
+        return self.limit.bit_length() - peak.bit_length()
+
+
+def _chunks(inputs, batch):
+    if isinstance(inputs, np.ndarray):
+        inputs = [inputs[start:start + batch] for start in range(0, len(inputs), batch)]
+
+    chunks = []
+    for chunk in inputs:
+        chunk = np.atleast_2d(np.asarray(chunk))
+        if chunk.size and (chunk.min() < -INT8_MAX - 1 or chunk.max() > INT8_MAX):
+            raise ValueError('calibration inputs must be int8 values')
+        chunks.append(chunk.astype(np.int8))
+    return chunks
+
+
+def analyze(layers, calibration, batch=4096, propagate='recommended', params=DEFAULT_PARAMS):
+    '''
+    [LayerRange] for {name: DenseLayer} layers over calibration
+
+    calibration is an int8 (samples, inputs) array or an iterable of such
+    chunks, values outside int8 raise ValueError. Outputs are measured at
+    each layer's configured shift, the recommendation assumes the host
+    saturates hidden outputs to int8 as the tb does. propagate picks which
+    shift feeds the next layer.
+    '''
+    if propagate not in ('recommended', 'current'):
+        raise ValueError(f'propagate must be recommended or current, not {propagate!r}')
+
+    activation_limit = (1 << (params.ACTIVATION_OUTPUT_WIDTH - 1)) - 1
+    # Outputs before the activation unit truncates them, to count the wraps
+    wide = dataclasses.replace(params, ACTIVATION_OUTPUT_WIDTH=params.OUTPUT_DATA_WIDTH)
+    chunks = _chunks(calibration, batch)
+    ranges = []
+    for index, (name, layer) in enumerate(layers.items()):
+        last = index == len(layers) - 1
+        weights = np.asarray(layer.weights, dtype=np.int64)
+        bias = 0 if layer.bias is None else np.asarray(layer.bias, dtype=np.int64)
+
+        stats = LayerRange(name, layer.shift, layer.relu, activation_limit if last else INT8_MAX)
+        for chunk in chunks:
+            # Exact sums, the datapath wraps them to OUTPUT_DATA_WIDTH
+            values = chunk.astype(np.int64) @ weights + bias
+            stats.update(values, activate(values, layer.shift, layer.relu, wide), params)
+            for stop in range(params.SIZE, weights.shape[0], params.SIZE):
+                stats.update_partial(chunk[:, :stop].astype(np.int64) @ weights[:stop] + bias, params)
+
+        stats.recommended_shift = choose_shift(
+            np.array([stats.accumulator_min, stats.accumulator_max]), stats.limit, layer.relu)
+        ranges.append(stats)
+
+        # Second pass for the next layer's inputs, only int8 chunks are kept
+        shift = stats.recommended_shift if propagate == 'recommended' else layer.shift
+        chunks = [np.clip(activate(chunk.astype(np.int64) @ weights + bias, shift, layer.relu, params),
+                          -INT8_MAX - 1, INT8_MAX).astype(np.int8) for chunk in chunks]
+
+    return ranges
+
+
+def table(ranges, params=DEFAULT_PARAMS):
+    '''Per-layer report as text.'''
+    header = ['layer', 'accumulator', f'>{params.OUTPUT_DATA_WIDTH}b', 'shift', 'output',
+              'overflows', 'recommended', 'headroom', 'partial sums',
+              f'>{params.ACTIVATION_OUTPUT_WIDTH}b']
+    rows = [header]
+    for r in ranges:
+        chained = r.partial_min is not None
+        rows.append([r.name, f'[{r.accumulator_min}, {r.accumulator_max}]', r.accumulator_overflows,
+                     r.shift, f'[{r.output_min}, {r.output_max}]/{r.limit}', r.output_overflows,
+                     r.recommended_shift, r.headroom_bits,
+                     f'[{r.partial_min}, {r.partial_max}]' if chained else '-',
+                     r.partial_overflows if chained else '-'])
+
+    widths = [max(len(str(row[i])) for row in rows) for i in range(len(header))]
+    return '\n'.join('  '.join(str(cell).rjust(width) for cell, width in zip(row, widths))
+                     for row in rows)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('model', type=pathlib.Path, help='weight container or Keras .weights.h5')
+    parser.add_argument('calibration', type=pathlib.Path, help='CSV of int8 input vectors')
+    parser.add_argument('--batch', type=int, default=4096, help='samples per golden model call')
+    parser.add_argument('--propagate', choices=['recommended', 'current'], default='recommended')
+    parser.add_argument('--json', type=pathlib.Path, help='also write the ranges as JSON')
+    args = parser.parse_args(argv)
+
+    calibration = np.loadtxt(args.calibration, delimiter=',', ndmin=2, dtype=np.int64)
+    try:
+        ranges = analyze(load_layers(args.model), calibration, args.batch, args.propagate)
+    except ValueError as error:
+        parser.error(f'{args.calibration}: {error}')
+    print(table(ranges))
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump([dict(dataclasses.asdict(r), headroom_bits=r.headroom_bits) for r in ranges],
+                      f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
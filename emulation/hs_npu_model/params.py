@@ -0,0 +1,83 @@
+import dataclasses
+import pathlib
+import re
+
+import numpy as np
+
+# Default location of the RTL top, used to pick up the elaborated defaults
+RTL_TOP = pathlib.Path(__file__).resolve().parents[2] / 'rtl' / 'hs_npu' / 'hs_npu_top.sv'
+
+_PARAMETER = re.compile(r'parameter\s+int\s+(\w+)\s*=\s*(\w+)')
+
+
+@dataclasses.dataclass(frozen=True)
+class NpuParams:
+    '''
+    Elaboration parameters of hs_npu_top
+
+    Defaults mirror the RTL. Parameters that default to another parameter in
+    hs_npu_top.sv (ACTIVATION_OUTPUT_WIDTH and the FIFO depths) are resolved
+    at construction time when left as None. As in the RTL, WEIGHT_FIFO_DEPTH
+    has to be raised along with SIZE, the weight FIFOs hold a whole tile.
+    '''
+    SIZE: int = 8
+    INPUT_DATA_WIDTH: int = 16
+    WEIGHT_DATA_WIDTH: int = 16
+    OUTPUT_DATA_WIDTH: int = 32
+    ACTIVATION_OUTPUT_WIDTH: int = None
+    BUFFER_SIZE: int = 16
+    INPUT_FIFO_DEPTH: int = None
+    OUTPUT_FIFO_DEPTH: int = None
+    WEIGHT_FIFO_DEPTH: int = 8
+    BURST_SIZE: int = 2
+    BURST_LEN: int = 1
+
+    def __post_init__(self):
+        derived = {
+            'ACTIVATION_OUTPUT_WIDTH': self.INPUT_DATA_WIDTH,
+            'INPUT_FIFO_DEPTH': self.BUFFER_SIZE,
+            'OUTPUT_FIFO_DEPTH': self.BUFFER_SIZE,
+        }
+        for name, value in derived.items():
+            if getattr(self, name) is None:
+                object.__setattr__(self, name, value)
+
+    @classmethod
+    def from_rtl(cls, path=RTL_TOP, **overrides):
+        '''Read parameter defaults from an RTL source, then apply overrides.'''
+        values = dict(_PARAMETER.findall(pathlib.Path(path).read_text()))
+        values.update(overrides)
+
+        # Defaults may refer to other parameters, resolve after overriding
+        def resolve(value):
+            if isinstance(value, int):
+                return value
+            return int(value, 0) if value[0].isdigit() else resolve(values[value])
+
+        return cls(**{name: resolve(value) for name, value in values.items()
+                      if name in cls.__dataclass_fields__})
+
+    @property
+    def line_bytes(self):
+        '''Bytes moved by each memory request of hs_npu_memory_ordering.'''
+        return 4 * self.BURST_SIZE
+
+    @property
+    def beat_bytes(self):
+        '''Bytes per AXI beat (AxSIZE = BURST_SIZE).'''
+        return 1 << self.BURST_SIZE
+
+    @property
+    def beats(self):
+        '''AXI beats per burst (AxLEN = BURST_LEN).'''
+        return self.BURST_LEN + 1
+
+
+DEFAULT_PARAMS = NpuParams()
+
+
+def wrap(values, bits):
+    '''Two's complement wrap-around of integer values to a signed bit width.'''
+    values = np.asarray(values, dtype=np.int64)
+    half = 1 << (bits - 1)
+    return ((values + half) & ((1 << bits) - 1)) - half
@@ -0,0 +1,174 @@
+'''
+Liveness-based memory planner
+
+Assigns addresses to every buffer of a network compiled stage by stage (see
+fusion.plan). Each stage has two buffers. Its operands are the contiguous
+stream compile_dense lays out: weights, inputs, bias and partial sum slots.
+Its output tiles come second. Operands only live while their stage runs.
+Outputs also live through the next stage, since the host reads them while
+it prepares that stage's inputs. Buffers whose lifetimes do not overlap share
+memory, so activations ping-pong between a few addresses instead of growing
+with depth.
+
+Placement is greedy by size: the largest buffers go first, each at the
+lowest address that clears every buffer it is live with. Every buffer starts
+on an AXI burst boundary. Bursts are then always aligned, and an aligned
+burst never crosses a 4 KiB boundary, which AXI forbids. Pass a larger
+alignment, e.g. PAGE_BYTES, to also page-align the regions.
+
+    python -m hs_npu_model planner iris.hsnw --rows 256
+'''
+import argparse
+import dataclasses
+import pathlib
+
+import numpy as np
+
+from .compiler import _align
+from .fusion import Stage, compile_stage, plan
+from .params import DEFAULT_PARAMS
+
+# AXI bursts must not cross this boundary
+PAGE_BYTES = 4096
+
+
+@dataclasses.dataclass
+class Buffer:
+    '''A region live from stage first to stage last, inclusive.'''
+    name: str
+    size: int
+    first: int
+    last: int
+    address: int = None
+
+    @property
+    def end(self):
+        return self.address + self.size
+
+    def overlaps(self, other):
+        return self.first <= other.last and other.first <= self.last
+
+
+def burst_bytes(params=DEFAULT_PARAMS):
+    '''Bytes of one hs_npu_memory_interface burst, or of one memory line if larger.'''
+    return max(params.line_bytes, params.beats * params.beat_bytes)
+
+
+def allocate(buffers, alignment, base_address=0):
+    '''Place buffers (setting their address), returns the footprint in bytes.'''
+    base_address = _align(base_address, alignment)
+    placed = []
+    for buffer in sorted(buffers, key=lambda b: (-b.size, b.first, b.name)):
+        address = base_address
+        for other in sorted((b for b in placed if b.overlaps(buffer)), key=lambda b: b.address):
+            if address + buffer.size <= other.address:
+                break
+            address = max(address, _align(other.end, alignment))
+
+        buffer.address = address
+        placed.append(buffer)
+
+    return max((b.end for b in placed), default=base_address) - base_address
+
+
+def split_bursts(schedule, params=DEFAULT_PARAMS):
+    '''(job index, address) of every burst of a schedule that crosses a 4 KiB page.'''
+    burst = burst_bytes(params)
+    split = []
+    for index, job in enumerate(schedule.jobs):
+        read, write = job.csrs.traffic(params)
+        for start, nbytes in ((job.csrs.base_address, read), (job.csrs.result_address, write)):
+            addresses = start + burst * np.arange(-(-nbytes // burst))
+            crossing = addresses % PAGE_BYTES + burst > PAGE_BYTES
+            split += [(index, int(address)) for address in addresses[crossing]]
+    return split
+
+
+class MemoryPlan:
+    '''
+    Addresses of every stage's operands and outputs
+
+    stages run in order on rows input rows. compile() builds a stage's
+    schedule at its planned addresses once its inputs are known.
+    '''
+
+    def __init__(self, stages, layers, rows, base_address=0, alignment=None, params=DEFAULT_PARAMS):
+        self.stages = stages
+        self.layers = layers
+        self.params = params
+        self.alignment = alignment or burst_bytes(params)
+
+        self.buffers = {}
+        for index, stage in enumerate(stages):
+            depth = np.shape(layers[stage.names[0]].weights)[0]
+            schedule = compile_stage(stage, np.zeros((rows, depth), dtype=np.int64), layers,
+                                     params=params)
+            last = len(stages) - 1
+            for buffer in (
+                Buffer(f'{stage.name}.operands', schedule.output_address, index, index),
+                Buffer(f'{stage.name}.output', schedule.end_address - schedule.output_address,
+                       index, min(index + 1, last)),
+            ):
+                self.buffers[buffer.name] = buffer
+
+        self.base_address = _align(base_address, self.alignment)
+        self.size = allocate(self.buffers.values(), self.alignment, self.base_address)
+
+    @property
+    def end_address(self):
+        return self.base_address + self.size
+
+    @property
+    def unshared_size(self):
+        '''Footprint if every buffer had its own aligned region.'''
+        return sum(_align(buffer.size, self.alignment) for buffer in self.buffers.values())
+
+    def address(self, name):
+        return self.buffers[name].address
+
+    def compile(self, index, inputs):
+        '''Schedule of stage index on inputs, at its planned addresses.'''
+        stage = self.stages[index]
+        schedule = compile_stage(stage, inputs, self.layers,
+                                 base_address=self.address(f'{stage.name}.operands'),
+                                 params=self.params)
+        schedule = schedule.relocate_output(self.address(f'{stage.name}.output'))
+
+        split = split_bursts(schedule, self.params)
+        if split:
+            raise ValueError(f'{stage.name}: {len(split)} bursts cross a 4 KiB boundary')
+        return schedule
+
+    def table(self):
+        rows = [['buffer', 'address', 'size', 'live']]
+        for buffer in sorted(self.buffers.values(), key=lambda b: (b.address, b.first)):
+            rows.append([buffer.name, f'{buffer.address:#x}', buffer.size,
+                         f'{buffer.first}-{buffer.last}'])
+
+        widths = [max(len(str(row[i])) for row in rows) for i in range(len(rows[0]))]
+        return '\n'.join('  '.join(str(cell).rjust(width) for cell, width in zip(row, widths))
+                         for row in rows)
+
+
+def main(argv=None):
+    from .importer import load_layers
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('model', type=pathlib.Path, help='weight container or Keras .weights.h5')
+    parser.add_argument('--rows', type=int, default=DEFAULT_PARAMS.BUFFER_SIZE,
+                        help='inferences per run')
+    parser.add_argument('--base', type=lambda x: int(x, 0), default=0, help='first address')
+    parser.add_argument('--alignment', type=int, help='region alignment, a burst by default')
+    parser.add_argument('--no-fuse', action='store_true', help='one stage per layer')
+    args = parser.parse_args(argv)
+
+    layers = load_layers(args.model)
+    stages = [Stage([name]) for name in layers] if args.no_fuse else plan(layers, args.rows)
+
+    memory = MemoryPlan(stages, layers, args.rows, args.base, args.alignment)
+    print(memory.table())
+    print(f'{memory.size} bytes, {memory.unshared_size} without reuse')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,174 @@
+'''
+Transaction-level model of hs_npu_executive and hs_npu_memory_ordering
+
+Runs jobs from the same CSR values the testbenches program, one call per
+job instead of one per clock. Each job replays the memory_ordering state
+machine as whole streams: weight lines (skipped with REWEIGHT), input lines
+(taken from the output FIFOs with REINPUT), SIZE bias and SIZE sum words,
+then one line burst per BURST_SIZE result words. Reads and writes go to a
+host buffer exactly as the AXI agent would see them, and the datapath is
+computed with the golden model on the full SIZE lanes, so padding columns
+end up in memory as they do in hardware.
+
+State that outlives a job is kept: the weights held by the systolic array,
+the weight FIFO storage that fills array rows a short tile does not load
+(through cycle.FifoBank), the input row register REINPUT only partially
+overwrites and the output FIFO rows the next REINPUT reads back.
+
+Cycle counts come from the analytic model in latency.py, pass it a
+calibrated Timing to match a given memory system.
+'''
+import dataclasses
+
+import numpy as np
+
+from .compiler import WORD_BYTES
+from .csr import ExitCode
+from .cycle import FifoBank
+from .golden import accumulate, activate, matmul
+from .latency import Timing, predict
+from .params import DEFAULT_PARAMS, wrap
+
+
+@dataclasses.dataclass
+class Access:
+    '''One contiguous stream of line bursts.'''
+    kind: str
+    address: int
+    nbytes: int
+    write: bool = False
+
+
+@dataclasses.dataclass
+class JobResult:
+    '''What one job did: its AXI streams, estimated cycles and outputs.'''
+    name: str
+    csrs: object
+    exit_code: ExitCode
+    cycles: int = 0
+    accesses: list = dataclasses.field(default_factory=list)
+    outputs: np.ndarray = None
+
+    def traffic(self):
+        '''AXI bytes read and written, as LayerCsrs.traffic() predicts.'''
+        read = sum(access.nbytes for access in self.accesses if not access.write)
+        write = sum(access.nbytes for access in self.accesses if access.write)
+        return read, write
+
+
+class TransactionModel:
+    '''
+    An hs_npu on a host memory buffer
+
+    memory is any writable buffer mapped at offset, results are written into
+    it. run() takes LayerCsrs; jobs the executive rejects (more input rows
+    than BUFFER_SIZE) end with ExitCode.CPU_ERR and touch nothing.
+    '''
+
+    def __init__(self, memory, offset=0, params=DEFAULT_PARAMS, timing=Timing()):
+        size = params.SIZE
+        self.memory = np.frombuffer(memory, dtype=np.uint8)
+        self.offset = offset
+        self.params = params
+        self.timing = timing
+
+        self.cycles = 0
+        self.results = []
+
+        self.weight_fifo = FifoBank(size, params.WEIGHT_FIFO_DEPTH, params.WEIGHT_DATA_WIDTH)
+        self.weights = np.zeros((size, size), dtype=np.int64)
+        self.input_register = np.zeros(size, dtype=np.int64)
+        self.output_fifo = np.zeros((params.BUFFER_SIZE, size), dtype=np.int64)
+
+    def _span(self, address, nbytes):
+        start = address - self.offset
+        if start < 0 or start + nbytes > len(self.memory):
+            raise ValueError(f'{nbytes} bytes at {address:#x} fall outside the model memory')
+        return self.memory[start:start + nbytes]
+
+    def _read(self, result, kind, address, count, dtype):
+        nbytes = count * np.dtype(dtype).itemsize
+        result.accesses.append(Access(kind, address, nbytes))
+        return self._span(address, nbytes).view(dtype).astype(np.int64), address + nbytes
+
+    def _load_weights(self, lines):
+        # The array shifts in one weight FIFO output per enabled cycle, the
+        # first line read ends up in the bottom row
+        fifo = self.weight_fifo
+        for line in lines:
+            fifo.step(True, line, False)
+        fifo.step(False, 0, False)
+
+        shifted = []
+        for _ in range(self.params.SIZE):
+            shifted.append(fifo.out.copy())
+            fifo.step(False, 0, True)
+        self.weights = np.array(shifted[::-1])
+
+    def run(self, csrs, name=None):
+        '''Run one job to completion, returns its JobResult.'''
+        params = self.params
+        size = params.SIZE
+        line = params.line_bytes
+        rows = csrs.num_input_rows
+
+        result = JobResult(name, csrs, ExitCode.CPU_ERR, predict(csrs, params, self.timing).total)
+        self.results.append(result)
+        self.cycles += result.cycles
+        if rows > params.BUFFER_SIZE:
+            return result
+
+        address = csrs.base_address
+
+        # LOADING_WEIGHTS
+        if not csrs.reuse_weights:
+            data, address = self._read(result, 'weights', address,
+                                       csrs.num_weight_rows * line, np.int8)
+            weight_lines = data.reshape(-1, size)
+
+        # LOADING_INPUTS, REINPUT right-aligns the previous outputs and keeps
+        # the lanes to their left from the last row loaded
+        if csrs.reuse_inputs:
+            columns = min(csrs.num_input_columns, size)
+            inputs = np.tile(self.input_register, (rows, 1))
+            inputs[:, size - columns:] = self.output_fifo[:rows, :columns]
+        else:
+            data, address = self._read(result, 'inputs', address, rows * line, np.int8)
+            inputs = data.reshape(-1, size)
+        if rows:
+            self.input_register = inputs[-1].copy()
+
+        # LOADING_BIAS, LOADING_SUMS
+        bias = sums = None
+        if csrs.use_bias:
+            bias, address = self._read(result, 'bias', address, size, '<i4')
+        if csrs.use_sum:
+            sums, address = self._read(result, 'sums', address, size, '<i4')
+
+        # READY_TO_COMPUTE, weights are loaded in its first SIZE cycles
+        if not csrs.reuse_weights:
+            self._load_weights(weight_lines)
+
+        outputs = accumulate(matmul(wrap(inputs, params.INPUT_DATA_WIDTH), self.weights,
+                                    sums, params), bias, params)
+        outputs = activate(outputs, csrs.shift_amount, csrs.activation_select, params)
+        self.output_fifo[:rows] = outputs
+        result.outputs = outputs
+
+        # SAVING, one sign extended word per lane and row
+        self.weight_fifo.step(False, 0, False, flush=True)
+        if csrs.save_outputs:
+            nbytes = rows * size * WORD_BYTES
+            self._span(csrs.result_address, nbytes).view('<i4')[:] = outputs.reshape(-1)
+            result.accesses.append(Access('outputs', csrs.result_address, nbytes, write=True))
+
+        result.exit_code = ExitCode.SUCCESS
+        return result
+
+    def run_all(self, jobs):
+        '''Run (name, LayerCsrs) pairs or bare LayerCsrs in order.'''
+        results = []
+        for job in jobs:
+            name, csrs = job if isinstance(job, tuple) else (None, job)
+            results.append(self.run(csrs, name))
+        return results
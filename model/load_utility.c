@@ -1,75 +1,198 @@
 #include <stdio.h>
 #include <stdlib.h>
+#include <string.h>
+#include <stdint.h>
 
-// const short weights[4][8] = {
-//     {-58, -47, 43, -57, -53, 94, 34, 109},
-//     {-35, -128, -26, 53, -20, -5, 127, -81},
-//     {98, 10, 13, -15, -43, 69, 68, 37},
-//     {85, 37, -3, -115, -110, -98, 95, -14}
-// };
-
-// const short weights[8][8] = {
-//     {56, -57, -103, 82, 88, -37, 44, 62},
-//     {-124, 78, 19, -51, -61, -98, -79, -9},
-//     {66, 68, -1, -35, 96, 70, 110, -19},
-//     {49, -114, 32, 42, -16, -123, -128, -118},
-//     {88, -68, -106, -4, -16, -80, 71, -38},
-//     {101, -10, -75, 65, -25, -74, -53, -14},
-//     {78, -8, -53, -124, 127, 55, 107, 47},
-//     {74, -91, -82, 37, -49, 126, -57, -59}
-// };
-
-const short weights[8][8] = {
-    {-109, -119, -113, 0, 0, 0, 0, 0},
-    {127, -103, -27, 0, 0, 0, 0, 0},
-    {-128, 3, -39, 0, 0, 0, 0, 0},
-    {63, -127, 33, 0, 0, 0, 0, 0},
-    {-108, 47, -70, 0, 0, 0, 0, 0},
-    {94, -34, -84, 0, 0, 0, 0, 0},
-    {-51, -96, 94, 0, 0, 0, 0, 0},
-    {16, -110, -90, 0, 0, 0, 0, 0},
-};
-
-const short inputs[4] [8] = {
-    0,0,0,0, 77, -36, 54, -72,
-    0,0,0,0, 96, -26, 29, -93,
-    0,0,0,0, 95, -37, 33, -78,
-    0,0,0,0, 110, 32, -59, -122,
-};
-
-int main() {
-    int* npu_data = malloc(sizeof(int) * 16); // allocate memory for 8 packed 4-byte integers
-    if (npu_data == NULL) {
-        printf("Memory allocation failed\n");
-        return 1;
+// Reads a weight container (see emulation/hs_npu_model/container.py) and
+// packs each layer's weights the way the NPU reads them: int8, one memory
+// line per weight row, rows bottom-up.
+//
+//     python -m hs_npu_model importer model_scaled.weights.h5 -o iris.pack --container iris.hsnw
+//     ./load_utility iris.hsnw
+
+#define SIZE 8
+#define LINE_WORDS (SIZE / 4)
+
+#define CONTAINER_VERSION 1
+#define NAME_BYTES 32
+#define FLAG_RELU 0x01
+
+enum { DTYPE_NONE = 0, DTYPE_INT8 = 1, DTYPE_INT16 = 2, DTYPE_INT32 = 3 };
+
+typedef struct {
+    char name[NAME_BYTES + 1];
+    uint32_t rows;
+    uint32_t columns;
+    uint32_t weights_offset;
+    uint32_t bias_offset;
+    uint8_t weights_dtype;
+    uint8_t bias_dtype;
+    uint8_t shift;
+    uint8_t flags;
+} layer_t;
+
+// Fields are little-endian whatever the host is
+static uint16_t read_u16(const unsigned char *p) {
+    return p[0] | p[1] << 8;
+}
+
+static uint32_t read_u32(const unsigned char *p) {
+    return p[0] | p[1] << 8 | p[2] << 16 | (uint32_t)p[3] << 24;
+}
+
+static int dtype_bytes(uint8_t dtype) {
+    switch (dtype) {
+        case DTYPE_INT8: return 1;
+        case DTYPE_INT16: return 2;
+        case DTYPE_INT32: return 4;
+        default: return 0;
     }
+}
+
+static int32_t read_value(const unsigned char *p, uint8_t dtype) {
+    switch (dtype) {
+        case DTYPE_INT8: return (int8_t)p[0];
+        case DTYPE_INT16: return (int16_t)read_u16(p);
+        default: return (int32_t)read_u32(p);
+    }
+}
 
-    for (int row = 0; row < 8; ++row) {
-        for (int col = 0; col < 1; ++col) {
-            // Packing 4 weights into a single 32-bit int (little-endian)
+// Whole file in memory, the container is small next to what it describes
+static unsigned char *read_file(const char *path, long *size) {
+    FILE *f = fopen(path, "rb");
+    if (f == NULL) {
+        return NULL;
+    }
+
+    unsigned char *data = NULL;
+    if (fseek(f, 0, SEEK_END) == 0 && (*size = ftell(f)) >= 0 && fseek(f, 0, SEEK_SET) == 0) {
+        data = malloc(*size ? *size : 1);
+        if (data != NULL && fread(data, 1, *size, f) != (size_t)*size) {
+            free(data);
+            data = NULL;
+        }
+    }
+
+    fclose(f);
+    return data;
+}
+
+static int parse_layer(const unsigned char *data, long size, long at, layer_t *layer) {
+    const unsigned char *entry = data + at;
+
+    memcpy(layer->name, entry, NAME_BYTES);
+    layer->name[NAME_BYTES] = '\0';
+    layer->rows = read_u32(entry + 32);
+    layer->columns = read_u32(entry + 36);
+    layer->weights_offset = read_u32(entry + 40);
+    layer->bias_offset = read_u32(entry + 44);
+    layer->weights_dtype = entry[48];
+    layer->bias_dtype = entry[49];
+    layer->shift = entry[50];
+    layer->flags = entry[51];
+
+    int weight_bytes = dtype_bytes(layer->weights_dtype);
+    int bias_bytes = dtype_bytes(layer->bias_dtype);
+    if (weight_bytes == 0 || (layer->bias_dtype != DTYPE_NONE && bias_bytes == 0)) {
+        return -1;
+    }
+    if (layer->weights_offset + (long)layer->rows * layer->columns * weight_bytes > size) {
+        return -1;
+    }
+    if (bias_bytes && layer->bias_offset + (long)layer->columns * bias_bytes > size) {
+        return -1;
+    }
+    return 0;
+}
+
+// Packs weights into npu_data, 4 int8 weights per 32-bit int (little-endian)
+static void pack_weights(const unsigned char *data, const layer_t *layer, int *npu_data) {
+    const unsigned char *weights = data + layer->weights_offset;
+    int weight_bytes = dtype_bytes(layer->weights_dtype);
+
+    for (uint32_t row = 0; row < layer->rows; ++row) {
+        // Weight rows are stored top-down and read by the NPU bottom-up
+        uint32_t source = layer->rows - 1 - row;
+        for (int col = 0; col < LINE_WORDS; ++col) {
             int packed_value = 0;
             for (int byte = 0; byte < 4; ++byte) {
-                packed_value |= ((unsigned char)weights[row][col * 4 + byte] & 0xFF) << (byte * 8);
+                uint32_t column = col * 4 + byte;
+                if (column < layer->columns) {
+                    int32_t value = read_value(weights + (source * layer->columns + column) * weight_bytes,
+                                               layer->weights_dtype);
+                    packed_value |= ((unsigned char)value & 0xFF) << (byte * 8);
+                }
             }
-            npu_data[row * 2 + col] = packed_value;
+            npu_data[row * LINE_WORDS + col] = packed_value;
         }
     }
+}
+
+int main(int argc, char **argv) {
+    if (argc != 2) {
+        printf("usage: %s <weights.hsnw>\n", argv[0]);
+        return 1;
+    }
+
+    long size = 0;
+    unsigned char *data = read_file(argv[1], &size);
+    if (data == NULL) {
+        printf("Could not read %s\n", argv[1]);
+        return 1;
+    }
+
+    if (size < 16 || memcmp(data, "HSNW", 4) != 0 || read_u16(data + 4) != CONTAINER_VERSION) {
+        printf("%s is not a version %d weight container\n", argv[1], CONTAINER_VERSION);
+        free(data);
+        return 1;
+    }
+
+    uint16_t header_size = read_u16(data + 6);
+    uint32_t count = read_u32(data + 8);
+    uint32_t entry_size = read_u32(data + 12);
+
+    for (uint32_t i = 0; i < count; ++i) {
+        long at = header_size + (long)i * entry_size;
+        layer_t layer;
+        if (entry_size < 64 || at + entry_size > size || parse_layer(data, size, at, &layer) != 0) {
+            printf("Layer %u: corrupt index entry\n", i);
+            free(data);
+            return 1;
+        }
+        if (layer.columns > SIZE) {
+            printf("Layer %s: %u columns, tile it to %d first\n", layer.name, layer.columns, SIZE);
+            continue;
+        }
+
+        int* npu_data = malloc(sizeof(int) * LINE_WORDS * (layer.rows ? layer.rows : 1));
+        if (npu_data == NULL) {
+            printf("Memory allocation failed\n");
+            free(data);
+            return 1;
+        }
+
+        pack_weights(data, &layer, npu_data);
+
+        printf("Layer: %s %ux%u shift %u%s\n", layer.name, layer.rows, layer.columns,
+               layer.shift, layer.flags & FLAG_RELU ? " relu" : "");
+
+        // Printing the packed values for verification
+        for (uint32_t j = 0; j < layer.rows * LINE_WORDS; ++j) {
+            printf("npu_data[%u] = 0x%08X\n", j, npu_data[j]);
+        }
+
+        if (layer.bias_dtype != DTYPE_NONE) {
+            printf("bias =");
+            for (uint32_t col = 0; col < layer.columns; ++col) {
+                printf(" %d", read_value(data + layer.bias_offset + col * dtype_bytes(layer.bias_dtype),
+                                         layer.bias_dtype));
+            }
+            printf("\n");
+        }
 
-    // for (int row = 0; row < 8; ++row) {
-    //     // Packing 4 weights into a single 32-bit int (little-endian)
-    //     int packed_value = 0;
-    //     for (int byte = 0; byte < 4; ++byte) {
-    //         packed_value |= ((unsigned char)weights[row][byte] & 0xFF) << (byte * 8);
-    //     }
-    //     npu_data[row] = packed_value;
-    // }
-    
-
-    // Printing the packed values for verification
-    for (int i = 0; i < 16; ++i) {
-        printf("npu_data_3[%d] = 0x%08X\n", i, npu_data[i]);
+        free(npu_data);
     }
 
-    free(npu_data);
+    free(data);
     return 0;
 }
@@ -1,6 +1,19 @@
 module hs_npu_top_flat
   import hs_npu_pkg::*, hs_npu_ctrlstatus_regs_pkg::*;
-(
+#(
+    // Forwarded to hs_npu_top, so simulators can override them on the top
+    parameter int SIZE = 8,
+    parameter int INPUT_DATA_WIDTH = 16,
+    parameter int WEIGHT_DATA_WIDTH = 16,
+    parameter int OUTPUT_DATA_WIDTH = 32,
+    parameter int ACTIVATION_OUTPUT_WIDTH = INPUT_DATA_WIDTH,
+    parameter int BUFFER_SIZE = 16,
+    parameter int INPUT_FIFO_DEPTH = BUFFER_SIZE,
+    parameter int OUTPUT_FIFO_DEPTH = BUFFER_SIZE,
+    parameter int WEIGHT_FIFO_DEPTH = 8,
+    parameter int BURST_SIZE = 2,
+    parameter int BURST_LEN = 1
+) (
     input logic clk_npu,
     input logic rst_n,
 
@@ -138,7 +151,19 @@ module hs_npu_top_flat
   assign mem.s.rlast  = mem_rlast;
 
   // Instantiate the original top module using the interfaces
-  hs_npu_top hs_npu (
+  hs_npu_top #(
+      .SIZE(SIZE),
+      .INPUT_DATA_WIDTH(INPUT_DATA_WIDTH),
+      .WEIGHT_DATA_WIDTH(WEIGHT_DATA_WIDTH),
+      .OUTPUT_DATA_WIDTH(OUTPUT_DATA_WIDTH),
+      .ACTIVATION_OUTPUT_WIDTH(ACTIVATION_OUTPUT_WIDTH),
+      .BUFFER_SIZE(BUFFER_SIZE),
+      .INPUT_FIFO_DEPTH(INPUT_FIFO_DEPTH),
+      .OUTPUT_FIFO_DEPTH(OUTPUT_FIFO_DEPTH),
+      .WEIGHT_FIFO_DEPTH(WEIGHT_FIFO_DEPTH),
+      .BURST_SIZE(BURST_SIZE),
+      .BURST_LEN(BURST_LEN)
+  ) hs_npu (
       .clk(clk_npu),
       .rst_n(rst_n),
       .irq_cpu(irq),
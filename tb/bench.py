@@ -0,0 +1,176 @@
+'''
+hs_npu parameter sweep
+
+Elaborates hs_npu_top_flat once per point of the cross product of every
+--sweep and runs test_hs_npu_benchmark on it, the same layer workload each
+time, then tabulates cycles, MAC utilization, AXI bytes and wall time per
+layer and per configuration:
+
+    python tb/bench.py -j 16 --sweep BUFFER_SIZE=8,16,32 \
+        --sweep WEIGHT_FIFO_DEPTH=8,16 --csv bench.csv
+
+Only BUFFER_SIZE and the FIFO depths can be swept. The RTL only computes
+correctly with the defaults of the other parameters (see FIXED), sweeping
+them is an error. Points the compiler cannot schedule for are reported
+and skipped. Runs go through tb/regress.py, see there for --command and the
+work directories.
+Each run also leaves latency_samples.json there, the per-job measurements
+python -m hs_npu_model latency calibrate fits its Timing constants to.
+'''
+import argparse
+import csv
+import json
+import os
+import pathlib
+import sys
+
+import numpy as np
+
+from regress import DEFAULT_COMMAND, TestRun, find_tests, parameter_points, read_packages, run_tests
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1] / 'emulation'))
+from hs_npu_model import NpuParams, compile_dense  # noqa: E402
+
+PACKAGE = 'tb_hs_npu'
+TESTCASE = 'test_hs_npu_benchmark'
+
+# hs_npu_memory_interface has a fixed 32 bit mem_rdata and places a line's
+# beats by burst_counter indices 0 and 1, hs_npu_systolic hardcodes 16 bit
+# operands and 32 bit sums, hs_npu_memory_ordering 16 bit activations. SIZE
+# follows, the compiler needs one 4 * BURST_SIZE byte line per SIZE wide row.
+FIXED = {
+    'SIZE': 8,
+    'INPUT_DATA_WIDTH': 16,
+    'WEIGHT_DATA_WIDTH': 16,
+    'OUTPUT_DATA_WIDTH': 32,
+    'ACTIVATION_OUTPUT_WIDTH': 16,
+    'BURST_SIZE': 2,
+    'BURST_LEN': 1,
+}
+
+COLUMNS = ['config', 'layer', 'jobs', 'cycles', 'macs', 'utilization',
+           'read_bytes', 'write_bytes', 'wall_time']
+
+
+def configurations(sweeps):
+    '''
+    Sweep points the compiler can schedule for, and the skipped ones with
+    why. Raises ValueError for values of FIXED parameters the RTL cannot run.
+    '''
+    valid, skipped = [], []
+    for point in parameter_points(sweeps):
+        point = {name: int(value, 0) for name, value in point.items()}
+        for name, value in point.items():
+            if FIXED.get(name, value) != value:
+                raise ValueError(f'{name}={value} is not supported by the RTL, '
+                                 f'it only runs with {name}={FIXED[name]}')
+
+        try:
+            params = NpuParams.from_rtl(**point)
+            compile_dense(np.zeros((1, params.SIZE), dtype=np.int64),
+                          np.zeros((params.SIZE, params.SIZE), dtype=np.int64), params=params)
+        except (ValueError, TypeError) as error:
+            skipped.append((point, str(error)))
+            continue
+        valid.append(point)
+
+    return valid, skipped
+
+
+def _config_name(point):
+    return ','.join(f'{name}={value}' for name, value in point.items()) or 'default'
+
+
+def tabulate(rows):
+    widths = {column: max(len(column), *(len(str(row[column])) for row in rows)) for column in COLUMNS}
+    lines = ['  '.join(column.rjust(widths[column]) for column in COLUMNS)]
+    lines += ['  '.join(str(row[column]).rjust(widths[column]) for column in COLUMNS) for row in rows]
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sweep', action='append', default=[], metavar='NAME=V1,V2',
+                        help='hs_npu_top_flat parameter and its values, may be repeated')
+    parser.add_argument('--layers', default='32x32,32x16,16x10',
+                        help='workload as inputs x outputs per layer')
+    parser.add_argument('--rows', type=int, default=32, help='inferences per layer')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count())
+    parser.add_argument('--work', type=pathlib.Path, default=pathlib.Path('bench'))
+    parser.add_argument('--command', default=DEFAULT_COMMAND, help='simulation command template')
+    parser.add_argument('--timeout', type=float)
+    parser.add_argument('--csv', type=pathlib.Path, help='write per-layer rows as CSV')
+    parser.add_argument('--json', type=pathlib.Path, help='write every benchmark report as JSON')
+    args = parser.parse_args(argv)
+
+    package = read_packages()[PACKAGE]
+    if TESTCASE not in find_tests(package):
+        parser.error(f'{PACKAGE} has no {TESTCASE}')
+
+    try:
+        points, skipped = configurations(args.sweep)
+    except ValueError as error:
+        parser.error(str(error))
+    for point, reason in skipped:
+        print(f'skipping {_config_name(point)}: {reason}')
+
+    workload = {'HS_NPU_BENCH_LAYERS': args.layers, 'HS_NPU_BENCH_ROWS': str(args.rows)}
+    runs = [TestRun(package, TESTCASE, workload, generics=point) for point in points]
+
+    results = []
+    for result in run_tests(runs, args.work, args.command, args.timeout, args.jobs):
+        results.append(result)
+        print(f'{result.outcome.upper():8} {result.wall_time:8.1f} s  '
+              f'{_config_name(result.run.generics)}', flush=True)
+
+    rows, reports, totals = [], [], []
+    for result in sorted(results, key=lambda r: list(r.run.generics.values())):
+        name = _config_name(result.run.generics)
+        path = (args.work / result.run.directory / 'benchmark.json')
+        if result.outcome != 'passed' or not path.exists():
+            print(f'{name}: {result.outcome} {result.message}, see {result.log}')
+            continue
+
+        report = json.loads(path.read_text())
+        report['config'] = result.run.generics
+        report['sim_wall_time'] = result.wall_time
+        reports.append(report)
+
+        for layer in report['layers']:
+            rows.append({'config': name, 'layer': layer['name'], 'jobs': layer['jobs'],
+                         'cycles': layer['cycles'], 'macs': layer['macs'],
+                         'utilization': f'{layer["utilization"] or 0:.1%}',
+                         'read_bytes': layer['read_bytes'], 'write_bytes': layer['write_bytes'],
+                         'wall_time': f'{layer["wall_time"]:.2f}'})
+
+        cycles = sum(layer['cycles'] for layer in report['layers'])
+        macs = sum(layer['macs'] for layer in report['layers'])
+        size = report['params']['SIZE']
+        totals.append({'config': name, 'layer': 'total',
+                       'jobs': sum(layer['jobs'] for layer in report['layers']),
+                       'cycles': cycles, 'macs': macs,
+                       'utilization': f'{macs / (cycles * size ** 2) if cycles else 0:.1%}',
+                       'read_bytes': sum(layer['read_bytes'] for layer in report['layers']),
+                       'write_bytes': sum(layer['write_bytes'] for layer in report['layers']),
+                       'wall_time': f'{result.wall_time:.2f}'})
+
+    if rows:
+        print()
+        print(tabulate(rows))
+        print()
+        print(tabulate(totals))
+
+    if args.csv:
+        with open(args.csv, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=COLUMNS)
+            writer.writeheader()
+            writer.writerows(rows + totals)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(reports, f, indent=2)
+
+    return 0 if len(reports) == len(runs) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -4,6 +4,8 @@ from cocotb.triggers import RisingEdge, ClockCycles
 import numpy as np
 import random
 
+from hs_npu_model import golden
+
 @cocotb.test()
 async def test_hs_npu_inference(dut):
     """Test the hs_npu_inference module with a simple matrix multiplication and accumulation."""
@@ -95,17 +97,11 @@ async def test_hs_npu_inference(dut):
     do_relu = 0
     number_of_shifts = 0
 
-    #Mat mul
-    expected_result = np.dot(np.array(matrixA_data),np.array(matrixB_data))
+    # Mat mul, activation and quantization
+    expected_result = golden.dense(matrixA_data, matrixB_data, bias_vector, sums_vector,
+                                   shift=number_of_shifts, relu=do_relu)
     matrixB_data = matrixB_data[::-1]
 
-    # Activation and quantization
-    expected_result = expected_result + np.array(sums_vector)
-    expected_result = expected_result + np.array(bias_vector)
-    if(do_relu):
-        expected_result = np.maximum(expected_result,0)
-    expected_result = np.right_shift(expected_result,number_of_shifts)
-
     bias_vector = [-128, -12, 127, 0, 0, 0, 0, 0]
     sums_vector = [0,0,0,0,0,0,0,0]
 
@@ -16,12 +16,12 @@ tb_hs_npu_fifo_keeper.cocotb_modules (['tb_hs_npu_fifo_keeper'])
 
 tb_hs_npu_inference.requires       (hs_npu)
 tb_hs_npu_inference.top            ('hs_npu_inference')
-tb_hs_npu_inference.cocotb_paths   (['./inference'])
+tb_hs_npu_inference.cocotb_paths   (['./inference', '../emulation'])
 tb_hs_npu_inference.cocotb_modules (['tb_hs_npu_inference'])
 
 tb_hs_npu_mm_unit.requires       (hs_npu)
 tb_hs_npu_mm_unit.top            ('hs_npu_mm_unit')
-tb_hs_npu_mm_unit.cocotb_paths   (['./mm_unit'])
+tb_hs_npu_mm_unit.cocotb_paths   (['./mm_unit', '../emulation'])
 tb_hs_npu_mm_unit.cocotb_modules (['tb_hs_npu_mm_unit'])
 
 tb_hs_npu_systolic.requires       (hs_npu)
@@ -32,5 +32,5 @@ tb_hs_npu_systolic.cocotb_modules (['tb_hs_npu_systolic'])
 tb_hs_npu.requires       (hs_npu)
 tb_hs_npu.rtl            ('npu/hs_npu_test.sv')
 tb_hs_npu.top            ('hs_npu_top_flat')
-tb_hs_npu.cocotb_paths   (['./npu'])
+tb_hs_npu.cocotb_paths   (['./npu', '../emulation'])
 tb_hs_npu.cocotb_modules (['tb_hs_npu'])
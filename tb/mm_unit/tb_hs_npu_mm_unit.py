@@ -4,6 +4,8 @@ from cocotb.triggers import RisingEdge, ClockCycles
 import numpy as np
 import random
 
+from hs_npu_model import golden
+
 @cocotb.test()
 async def test_hs_npu_mm_unit(dut):
     """Test the hs_npu_mm_unit module with FIFO and gatekeeper logic."""
@@ -50,15 +52,12 @@ async def test_hs_npu_mm_unit(dut):
         [98, 10, 13, -15, -43, 69, 68, 37],
         [85, 37, -3, -115, -110, -98, 95, -14]
     ]
-    # expected_result = [
-    #     [5303, -1039, -5199, -1349, -4186, -17068, 9277, -14632]
-    # ]
 
     input_rows = len(matrixA_data)
     weight_rows = len(matrixB_data)
     input_size = len(matrixA_data[0])
     weight_size = len(matrixB_data[0])
-    systolic_size = dut.SIZE.value
+    systolic_size = int(dut.SIZE.value)
     
     # Set initial sums to 0
     for i in range(systolic_size):
@@ -105,9 +104,9 @@ async def test_hs_npu_mm_unit(dut):
     await ClockCycles(dut.clk, 1)
     dut.start_output_gatekeeper.value = 0
 
-    # Collect results from output gatekeepers
+    # Lane j holds result row i on the (i + j)th cycle the output gatekeepers
+    # are sampled, starting right after the start pulse
     result_matrix = []
-    await ClockCycles(dut.clk, 1)
     for i in range(2*systolic_size -1):
         result_values = []
         for j in range(weight_size):
@@ -115,34 +114,21 @@ async def test_hs_npu_mm_unit(dut):
             result_values.append(result)
         result_matrix.append(result_values)
         await ClockCycles(dut.clk, 1)
-        
+
     print(result_matrix)
 
-    #     # Iterate over the array
-    # for i in range(8):
-
-    # # Start the output gatekeeper to get results
-    # dut.start_output_gatekeeper.value = 1
-    # await ClockCycles(dut.clk, 1)
-    # dut.start_output_gatekeeper.value = 0
-    # await ClockCycles(dut.clk, systolic_size + 1)  # Wait for computation to complete
-
-    # # Collect results from output FIFOs
-    # result_matrix = []
-    # result_values = []
-    # dut.output_fifo_ready_i.value = 1
-    # await ClockCycles(dut.clk, 1)
-    # for i in range(input_rows):
-    #     for j in range(weight_size):
-    #         result = dut.output_data[j].value.signed_integer
-    #         result_values.append(result)
-    #         cocotb.log.info(f"Result[{i}]: {result}")
-    #     await ClockCycles(dut.clk, 1)
-    #     result_matrix.append(result_values)
-
-    # Verification of results
-    # for i in range(weight_size):
-    #     assert result_values[i] == expected_result[0][i], f"Mismatch at index {i}: Expected {expected_result[i]}, got {result_values[i]}"
-    #     cocotb.log.info(f"Verification Passed for Result[{i}]")
+    # Weight rows went in first to last and inputs right-aligned, so the
+    # first weight row meets the last input lane: the golden model reads
+    # weights bottom-up, as hs_npu_memory_ordering feeds them
+    inputs = np.zeros((input_rows, systolic_size), dtype=np.int64)
+    inputs[:, systolic_size - input_size:] = matrixA_data
+    weights = np.zeros((systolic_size, systolic_size), dtype=np.int64)
+    weights[:weight_rows, :weight_size] = matrixB_data
+    expected = golden.matmul(inputs, weights[::-1])
+
+    for i in range(input_rows):
+        for j in range(weight_size):
+            assert result_matrix[i + j][j] == expected[i][j], \
+                f"Mismatch at row {i}, column {j}: expected {expected[i][j]}, got {result_matrix[i + j][j]}"
 
     cocotb.log.info("Test completed successfully.")
@@ -1,8 +1,11 @@
+import collections
+import dataclasses
 import enum
+import mmap
+import os
 
 import cocotb
-from cocotb.binary import BinaryValue
-from cocotb.triggers import Lock, RisingEdge, ReadOnly
+from cocotb.triggers import Event, Lock, RisingEdge, ReadOnly
 
 from cocotb_bus.drivers import BusDriver
 
@@ -29,11 +32,109 @@ class AXIReadBurstLengthMismatch(Exception):
     pass
 
 
+@dataclasses.dataclass
+class AXITiming:
+    '''
+    Memory timing model of AXI4Agent, in clock cycles
+
+    read_latency and write_latency count the cycles between an accepted
+    address and the first data beat of its burst. beat_interval is the cycles
+    per data beat on each channel (1 is full bandwidth). Every
+    refresh_interval cycles the memory stalls for refresh_cycles, during
+    which no channel handshakes. The outstanding limits are the addresses
+    accepted ahead of their data. The defaults answer with zero wait states.
+
+    hs_npu_memory_interface places each read beat by whether the previous
+    cycle had one, a gap inside a burst makes it overwrite the first word.
+    Read bursts are therefore always driven back to back: beat_interval and
+    refresh stalls only delay a burst's first beat, by as many cycles as
+    throttling its beats would have cost, so the average bandwidth is the
+    same. Write beats are throttled one by one.
+    '''
+    read_latency: int = 0
+    write_latency: int = 0
+    beat_interval: int = 1
+    refresh_interval: int = 0
+    refresh_cycles: int = 0
+    read_outstanding: int = 1
+    write_outstanding: int = 1
+
+    def refreshing(self, cycle):
+        return bool(self.refresh_interval) and cycle % self.refresh_interval < self.refresh_cycles
+
+
+@dataclasses.dataclass
+class AXIChannelStats:
+    '''Data beats moved on one channel and the cycles they were spread over.'''
+    bursts: int = 0
+    beats: int = 0
+    bytes: int = 0
+    first_cycle: int = None
+    last_cycle: int = None
+
+    def record(self, cycle, nbytes):
+        if self.first_cycle is None:
+            self.first_cycle = cycle
+        self.last_cycle = cycle
+        self.beats += 1
+        self.bytes += nbytes
+
+    @property
+    def active_cycles(self):
+        if self.first_cycle is None:
+            return 0
+        return self.last_cycle - self.first_cycle + 1
+
+    @property
+    def bytes_per_cycle(self):
+        return self.bytes / self.active_cycles if self.beats else 0.0
+
+
+@dataclasses.dataclass
+class _Burst:
+    address: int
+    bytes_in_beat: int
+    length: int
+    accepted: int
+    ready: int
+    beats: list = None
+    done: int = 0
+
+
+def map_image(path, size=None, access=mmap.ACCESS_WRITE):
+    '''
+    Memory-map an image file for use as AXI4Agent backing store
+
+    With ACCESS_WRITE the NPU's writes land in the file and the file is grown
+    to size bytes if shorter. ACCESS_COPY maps the file copy-on-write: pages
+    are shared with every other process mapping the same image and writes
+    stay private to this simulation.
+    '''
+    with open(path, 'r+b' if access == mmap.ACCESS_WRITE else 'rb') as f:
+        length = os.fstat(f.fileno()).st_size
+        if size is not None and length < size:
+            if access != mmap.ACCESS_WRITE:
+                raise ValueError(f'{path} is {length} bytes, {size} needed')
+            f.truncate(size)
+
+        return mmap.mmap(f.fileno(), 0, access=access)
+
+
 class AXI4Agent(BusDriver):
     '''
     AXI4 Agent
 
     Monitors an internal memory and handles read and write requests.
+
+    memory is any writable buffer (a bytearray, memoryview or mmap) or the
+    path of an image file, which is mapped with map_image() using
+    memory_size and memory_access.
+
+    Read bursts are fetched from memory in one slice when their address is
+    accepted and driven on rdata as plain ints. timing (an AXITiming) sets
+    latencies, throttling, refresh stalls and how many addresses are
+    accepted ahead of their data, read_stats and write_stats count what was
+    actually moved.
     '''
     _signals = [
         "arready", "arvalid", "araddr",             # Read address channel
@@ -59,132 +160,236 @@ class AXI4Agent(BusDriver):
     ]
 
     def __init__(self, entity, name, clock, memory, callback=None, event=None,
-                 big_endian=False, **kwargs):
+                 big_endian=False, memory_size=None, memory_access=mmap.ACCESS_WRITE,
+                 timing=None, **kwargs):
 
         BusDriver.__init__(self, entity, name, clock, **kwargs)
         self.clock = clock
 
         self.big_endian = big_endian
+        self.timing = timing or AXITiming()
         self.bus.arready.setimmediatevalue(0)
         self.bus.rvalid.setimmediatevalue(0)
         self.bus.rlast.setimmediatevalue(0)
-        self.bus.awready.setimmediatevalue(1)
-        self._memory = memory
+        self.bus.awready.setimmediatevalue(0)
+        self.bus.wready.setimmediatevalue(0)
+
+        if isinstance(memory, (str, os.PathLike)):
+            memory = map_image(memory, memory_size, memory_access)
+        self._backing = memory
+        self._memory = memoryview(memory)
 
         self.write_address_busy = Lock("%s_wabusy" % name)
         self.read_address_busy = Lock("%s_rabusy" % name)
         self.write_data_busy = Lock("%s_wbusy" % name)
 
+        self.cycle = 0
+        self.read_stats = AXIChannelStats()
+        self.write_stats = AXIChannelStats()
+
+        self._read_bursts = collections.deque()
+        self._read_issued = Event("%s_rissued" % name)
+        self._write_bursts = collections.deque()
+        self._write_issued = Event("%s_wissued" % name)
+
+        cocotb.start_soon(self._count_cycles())
+        cocotb.start_soon(self._read_address())
         cocotb.start_soon(self._read_data())
+        cocotb.start_soon(self._write_address())
         cocotb.start_soon(self._write_data())
 
+    @property
+    def memory(self):
+        return self._memory
+
+    def flush(self):
+        '''Write dirty pages of a shared file mapping back to disk.'''
+        if isinstance(self._backing, mmap.mmap):
+            self._backing.flush()
+
+    def report(self):
+        '''Achieved traffic per channel since the agent was created.'''
+        report = {'cycles': self.cycle}
+        for channel, stats in (('read', self.read_stats), ('write', self.write_stats)):
+            report[channel] = {
+                'bursts': stats.bursts,
+                'beats': stats.beats,
+                'bytes': stats.bytes,
+                'active_cycles': stats.active_cycles,
+                'bytes_per_cycle': stats.bytes_per_cycle,
+            }
+
+        return report
+
     def _size_to_bytes_in_beat(self, AxSIZE):
         if AxSIZE < 7:
             return 2 ** AxSIZE
         return None
 
-    async def _write_data(self):
+    async def _count_cycles(self):
+        # Other coroutines only read self.cycle in ReadOnly, once this one
+        # has run for the current edge
+        clock_re = RisingEdge(self.clock)
+        while True:
+            await clock_re
+            self.cycle += 1
+
+    def _read_burst(self, araddr, arlen, arsize, arburst):
+        '''Every beat of a read burst as an int, from one slice of memory.'''
+        burst_length = arlen + 1
+        bytes_in_beat = self._size_to_bytes_in_beat(arsize)
+        byteorder = 'big' if self.big_endian else 'little'
+
+        if arburst == AXIBurst.FIXED:
+            data = self._memory[araddr:araddr + bytes_in_beat].tobytes() * burst_length
+        else:
+            total = burst_length * bytes_in_beat
+            start = araddr
+            if arburst == AXIBurst.WRAP:
+                start = araddr - araddr % total
+
+            data = self._memory[start:start + total].tobytes()
+            if arburst == AXIBurst.WRAP:
+                split = araddr - start
+                data = data[split:] + data[:split]
+
+        return [int.from_bytes(data[i:i + bytes_in_beat], byteorder)
+                for i in range(0, len(data), bytes_in_beat)]
+
+    async def _read_address(self):
         clock_re = RisingEdge(self.clock)
+        read_only = ReadOnly()
+        timing = self.timing
 
+        ready = timing.read_outstanding > 0 and not timing.refreshing(0)
         while True:
-            while True:
-                self.bus.wready.value = 0
-                # await ReadOnly()
-                if self.bus.awvalid.value:
-                    self.bus.wready.value = 1
-                    break
-                await clock_re
-
-            await ReadOnly()
-            _awaddr = int(self.bus.awaddr)
-            _awlen = int(self.bus.awlen)
-            _awsize = int(self.bus.awsize)
-            _awburst = int(self.bus.awburst)
-            _awprot = int(self.bus.awprot)
-
-            burst_length = _awlen + 1
-            bytes_in_beat = self._size_to_bytes_in_beat(_awsize)
-
-            if __debug__:
-                self.log.debug(
-                    "awaddr  %d\n" % _awaddr +
-                    "awlen   %d\n" % _awlen +
-                    "awsize  %d\n" % _awsize +
-                    "awburst %d\n" % _awburst +
-                    "awprot %d\n" % _awprot +
-                    "BURST_LENGTH %d\n" % burst_length +
-                    "Bytes in beat %d\n" % bytes_in_beat)
-
-            burst_count = burst_length
+            self.bus.arready.value = int(ready)
+
+            await read_only
+            cycle = self.cycle
+            burst = None
+            if ready and self.bus.arvalid.value:
+                _araddr = int(self.bus.araddr)
+                _arlen = int(self.bus.arlen)
+                _arsize = int(self.bus.arsize)
+                _arburst = int(self.bus.arburst)
+
+                self.log.debug("araddr %d arlen %d arsize %d arburst %d",
+                               _araddr, _arlen, _arsize, _arburst)
+
+                burst = _Burst(address=_araddr, bytes_in_beat=self._size_to_bytes_in_beat(_arsize),
+                               length=_arlen + 1, accepted=cycle,
+                               ready=cycle + 1 + timing.read_latency,
+                               beats=self._read_burst(_araddr, _arlen, _arsize, _arburst))
 
             await clock_re
+            if burst is not None:
+                self._read_bursts.append(burst)
+                self.read_stats.bursts += 1
+                self._read_issued.set()
 
-            while True:
-                if self.bus.wvalid.value:
-                    word = self.bus.wdata.value
-                    word.big_endian = self.big_endian
-                    _burst_diff = burst_length - burst_count
-                    _st = _awaddr + (_burst_diff * bytes_in_beat)  # start
-                    _end = _awaddr + ((_burst_diff + 1) * bytes_in_beat)  # end
-                    self._memory[_st:_end] = word.buff
-                    #burst_count -= 1
-                    if self.bus.wlast == 1:
-                        break
-                await clock_re
+            ready = len(self._read_bursts) < timing.read_outstanding and \
+                not timing.refreshing(cycle + 1)
 
     async def _read_data(self):
         clock_re = RisingEdge(self.clock)
+        read_only = ReadOnly()
+        timing = self.timing
 
+        cycle = next_beat = 0
         while True:
-            self.bus.arready.value = 1
-            while True:
-                await ReadOnly()
-                if self.bus.arvalid.value:
-                    break
-                await clock_re
-
-            await ReadOnly()
-            _araddr = int(self.bus.araddr)
-            _arlen = int(self.bus.arlen)
-            _arsize = int(self.bus.arsize)
-            _arburst = int(self.bus.arburst)
-            _arprot = int(self.bus.arprot)
-
-            burst_length = _arlen + 1
-            bytes_in_beat = self._size_to_bytes_in_beat(_arsize)
-
-            word = BinaryValue(n_bits=bytes_in_beat*8, bigEndian=self.big_endian)
-
-            if __debug__:
-                self.log.debug(
-                    "araddr  %d\n" % _araddr +
-                    "arlen   %d\n" % _arlen +
-                    "arsize  %d\n" % _arsize +
-                    "arburst %d\n" % _arburst +
-                    "arprot %d\n" % _arprot +
-                    "BURST_LENGTH %d\n" % burst_length +
-                    "Bytes in beat %d\n" % bytes_in_beat)
-
-            burst_count = burst_length
+            if not self._read_bursts:
+                self.bus.rvalid.value = 0
+                self._read_issued.clear()
+                await self._read_issued.wait()
+                cycle = self._read_bursts[0].accepted
+
+            # Decide this cycle's beat from the cycle sampled before the edge,
+            # a burst that has started goes on without stalls
+            burst = self._read_bursts[0]
+            valid = burst.done > 0 or \
+                (cycle + 1 >= max(burst.ready, next_beat) and not timing.refreshing(cycle + 1))
+            self.bus.rvalid.value = int(valid)
+            if valid:
+                self.bus.rdata.value = burst.beats[burst.done]
+                self.bus.rlast.value = int(burst.done == burst.length - 1)
+
+            await read_only
+            cycle = self.cycle
+            if valid and self.bus.rready.value:
+                self.read_stats.record(cycle, burst.bytes_in_beat)
+                if burst.done == 0:
+                    next_beat = cycle + timing.beat_interval * burst.length
+                burst.done += 1
+
+                # Retire the burst before the edge so the address channel
+                # sees the freed slot on the same cycle
+                if burst.done == burst.length:
+                    self._read_bursts.popleft()
 
             await clock_re
-            self.bus.arready.value = 0
 
-            self.bus.rvalid.value = 1
-            while burst_count > 0:
-                _burst_diff = burst_length - burst_count
-                _st = _araddr + (_burst_diff * bytes_in_beat)
-                _end = _araddr + ((_burst_diff + 1) * bytes_in_beat)
-                word.buff = self._memory[_st:_end].tobytes()
-                self.bus.rdata.value = word
-                self.bus.rlast.value = int(burst_count == 1)
+    async def _write_address(self):
+        clock_re = RisingEdge(self.clock)
+        read_only = ReadOnly()
+        timing = self.timing
 
-                await ReadOnly()
+        ready = timing.write_outstanding > 0 and not timing.refreshing(0)
+        while True:
+            self.bus.awready.value = int(ready)
+
+            await read_only
+            cycle = self.cycle
+            burst = None
+            if ready and self.bus.awvalid.value:
+                _awaddr = int(self.bus.awaddr)
+                _awlen = int(self.bus.awlen)
+                _awsize = int(self.bus.awsize)
 
-                if self.bus.rready.value:
-                    burst_count -= 1
+                self.log.debug("awaddr %d awlen %d awsize %d", _awaddr, _awlen, _awsize)
 
-                await clock_re
-                self.bus.rlast.value = 0
+                burst = _Burst(address=_awaddr, bytes_in_beat=self._size_to_bytes_in_beat(_awsize),
+                               length=_awlen + 1, accepted=cycle,
+                               ready=cycle + 1 + timing.write_latency)
+
+            await clock_re
+            if burst is not None:
+                self._write_bursts.append(burst)
+                self.write_stats.bursts += 1
+                self._write_issued.set()
 
-            self.bus.rvalid.value = 0
+            ready = len(self._write_bursts) < timing.write_outstanding and \
+                not timing.refreshing(cycle + 1)
+
+    async def _write_data(self):
+        clock_re = RisingEdge(self.clock)
+        read_only = ReadOnly()
+        timing = self.timing
+        byteorder = 'big' if self.big_endian else 'little'
+
+        cycle = next_beat = 0
+        while True:
+            if not self._write_bursts:
+                self.bus.wready.value = 0
+                self._write_issued.clear()
+                await self._write_issued.wait()
+                cycle = self._write_bursts[0].accepted
+
+            burst = self._write_bursts[0]
+            ready = cycle + 1 >= max(burst.ready, next_beat) and not timing.refreshing(cycle + 1)
+            self.bus.wready.value = int(ready)
+
+            await read_only
+            cycle = self.cycle
+            if ready and self.bus.wvalid.value:
+                _st = burst.address + burst.done * burst.bytes_in_beat
+                self._memory[_st:_st + burst.bytes_in_beat] = \
+                    int(self.bus.wdata.value).to_bytes(burst.bytes_in_beat, byteorder)
+
+                self.write_stats.record(cycle, burst.bytes_in_beat)
+                next_beat = cycle + timing.beat_interval
+                burst.done += 1
+                if burst.done == burst.length:
+                    self._write_bursts.popleft()
+
+            await clock_re
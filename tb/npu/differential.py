@@ -0,0 +1,117 @@
+import dataclasses
+
+import numpy as np
+
+from hs_npu_model import DEFAULT_PARAMS, compile_dense, dense
+
+# Values the datapath is most likely to get wrong, drawn with EDGE_RATE
+EDGE_VALUES = np.array([-128, -127, -1, 0, 1, 126, 127])
+EDGE_RATE = 0.25
+
+INT32 = np.iinfo(np.int32)
+
+
+@dataclasses.dataclass
+class DiffCase:
+    '''One random layer and the schedule running it.'''
+    index: int
+    inputs: np.ndarray
+    weights: np.ndarray
+    bias: np.ndarray
+    shift: int
+    relu: bool
+    schedule: object = None
+
+
+def _int8(rng, shape):
+    values = rng.integers(-128, 128, shape)
+    edges = rng.random(shape) < EDGE_RATE
+    values[edges] = rng.choice(EDGE_VALUES, np.count_nonzero(edges))
+    return values
+
+
+def _bias(rng, columns):
+    # Mostly accumulator sized, sometimes near the int32 limits to wrap
+    if rng.random() < 0.1:
+        return rng.choice([INT32.min, INT32.min + 1, -1, 0, INT32.max], columns)
+    return rng.integers(-(1 << 20), 1 << 20, columns)
+
+
+def random_cases(count, seed=0, base_address=0, params=DEFAULT_PARAMS):
+    '''
+    count random layers compiled back to back from base_address
+
+    Shapes are non-square and up to three tiles along rows (BUFFER_SIZE) and
+    columns (SIZE), so most layers are one job and the rest exercise REWEIGHT
+    and column tiling. Depth stays within SIZE: deeper layers chain partial
+    sums through the activation unit, which only holds for small values.
+    Shifts cover 0-31 and about half the layers use ReLU.
+    '''
+    rng = np.random.default_rng(seed)
+    size = params.SIZE
+
+    cases = []
+    address = base_address
+    for index in range(count):
+        tiled = rng.random() < 0.2
+        rows = rng.integers(1, (3 if tiled else 1) * params.BUFFER_SIZE + 1)
+        columns = rng.integers(1, (3 if tiled else 1) * size + 1)
+        depth = rng.integers(1, size + 1)
+
+        case = DiffCase(index, _int8(rng, (rows, depth)), _int8(rng, (depth, columns)),
+                        _bias(rng, columns) if rng.random() < 0.8 else None,
+                        shift=int(rng.integers(0, 32)), relu=bool(rng.random() < 0.5))
+        case.schedule = compile_dense(case.inputs, case.weights, case.bias, shift=case.shift,
+                                      relu=case.relu, base_address=address, params=params)
+        address = case.schedule.end_address
+        cases.append(case)
+
+    return cases
+
+
+def reference(cases, params=DEFAULT_PARAMS):
+    '''
+    Golden outputs of every case in one vectorized dense() call
+
+    Cases are zero padded to a common shape, padding rows and columns only
+    add zero products, and cut back to their own shapes afterwards.
+    '''
+    rows = max(case.inputs.shape[0] for case in cases)
+    depth = max(case.inputs.shape[1] for case in cases)
+    columns = max(case.weights.shape[1] for case in cases)
+
+    inputs = np.zeros((len(cases), rows, depth), dtype=np.int64)
+    weights = np.zeros((len(cases), depth, columns), dtype=np.int64)
+    bias = np.zeros((len(cases), columns), dtype=np.int64)
+    for n, case in enumerate(cases):
+        m, k = case.inputs.shape
+        inputs[n, :m, :k] = case.inputs
+        weights[n, :k, :case.weights.shape[1]] = case.weights
+        if case.bias is not None:
+            bias[n, :case.weights.shape[1]] = case.bias
+
+    shift = np.array([case.shift for case in cases])
+    relu = np.array([case.relu for case in cases])
+    outputs = dense(inputs, weights, bias, shift=shift, relu=relu, params=params)
+
+    return [outputs[n, :case.inputs.shape[0], :case.weights.shape[1]]
+            for n, case in enumerate(cases)]
+
+
+def mismatches(cases, outputs, memory):
+    '''(case, expected, got) for every case whose NPU output differs.'''
+    failed = []
+    for case, expected in zip(cases, outputs):
+        got = case.schedule.read_output(memory)
+        if not np.array_equal(got, expected):
+            failed.append((case, expected, got))
+    return failed
+
+
+def describe(case, expected, got):
+    wrong = np.argwhere(got != expected)
+    row, column = wrong[0]
+    return (f'case {case.index}: {case.inputs.shape} @ {case.weights.shape} '
+            f'shift {case.shift}{" relu" if case.relu else ""}'
+            f'{" bias" if case.bias is not None else ""}, {len(wrong)} wrong, '
+            f'first at [{row}, {column}]: expected {expected[row, column]}, got {got[row, column]}')
@@ -0,0 +1,137 @@
+import cocotb
+from cocotb.queue import Queue
+from cocotb.triggers import Event, RisingEdge
+
+from hs_npu_model import CsrMap, ExitCode
+
+
+class NpuError(Exception):
+    def __init__(self, message: str, code: ExitCode):
+        super().__init__(message)
+        self.code = code
+
+
+class NpuDriver:
+    '''
+    Host driver of hs_npu over its AXI4-Lite CSR port
+
+    Jobs are LayerCsrs (see hs_npu_model.compiler) run in submission order.
+    hs_npu_memory_ordering latches the layer CSRs when a job starts, so the
+    next job is programmed while the current one runs and only the INIT write
+    waits for the irq. Registers already holding the right value are not
+    written again. observers (monitors, profilers) get their layer attribute
+    set to the job name right before its INIT write. Every started job is
+    kept in history as (name, csrs), the stimulus a snapshot replays.
+    '''
+
+    def __init__(self, csr_if, irq, csrs=None, observers=()):
+        self.csr_if = csr_if
+        self.irq = irq
+        self.csrs = csrs or CsrMap.from_rdl()
+        self.observers = list(observers)
+        self.exit_codes = []
+        self.history = []
+
+        self._shadow = {}
+        self._running = False
+        self._queue = Queue()
+        self._pending = 0
+        self._idle = Event("npu_idle")
+        self._idle.set()
+        self._worker = None
+        self._error = None
+
+    async def read(self, name):
+        return int(await self.csr_if.read(self.csrs.address(name)))
+
+    async def write(self, name, value):
+        await self._write(self.csrs.address(name), value)
+
+    async def _write(self, address, value):
+        if self._shadow.get(address) == value:
+            return
+        await self.csr_if.write(address, value)
+        self._shadow[address] = value
+
+    async def restore(self, registers):
+        '''Write back CSR values, as returned by registers, after a reset.'''
+        for address, value in registers.items():
+            await self._write(address, value)
+
+    async def program(self, csrs):
+        '''Write a job's layer CSRs, safe while another job is running.'''
+        for address, value in self.csrs.layer_writes(csrs):
+            await self._write(address, value)
+
+    async def start(self, name=None):
+        for observer in self.observers:
+            observer.layer = name
+
+        # INIT is write-one and cleared by hardware, never shadowed
+        await self.csr_if.write(self.csrs.address('MAINCTRL.INIT'), 1)
+        self._running = True
+
+    async def wait(self):
+        '''Wait for the running job, clear its irq and check its exit code.'''
+        if not self._running:
+            return None
+
+        if not self.irq.value:
+            await RisingEdge(self.irq)
+
+        code = ExitCode(await self.read('MAINCTRL.EXITCODE'))
+        await self.csr_if.write(self.csrs.address('MAINCTRL.IRQ'), 1)
+        self._running = False
+        self.exit_codes.append(code)
+
+        if code != ExitCode.SUCCESS:
+            raise NpuError(f'NPU job failed with exit code {code.name}', code)
+        return code
+
+    @property
+    def registers(self):
+        '''CSR address to the value last written there.'''
+        return dict(self._shadow)
+
+    async def run(self, csrs, name=None):
+        '''Program a job behind the running one, then start it.'''
+        await self.program(csrs)
+        await self.wait()
+        await self.start(name)
+        self.history.append((name, csrs))
+
+    def submit(self, csrs, name=None):
+        '''Queue a job for the background worker.'''
+        if self._worker is None:
+            self._worker = cocotb.start_soon(self._work())
+
+        self._pending += 1
+        self._idle.clear()
+        self._queue.put_nowait((csrs, name))
+
+    async def join(self):
+        '''Wait until every submitted job has finished, raising the first error.'''
+        await self._idle.wait()
+
+        error, self._error = self._error, None
+        if error is not None:
+            raise error
+
+    async def _work(self):
+        while True:
+            try:
+                if self._queue.empty():
+                    await self.wait()
+                    if not self._pending:
+                        self._idle.set()
+
+                csrs, name = await self._queue.get()
+                await self.run(csrs, name)
+                self._pending -= 1
+            except NpuError as error:
+                # Drop whatever was queued behind the failed job
+                self._error = error
+                while not self._queue.empty():
+                    self._queue.get_nowait()
+                self._pending = 0
+                self._idle.set()
@@ -0,0 +1,157 @@
+import dataclasses
+import json
+
+import numpy as np
+
+import cocotb
+from cocotb.triggers import RisingEdge, ReadOnly
+
+from hs_npu_model import DEFAULT_PARAMS
+
+
+@dataclasses.dataclass
+class FifoStats:
+    '''Occupancy of one hs_npu_fifo over a run.'''
+    name: str
+    depth: int
+    histogram: np.ndarray = None
+    full_cycles: int = 0
+    empty_cycles: int = 0
+    high_water: int = 0
+    high_water_cycle: int = None
+    layer_high_water: dict = dataclasses.field(default_factory=dict)
+
+    def __post_init__(self):
+        if self.histogram is None:
+            self.histogram = np.zeros(self.depth, dtype=np.int64)
+
+    @property
+    def capacity(self):
+        # One slot always stays free, write_ptr + 1 == read_ptr means full
+        return self.depth - 1
+
+    @property
+    def cycles(self):
+        return int(self.histogram.sum())
+
+    @property
+    def mean(self):
+        return float(self.histogram @ np.arange(self.depth) / self.cycles) if self.cycles else 0.0
+
+    def report(self):
+        return {
+            'depth': self.depth,
+            'capacity': self.capacity,
+            'high_water': self.high_water,
+            'high_water_cycle': self.high_water_cycle,
+            'mean_occupancy': self.mean,
+            'full_cycles': self.full_cycles,
+            'empty_cycles': self.empty_cycles,
+            'histogram': self.histogram.tolist(),
+            'layer_high_water': {str(layer): mark for layer, mark in self.layer_high_water.items()},
+        }
+
+
+def npu_fifos(dut, params=DEFAULT_PARAMS):
+    '''{name: (hs_npu_fifo handle, DEPTH)} for every FIFO of an hs_npu_top_flat.'''
+    inference = dut.hs_npu.inference
+    mm_unit = inference.mm_unit
+    fifos = {}
+    for i in range(params.SIZE):
+        fifos[f'input[{i}]'] = (mm_unit.gen_fifo_gatekeeper_input[i].input_fifo, params.INPUT_FIFO_DEPTH)
+    for i in range(params.SIZE):
+        fifos[f'weight[{i}]'] = (mm_unit.gen_fifo_weight[i].weight_fifo, params.WEIGHT_FIFO_DEPTH)
+    for i in range(params.SIZE):
+        fifos[f'output[{i}]'] = (inference.gen_fifo_output[i].output_fifo, params.OUTPUT_FIFO_DEPTH)
+    return fifos
+
+
+class FifoMonitor:
+    '''
+    Occupancy and backpressure of hs_npu_fifo instances
+
+    Samples each FIFO's pointers and handshakes once per clock in ReadOnly.
+    Occupancy is the number of stored entries, (write_ptr - read_ptr) mod
+    DEPTH, which tops out at DEPTH - 1; the registered out is not counted.
+    A full cycle is one where valid_i is
+    held against a deasserted ready_o, an empty one where the reader is ready
+    but valid_o is low. Set layer to track high-water marks per
+    layer, as NpuDriver does for its observers.
+    '''
+
+    def __init__(self, clock, fifos):
+        self.clock = clock
+        self.cycle = 0
+        self.layer = None
+        self.fifos = {name: FifoStats(name, depth) for name, (_, depth) in fifos.items()}
+        self._signals = [(self.fifos[name], fifo.write_ptr, fifo.read_ptr, fifo.valid_i,
+                          fifo.ready_o, fifo.ready_i, fifo.valid_o)
+                         for name, (fifo, _) in fifos.items()]
+
+        cocotb.start_soon(self._sample())
+
+    async def _sample(self):
+        clock_re = RisingEdge(self.clock)
+        read_only = ReadOnly()
+
+        while True:
+            await clock_re
+            await read_only
+            self.cycle += 1
+
+            for stats, write_ptr, read_ptr, valid_i, ready_o, ready_i, valid_o in self._signals:
+                if not (write_ptr.value.is_resolvable and read_ptr.value.is_resolvable):
+                    continue
+
+                occupancy = (write_ptr.value.integer - read_ptr.value.integer) % stats.depth
+                stats.histogram[occupancy] += 1
+                if occupancy > stats.high_water:
+                    stats.high_water = occupancy
+                    stats.high_water_cycle = self.cycle
+                if occupancy > stats.layer_high_water.get(self.layer, -1):
+                    stats.layer_high_water[self.layer] = occupancy
+
+                if valid_i.value == 1 and ready_o.value == 0:
+                    stats.full_cycles += 1
+                if ready_i.value == 1 and valid_o.value == 0:
+                    stats.empty_cycles += 1
+
+    def summary(self):
+        return {name: stats.report() for name, stats in self.fifos.items()}
+
+    def groups(self):
+        '''
+        Per FIFO kind (the name before [lane]): the worst lane's high-water
+        mark, total full and empty cycles and the smallest DEPTH that would
+        have held the run.
+        '''
+        groups = {}
+        for name, stats in self.fifos.items():
+            kind = name.split('[')[0]
+            group = groups.setdefault(kind, {'depth': stats.depth, 'high_water': 0,
+                                             'full_cycles': 0, 'empty_cycles': 0})
+            group['high_water'] = max(group['high_water'], stats.high_water)
+            group['full_cycles'] += stats.full_cycles
+            group['empty_cycles'] += stats.empty_cycles
+
+        for group in groups.values():
+            # A FIFO that filled up may have needed more, only say it when it did not
+            group['needed_depth'] = group['high_water'] + 1 \
+                if group['full_cycles'] == 0 else None
+        return groups
+
+    def table(self):
+        header = ['fifo', 'depth', 'high water', 'needed depth', 'full cycles', 'empty cycles']
+        rows = [header]
+        for kind, group in self.groups().items():
+            needed = group['needed_depth'] if group['needed_depth'] is not None else f'>{group["depth"]}'
+            rows.append([kind, group['depth'], group['high_water'], needed,
+                         group['full_cycles'], group['empty_cycles']])
+
+        widths = [max(len(str(row[i])) for row in rows) for i in range(len(header))]
+        return '\n'.join('  '.join(str(cell).rjust(width) for cell, width in zip(row, widths))
+                         for row in rows)
+
+    def to_json(self, path):
+        with open(path, 'w') as f:
+            json.dump({'groups': self.groups(), 'fifos': self.summary()}, f, indent=2)
@@ -0,0 +1,184 @@
+import collections
+import csv
+import dataclasses
+import json
+
+from cocotb.triggers import RisingEdge, ReadOnly
+
+from cocotb_bus.monitors import BusMonitor
+
+
+# valid, ready, payload and burst length (address channels) or last (data)
+CHANNELS = {
+    'ar': ('arvalid', 'arready', 'araddr', 'arlen'),
+    'r':  ('rvalid',  'rready',  'rdata',  'rlast'),
+    'aw': ('awvalid', 'awready', 'awaddr', 'awlen'),
+    'w':  ('wvalid',  'wready',  'wdata',  'wlast'),
+    'b':  ('bvalid',  'bready',  'bresp',  None),
+}
+
+# Channels whose beats move data, and the strobe that qualifies it
+DATA_CHANNELS = {'r': None, 'w': 'wstrb'}
+
+
+Handshake = collections.namedtuple(
+    'Handshake', ['cycle', 'layer', 'channel', 'address', 'length', 'data', 'last'])
+
+
+@dataclasses.dataclass
+class ChannelStats:
+    handshakes: int = 0
+    bytes: int = 0
+    stall_cycles: int = 0
+    burst_lengths: collections.Counter = dataclasses.field(default_factory=collections.Counter)
+
+
+@dataclasses.dataclass
+class LayerStats:
+    cycles: int = 0
+    idle_cycles: int = 0
+    idle_gaps: collections.Counter = dataclasses.field(default_factory=collections.Counter)
+    channels: dict = dataclasses.field(
+        default_factory=lambda: {channel: ChannelStats() for channel in CHANNELS})
+
+
+def _high(signal):
+    value = signal.value
+    return value.is_resolvable and bool(int(value))
+
+
+def _int(signal):
+    value = signal.value
+    return int(value) if value.is_resolvable else None
+
+
+class AXIMonitor(BusMonitor):
+    '''
+    Passive AXI4 / AXI4-Lite monitor
+
+    Samples every channel once per clock in ReadOnly and records each
+    handshake, tagged with the current layer. layer is set by the test
+    before starting each job, traffic is aggregated per layer: bytes moved,
+    burst lengths, cycles with valid but not ready and gaps where the bus
+    had nothing valid at all.
+
+    Buses without arlen/awlen are taken to move beats per burst, 1 as
+    AXI4-Lite does unless told otherwise. A length that does not resolve is
+    recorded as None and left out of burst_lengths, and without a strobe or
+    a data signal to size them, beats are not counted in bytes.
+    '''
+    _signals = ["arvalid", "arready", "rvalid", "rready",
+                "awvalid", "awready", "wvalid", "wready"]
+
+    _optional_signals = ["araddr", "arlen", "rdata", "rlast",
+                         "awaddr", "awlen", "wdata", "wlast", "wstrb",
+                         "bvalid", "bready", "bresp"]
+
+    def __init__(self, entity, name, clock, layer=None, beats=1, **kwargs):
+        self.clock = clock
+        self.beats = beats
+        self.cycle = 0
+        self.layer = layer
+        self.handshakes = []
+        self.layers = collections.defaultdict(LayerStats)
+        BusMonitor.__init__(self, entity, name, clock, **kwargs)
+        self.add_callback(self.handshakes.append)
+
+        self._channels = []
+        for channel, (valid, ready, payload, last) in CHANNELS.items():
+            if not (hasattr(self.bus, valid) and hasattr(self.bus, ready)):
+                continue
+
+            signals = [getattr(self.bus, name, None) for name in (valid, ready, payload, last)]
+            strobe = DATA_CHANNELS.get(channel)
+            strobe = getattr(self.bus, strobe, None) if strobe else None
+            self._channels.append((channel, *signals, strobe))
+
+    def _beat_bytes(self, data, strobe):
+        if strobe is not None and strobe.value.is_resolvable:
+            return bin(int(strobe.value)).count('1')
+        return len(data) // 8 if data is not None else 0
+
+    async def _monitor_recv(self):
+        clock_re = RisingEdge(self.clock)
+        read_only = ReadOnly()
+
+        gap = 0
+        while True:
+            await clock_re
+            await read_only
+            self.cycle += 1
+
+            layer = self.layers[self.layer]
+            layer.cycles += 1
+
+            busy = False
+            for channel, valid, ready, payload, last, strobe in self._channels:
+                if not _high(valid):
+                    continue
+
+                busy = True
+                stats = layer.channels[channel]
+                if not _high(ready):
+                    stats.stall_cycles += 1
+                    continue
+
+                stats.handshakes += 1
+                address = length = data = is_last = None
+                if channel in ('ar', 'aw'):
+                    address = _int(payload)
+                    length = _int(last) if last is not None else self.beats - 1
+                    if length is not None:
+                        length += 1
+                        stats.burst_lengths[length] += 1
+                elif channel in DATA_CHANNELS:
+                    data = _int(payload)
+                    is_last = _high(last) if last is not None else True
+                    stats.bytes += self._beat_bytes(payload, strobe)
+                else:
+                    data = _int(payload) if payload is not None else None
+
+                self._recv(Handshake(self.cycle, self.layer, channel, address,
+                                     length, data, is_last))
+
+            if busy:
+                if gap:
+                    layer.idle_gaps[gap] += 1
+                gap = 0
+            else:
+                layer.idle_cycles += 1
+                gap += 1
+
+    def summary(self):
+        '''Per-layer aggregates as plain dicts, as written by to_json().'''
+        summary = {}
+        for name, layer in self.layers.items():
+            channels = {}
+            for channel, stats in layer.channels.items():
+                channels[channel] = {
+                    'handshakes': stats.handshakes,
+                    'bytes': stats.bytes,
+                    'bytes_per_cycle': stats.bytes / layer.cycles if layer.cycles else 0.0,
+                    'stall_cycles': stats.stall_cycles,
+                    'burst_lengths': dict(sorted(stats.burst_lengths.items())),
+                }
+
+            summary[str(name)] = {
+                'cycles': layer.cycles,
+                'idle_cycles': layer.idle_cycles,
+                'idle_gaps': dict(sorted(layer.idle_gaps.items())),
+                'channels': channels,
+            }
+
+        return summary
+
+    def to_csv(self, path):
+        '''Every recorded handshake, one row each.'''
+        with open(path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(Handshake._fields)
+            writer.writerows(self.handshakes)
+
+    def to_json(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.summary(), f, indent=2)
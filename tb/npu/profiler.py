@@ -0,0 +1,202 @@
+import collections
+import dataclasses
+import json
+
+import cocotb
+from cocotb.triggers import RisingEdge, ReadOnly
+
+from hs_npu_model import DEFAULT_PARAMS, CsrMap
+
+
+# loading_state_t of hs_npu_memory_ordering, in encoding order
+STATES = ['IDLE', 'LOADING_WEIGHTS', 'LOADING_INPUTS', 'LOADING_BIAS',
+          'LOADING_SUMS', 'READY_TO_COMPUTE', 'SAVING']
+
+# Reported phases and the states they cover
+PHASES = {
+    'weight_load': ['LOADING_WEIGHTS'],
+    'input_load':  ['LOADING_INPUTS'],
+    'vector_load': ['LOADING_BIAS', 'LOADING_SUMS'],
+    'compute':     ['READY_TO_COMPUTE'],
+    'writeback':   ['SAVING'],
+    'idle':        ['IDLE'],
+}
+
+
+
+@dataclasses.dataclass
+class LayerProfile:
+    name: str
+    rows: int
+    depth: int
+    columns: int
+    size: int
+    init_cycle: int
+    finished_cycle: int = None
+    irq_cycle: int = None
+    states: collections.Counter = dataclasses.field(default_factory=collections.Counter)
+
+    @property
+    def macs(self):
+        return self.rows * self.depth * self.columns
+
+    @property
+    def cycles(self):
+        return self.irq_cycle - self.init_cycle if self.irq_cycle is not None else None
+
+    @property
+    def phases(self):
+        return {phase: sum(self.states[state] for state in states)
+                for phase, states in PHASES.items()}
+
+    @property
+    def cycles_per_mac(self):
+        return self.cycles / self.macs if self.macs else None
+
+    @property
+    def utilization(self):
+        '''Fraction of the SIZE x SIZE MACs busy over the whole layer.'''
+        return self.macs / (self.cycles * self.size ** 2) if self.cycles else None
+
+    @property
+    def bound(self):
+        phases = self.phases
+        memory = phases['weight_load'] + phases['input_load'] + \
+            phases['vector_load'] + phases['writeback']
+        return 'memory' if memory > phases['compute'] else 'compute'
+
+    def report(self):
+        return {
+            'name': self.name,
+            'init_cycle': self.init_cycle,
+            'finished_cycle': self.finished_cycle,
+            'irq_cycle': self.irq_cycle,
+            'cycles': self.cycles,
+            'phases': self.phases,
+            'macs': self.macs,
+            'cycles_per_mac': self.cycles_per_mac,
+            'utilization': self.utilization,
+            'bound': self.bound,
+        }
+
+
+class LayerProfiler:
+    '''
+    Per-layer cycle breakdown of an hs_npu_top_flat run
+
+    Samples the csr bus for dimension and MAINCTRL_INIT writes, the state of
+    hs_npu_memory_ordering and the irq once per clock. A layer starts on its
+    INIT write and ends on the irq, each cycle in between is charged to the
+    memory ordering state it was spent in. Set layer to name the next one.
+    Utilization is over the SIZE x SIZE array of params, the ones the top
+    was elaborated with.
+    '''
+
+    def __init__(self, dut, clock, params=DEFAULT_PARAMS, csr='csr', csrs=None):
+        self.dut = dut
+        self.csrs = csrs or CsrMap.from_rdl()
+        self.clock = clock
+        self.size = params.SIZE
+        self.cycle = 0
+        self.layer = None
+        self.layers = []
+
+        self._csr = {name: getattr(dut, f'{csr}_{name}') for name in (
+            'awvalid', 'awready', 'awaddr', 'wvalid', 'wready', 'wdata')}
+        self._state = dut.hs_npu.memory_ordering.state
+        self._finished = dut.hs_npu.memory_ordering.finished
+        self._irq = dut.irq
+
+        self._registers = {}
+        self._current = None
+
+        cocotb.start_soon(self._sample())
+
+    def _write(self, address, data):
+        csrs = self.csrs
+        self._registers[address] = data
+        if address != csrs.address('MAINCTRL.INIT') or not data & 1:
+            return
+
+        name = self.layer if self.layer is not None else f'layer{len(self.layers)}'
+        self._current = LayerProfile(
+            name=name,
+            rows=self._registers.get(csrs.address('DIMS.INROWS'), 0),
+            depth=self._registers.get(csrs.address('DIMS.WGHTROWS'), 0),
+            columns=self._registers.get(csrs.address('DIMS.WGHTCOLS'), 0),
+            size=self.size,
+            init_cycle=self.cycle,
+        )
+        self.layers.append(self._current)
+        self.layer = None
+
+    async def _sample(self):
+        clock_re = RisingEdge(self.clock)
+        read_only = ReadOnly()
+        csr = self._csr
+
+        address = data = None
+        irq = False
+        while True:
+            await clock_re
+            await read_only
+            self.cycle += 1
+
+            if csr['awvalid'].value == 1 and csr['awready'].value == 1:
+                address = int(csr['awaddr'].value)
+            if csr['wvalid'].value == 1 and csr['wready'].value == 1:
+                data = int(csr['wdata'].value)
+            if address is not None and data is not None:
+                self._write(address, data)
+                address = data = None
+
+            last_irq, irq = irq, self._irq.value == 1
+            layer = self._current
+            if layer is None or layer.init_cycle == self.cycle:
+                continue
+
+            layer.states[STATES[int(self._state.value)]] += 1
+            if self._finished.value == 1:
+                layer.finished_cycle = self.cycle
+
+            # irq is level and may still be set from the previous layer, a
+            # layer that ran ends once it has finished, one that errored
+            # out on the rising edge
+            if irq and (layer.finished_cycle is not None or not last_irq):
+                layer.irq_cycle = self.cycle
+                self._current = None
+
+    def report(self):
+        return [layer.report() for layer in self.layers]
+
+    def table(self):
+        '''Per-layer breakdown as text, one row per layer.'''
+        header = ['layer', 'cycles', *PHASES, 'macs', 'cyc/mac', 'util', 'bound']
+        rows = [header]
+        for layer in self.layers:
+            if layer.cycles is None:
+                continue
+            rows.append([layer.name, layer.cycles, *layer.phases.values(), layer.macs,
+                         f'{layer.cycles_per_mac:.2f}', f'{layer.utilization:.1%}', layer.bound])
+
+        widths = [max(len(str(row[i])) for row in rows) for i in range(len(header))]
+        return '\n'.join('  '.join(str(cell).rjust(width) for cell, width in zip(row, widths))
+                         for row in rows)
+
+    def to_json(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.report(), f, indent=2)
+
+    def to_samples(self, path, history, params):
+        '''
+        Measured jobs for python -m hs_npu_model latency calibrate: the
+        driver history (name, csrs) beside each job's phases. Both record
+        every INIT in order, so the profiler has to be running before the
+        first job.
+        '''
+        jobs = [{'name': name, 'csrs': dataclasses.asdict(csrs),
+                 'cycles': profile.cycles, 'phases': profile.phases}
+                for (name, csrs), profile in zip(history, self.layers)]
+        with open(path, 'w') as f:
+            # CSR values may be NumPy integers from compile_dense
+            json.dump({'params': dataclasses.asdict(params), 'jobs': jobs}, f, indent=2, default=int)
@@ -0,0 +1,94 @@
+import dataclasses
+import json
+
+import numpy as np
+
+from hs_npu_model import LayerCsrs
+
+
+@dataclasses.dataclass
+class Snapshot:
+    '''
+    Host side state of an hs_npu run between two jobs
+
+    The memory image, the CSR values last written and the jobs run so far
+    (the stimulus prefix). Simulator state cannot be saved from cocotb, so a
+    snapshot is resumed on a freshly reset DUT: memory and CSRs are put back
+    and only the jobs whose array state the next one reuses are replayed,
+    with their result writes turned off. Everything else in the prefix is
+    skipped.
+
+    What a resume saves is the prefix, whole jobs at a time. Reset still
+    happens, and the first job after the snapshot loads its weights and
+    inputs like any other unless it reuses them. Nothing is forked per
+    inference: test_hs_npu_stream runs the whole batch through each layer,
+    so its snapshots fall between layers.
+    '''
+    memory: bytes
+    registers: dict
+    jobs: list
+    sim_time_ns: float = 0
+    meta: dict = dataclasses.field(default_factory=dict)
+
+    @classmethod
+    def take(cls, driver, memory, sim_time_ns=0, **meta):
+        '''Snapshot of a driver with no job running and the memory it runs on.'''
+        return cls(bytes(memory), driver.registers, list(driver.history), sim_time_ns, meta)
+
+    def save(self, path):
+        state = {
+            'registers': {str(address): value for address, value in self.registers.items()},
+            'jobs': [(name, dataclasses.asdict(csrs)) for name, csrs in self.jobs],
+            'sim_time_ns': self.sim_time_ns,
+            'meta': self.meta,
+        }
+        np.savez(path, memory=np.frombuffer(self.memory, dtype=np.uint8), state=json.dumps(state))
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            memory = data['memory'].tobytes()
+            state = json.loads(str(data['state']))
+
+        return cls(memory,
+                   {int(address): value for address, value in state['registers'].items()},
+                   [(name, LayerCsrs(**csrs)) for name, csrs in state['jobs']],
+                   state['sim_time_ns'], state['meta'])
+
+    def names(self):
+        '''Names of the jobs in the prefix, for skipping them on resume.'''
+        return {name for name, _ in self.jobs}
+
+    def warmup(self, following=None):
+        '''
+        Prefix jobs to replay before following (a LayerCsrs) so the array
+        holds the weights and inputs it reuses, oldest first.
+        '''
+        if following is None or not self.jobs:
+            return []
+
+        weights = following.reuse_weights
+        inputs = following.reuse_inputs
+        start = len(self.jobs)
+        while (weights or inputs) and start > 0:
+            start -= 1
+            csrs = self.jobs[start][1]
+            weights = weights and csrs.reuse_weights
+            inputs = inputs and csrs.reuse_inputs
+
+        # Warm-up jobs only load operands, their results are already in memory
+        return [(f'warmup.{name}', dataclasses.replace(csrs, save_outputs=False))
+                for name, csrs in self.jobs[start:]]
+
+    def restore(self, memory):
+        '''Copy the memory image back into a buffer at least as large.'''
+        memory[:len(self.memory)] = self.memory
+
+    async def resume(self, driver, memory, following=None):
+        '''Restore memory and CSRs behind a reset DUT, then replay the warm-up.'''
+        self.restore(memory)
+        await driver.restore(self.registers)
+
+        for name, csrs in self.warmup(following):
+            driver.submit(csrs, name)
+        await driver.join()
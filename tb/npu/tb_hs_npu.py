@@ -1,9 +1,30 @@
+import dataclasses
+import json
+import os
+import time
+
+import numpy as np
+
 import cocotb
 from cocotb.triggers import RisingEdge, FallingEdge, Timer, ClockCycles
 from cocotb.regression import TestFactory
 from cocotb.clock import Clock
+from cocotb.utils import get_sim_time
 from cocotb_bus.drivers.amba import AXI4LiteMaster
 from axi import * 
+from monitor import AXIMonitor
+from profiler import LayerProfiler
+from driver import NpuDriver
+from snapshot import Snapshot
+from tracer import TraceRecorder
+from fifos import FifoMonitor, npu_fifos
+from differential import describe, mismatches, random_cases, reference
+
+from hs_npu_model import (ConvLayer, DenseLayer, LayerCsrs, MemoryImage, MemoryPlan, NpuParams,
+                          Stage, TransactionModel, compile_conv, compile_dense, conv2d, dense,
+                          plan, predict_dense, run_network)
+from hs_npu_model.fusion import report as fusion_report
+from hs_npu_model.latency import predict_jobs
 
 # Constants
 CLK_PERIOD = 10  # Clock period in ns
@@ -55,6 +76,54 @@ weights_418 = [
 
 biases_418 = [-128, -12, 127, 0, 0, 0, 0, 0]
 
+# The same network for the streaming test, weights back in (inputs, outputs)
+# order since the rows above are stored bottom-up
+stream_layers = {
+    'dense_416': DenseLayer(np.array(matrixB_data)[::-1], np.array(bias_vector), shift=7, relu=True),
+    'dense_417': DenseLayer(np.array(weights_417)[::-1], np.array(biases_417), shift=7, relu=True),
+    'dense_418': DenseLayer(np.array(weights_418)[::-1, :3], np.array(biases_418[:3])),
+}
+
+
+def stream_inputs():
+    '''HS_NPU_STREAM_CSV (one int8 input vector per line) or random vectors.'''
+    path = os.environ.get('HS_NPU_STREAM_CSV')
+    if path:
+        return np.loadtxt(path, delimiter=',', ndmin=2, dtype=np.int64)
+
+    length = int(os.environ.get('HS_NPU_STREAM_LENGTH', 256))
+    return np.random.default_rng(0).integers(-128, 128, (length, 4))
+
+
+def bench_params():
+    '''HS_NPU_PARAMS (NAME=value,... as elaborated on the top) over the RTL defaults.'''
+    overrides = os.environ.get('HS_NPU_PARAMS', '')
+    overrides = dict(item.split('=') for item in overrides.split(',') if item)
+    return NpuParams.from_rtl(**{name: int(value, 0) for name, value in overrides.items()})
+
+
+def bench_layers(params):
+    '''
+    HS_NPU_BENCH_LAYERS (inputs x outputs per layer) with random int8 weights
+
+    Layers deeper than SIZE chain partial sums through the activation output,
+    their weights are drawn no larger than keeps every partial sum of int8
+    inputs within it.
+    '''
+    shapes = os.environ.get('HS_NPU_BENCH_LAYERS', '32x32,32x16,16x10')
+    limit = (1 << (params.ACTIVATION_OUTPUT_WIDTH - 1)) - 1
+    bias = 1024
+    rng = np.random.default_rng(1)
+    layers = {}
+    for n, shape in enumerate(shapes.split(',')):
+        depth, columns = (int(x) for x in shape.split('x'))
+        chained = (-(-depth // params.SIZE) - 1) * params.SIZE
+        largest = min(128, (limit - bias) // (128 * chained)) if chained else 128
+        layers[f'bench{n}_{depth}x{columns}'] = DenseLayer(
+            rng.integers(-largest, largest, (depth, columns)), rng.integers(-bias, bias, columns),
+            shift=8, relu=True)
+    return layers
+
 @cocotb.test()
 async def test_hs_npu(dut):
     """Test hs_npu module."""
@@ -67,132 +136,434 @@ async def test_hs_npu(dut):
     await ClockCycles(dut.clk_npu, 5)
     dut.rst_n.value = 1
 
-    # # Create an empty bytearray
-    # memory = bytearray(b'\xc6\xd1+\xc7\xcb^"m\xdd\x80\xe65\xec\xfb\x7f\xafb\n\r\xf1\xd5ED%U%\xfd\x8d\x92\x9e_\xf2')
+    # Lay out each layer's operands contiguously from its base address,
+    # results follow them, every region starting on a memory line
+    image = MemoryImage()
+    image.weights('dense_416.weights', matrixB_data)
+    image.inputs('inputs', matrixA_data)
+    image.words('dense_416.bias', bias_vector)
+    image.words('dense_416.sums', sums_vector)
+    image.weights('dense_417.weights', weights_417)
+    image.words('dense_417.bias', biases_417)
+    image.weights('dense_418.weights', weights_418)
+    image.words('dense_418.bias', biases_418)
+
+    image.reserve('dense_416.result', (len(matrixA_data), 8))
+    image.reserve('dense_417.result', (len(matrixA_data), 8))
+    image.reserve('dense_418.result', (len(matrixA_data), 8))
+
+    # Set HS_NPU_IMAGE to build into a file, results stay there after the run
+    image_path = os.environ.get('HS_NPU_IMAGE')
+    image = image.build_file(image_path) if image_path else image.build()
+    print(image.symbols)
+
+    memory = image.memory
 
-    memory = bytearray();
+    # Initialize AXI4-Lite and AXI4 burst interfaces
+    csr_if = AXI4LiteMaster(dut, "csr", dut.clk_npu, case_insensitive=True)
+    mem_if = AXI4Agent(dut, "mem", dut.clk_npu, memory, case_insensitive=False)
 
-    # Flatten matrix B and matrix A as int8 values (1 byte each)
-    for row in matrixB_data:
-        for byte in row:
-            memory.append(byte & 0xFF)  # Convert to 8-bit
+    # Passive monitors, traffic is tagged with the layer being run
+    params = bench_params()
+    csr_mon = AXIMonitor(dut, "csr", dut.clk_npu, case_insensitive=True)
+    mem_mon = AXIMonitor(dut, "mem", dut.clk_npu, beats=params.beats, case_insensitive=False)
+    profiler = LayerProfiler(dut, dut.clk_npu, params)
+    fifo_mon = FifoMonitor(dut.clk_npu, npu_fifos(dut))
+
+    # HS_NPU_TRACE lists signals below the top to sample each cycle into
+    # HS_NPU_TRACE_DIR, e.g. hs_npu.inference.mm_unit.systolic_array.result
+    tracer = None
+    if os.environ.get('HS_NPU_TRACE'):
+        tracer = TraceRecorder(dut, dut.clk_npu, os.environ['HS_NPU_TRACE'].split(','),
+                               os.environ.get('HS_NPU_TRACE_DIR', 'trace'))
+
+    driver = NpuDriver(csr_if, dut.irq, observers=(csr_mon, mem_mon, profiler, fifo_mon))
+
+    # Layers 2 and 3 take the previous layer's results as their inputs
+    layers = {
+        'dense_416': LayerCsrs(num_input_rows=4, num_input_columns=8,
+                               num_weight_rows=4, num_weight_columns=8,
+                               use_bias=True, use_sum=True, shift_amount=7,
+                               activation_select=True),
+        'dense_417': LayerCsrs(num_input_rows=4, num_input_columns=8,
+                               num_weight_rows=8, num_weight_columns=8,
+                               reuse_inputs=True, use_bias=True, shift_amount=7,
+                               activation_select=True),
+        'dense_418': LayerCsrs(num_input_rows=4, num_input_columns=8,
+                               num_weight_rows=8, num_weight_columns=3,
+                               reuse_inputs=True, use_bias=True),
+    }
+
+    for name, csrs in layers.items():
+        csrs.base_address = image.symbols[f'{name}.weights']
+        csrs.result_address = image.symbols[f'{name}.result']
+        driver.submit(csrs, name)
+
+    await driver.join()
 
-    for row in matrixA_data:
-        for byte in row:
-            memory.append(byte & 0xFF)  # Convert to 8-bit
+    await ClockCycles(dut.clk_npu, 10)
 
-    # Add bias and sums vectors as int32 values (4 bytes each)
-    for bias in bias_vector:
-        memory.extend(bias.to_bytes(4, byteorder='little', signed=True))
+    mem_if.flush()
+    print(mem_if.report())
 
-    for sum_val in sums_vector:
-        memory.extend(sum_val.to_bytes(4, byteorder='little', signed=True))
+    for monitor in (csr_mon, mem_mon):
+        monitor.to_csv(f'{monitor.name}_transactions.csv')
+        monitor.to_json(f'{monitor.name}_stats.json')
 
-    # Flatten and add weights_417 as int8 values (1 byte each)
-    for row in weights_417:
-        for value in row:
-            memory.append(value & 0xFF)  # Convert to 8-bit
+    print(profiler.table())
+    profiler.to_json('layer_profile.json')
+    profiler.to_samples('latency_samples.json', driver.history, NpuParams.from_rtl())
 
-    # Add biases_417 as int32 values (4 bytes each)
-    for bias in biases_417:
-        memory.extend(bias.to_bytes(4, byteorder='little', signed=True))
+    print(fifo_mon.table())
+    fifo_mon.to_json('fifo_occupancy.json')
 
-    # Flatten and add weights_418 as int8 values (1 byte each)
-    for row in weights_418:
-        for value in row:
-            memory.append(value & 0xFF)  # Convert to 8-bit
+    if tracer is not None:
+        tracer.stop()
 
-    # Add biases_418 as int32 values (4 bytes each)
-    for bias in biases_418:
-        memory.extend(bias.to_bytes(4, byteorder='little', signed=True))
+    print(image['dense_418.result'])
 
 
-    print(memory)
+@cocotb.test()
+async def test_hs_npu_stream(dut):
+    """Stream a batch of inferences through the network, BUFFER_SIZE rows per job."""
+    clock = Clock(dut.clk_npu, CLK_PERIOD, units="ns")
+    cocotb.start_soon(clock.start())
+
+    dut.rst_n.value = 0
+    await ClockCycles(dut.clk_npu, 5)
+    dut.rst_n.value = 1
 
-    memory = memoryview(memory)
+    inputs = stream_inputs()
+
+    # Layers whose intermediates fit the output FIFOs are fused into one
+    # stage through REINPUT, only the stage's last layer writes to memory.
+    # Other layers run on their own so their weights stay in the array
+    # across all chunks (REWEIGHT). Activations go back to memory between
+    # stages as int8 rows, saturated by the host. HS_NPU_FUSE=0 runs every
+    # layer on its own. Shapes fix the layout, so it is planned once up
+    # front and each stage compiled at its turn.
+    if os.environ.get('HS_NPU_FUSE', '1') != '0':
+        stages = plan(stream_layers, len(inputs))
+    else:
+        stages = [Stage([name]) for name in stream_layers]
+    for stage in fusion_report(stages, stream_layers, len(inputs)):
+        print(f"{stage['stage']}: {stage['read_bytes'] + stage['write_bytes']} AXI bytes, "
+              f"{stage['saved_bytes']} saved by fusion")
+
+    # Stages only share memory when their buffers are never live together
+    memory_plan = MemoryPlan(stages, stream_layers, len(inputs))
+    print(memory_plan.table())
+    memory = bytearray(memory_plan.end_address)
 
-    # Initialize AXI4-Lite and AXI4 burst interfaces
     csr_if = AXI4LiteMaster(dut, "csr", dut.clk_npu, case_insensitive=True)
     mem_if = AXI4Agent(dut, "mem", dut.clk_npu, memory, case_insensitive=False)
-    
-    ARCHID_REG_ADDR            = 0x00
-    IMPID_REG_ADDR             = 0x04
-    NUM_ROWS_INPUT_REG_ADDR    = 0x08
-    NUM_COLS_INPUT_REG_ADDR    = 0x0C
-    NUM_ROWS_WEIGHT_REG_ADDR   = 0x10
-    NUM_COLS_WEIGHT_REG_ADDR   = 0x14
-    REINPUT_REG_ADDR           = 0x18
-    REWEIGHT_REG_ADDR          = 0x1C
-    SAVEOUT_REG_ADDR           = 0x20
-    USE_BIAS_REG_ADDR          = 0x24
-    USE_SUMM_REG_ADDR          = 0x28
-    SHIFT_AMT_REG_ADDR         = 0x2C
-    ACT_FN_REG_ADDR            = 0x30
-    BASE_MEMADDR_REG_ADDR      = 0x34
-    RESULT_MEMADDR_REG_ADDR    = 0x38
-    MAINCTRL_INIT_REG_ADDR     = 0x3C
-    EXIT_CODE_REG_ADDR         = 0x40
-
-    await csr_if.write(NUM_ROWS_INPUT_REG_ADDR, 4)
-    await csr_if.write(NUM_COLS_INPUT_REG_ADDR, 8)
-    await csr_if.write(NUM_ROWS_WEIGHT_REG_ADDR, 4)
-    await csr_if.write(NUM_COLS_WEIGHT_REG_ADDR, 8)
-
-    await csr_if.write(REINPUT_REG_ADDR, 0)
-    await csr_if.write(REWEIGHT_REG_ADDR, 0)
-    await csr_if.write(SAVEOUT_REG_ADDR, 1)
-    await csr_if.write(USE_BIAS_REG_ADDR, 1)
-    await csr_if.write(USE_SUMM_REG_ADDR, 1)
-    await csr_if.write(SHIFT_AMT_REG_ADDR, 7)
-    await csr_if.write(ACT_FN_REG_ADDR, 1)
-
-    await csr_if.write(BASE_MEMADDR_REG_ADDR, 0)
-    await csr_if.write(RESULT_MEMADDR_REG_ADDR, 1000)
-
-    await csr_if.write(MAINCTRL_INIT_REG_ADDR, 1)
-
-
-    await RisingEdge(dut.irq)
-
-    await csr_if.write(NUM_ROWS_INPUT_REG_ADDR, 4)
-    await csr_if.write(NUM_COLS_INPUT_REG_ADDR, 8)
-    await csr_if.write(NUM_ROWS_WEIGHT_REG_ADDR, 8)
-    await csr_if.write(NUM_COLS_WEIGHT_REG_ADDR, 8)
-
-    await csr_if.write(REINPUT_REG_ADDR, 1)
-    await csr_if.write(REWEIGHT_REG_ADDR, 0)
-    await csr_if.write(SAVEOUT_REG_ADDR, 1)
-    await csr_if.write(USE_BIAS_REG_ADDR, 1)
-    await csr_if.write(USE_SUMM_REG_ADDR, 0)
-    await csr_if.write(SHIFT_AMT_REG_ADDR, 7)
-    await csr_if.write(ACT_FN_REG_ADDR, 1)
-
-    await csr_if.write(BASE_MEMADDR_REG_ADDR, 128)
-    await csr_if.write(RESULT_MEMADDR_REG_ADDR, 2000)
-
-    await csr_if.write(MAINCTRL_INIT_REG_ADDR, 1)
-
-
-    await RisingEdge(dut.irq)
-
-    await csr_if.write(NUM_ROWS_INPUT_REG_ADDR, 4)
-    await csr_if.write(NUM_COLS_INPUT_REG_ADDR, 8)
-    await csr_if.write(NUM_ROWS_WEIGHT_REG_ADDR, 8)
-    await csr_if.write(NUM_COLS_WEIGHT_REG_ADDR, 3)
-
-    await csr_if.write(REINPUT_REG_ADDR, 1)
-    await csr_if.write(REWEIGHT_REG_ADDR, 0)
-    await csr_if.write(SAVEOUT_REG_ADDR, 1)
-    await csr_if.write(USE_BIAS_REG_ADDR, 1)
-    await csr_if.write(USE_SUMM_REG_ADDR, 0)
-    await csr_if.write(SHIFT_AMT_REG_ADDR, 0)
-    await csr_if.write(ACT_FN_REG_ADDR, 0)
-
-    await csr_if.write(BASE_MEMADDR_REG_ADDR, 224)
-    await csr_if.write(RESULT_MEMADDR_REG_ADDR, 3000)
-
-    await csr_if.write(MAINCTRL_INIT_REG_ADDR, 1)
-
-    await RisingEdge(dut.irq)
+    driver = NpuDriver(csr_if, dut.irq)
+
+    # HS_NPU_SNAPSHOTS saves a snapshot after every stage, HS_NPU_RESUME
+    # starts from one and skips the stages it already ran. The DUT is still
+    # reset and the next stage loads its weights as usual
+    snapshots = os.environ.get('HS_NPU_SNAPSHOTS')
+    snapshot = None
+    if os.environ.get('HS_NPU_RESUME'):
+        snapshot = Snapshot.load(os.environ['HS_NPU_RESUME'])
+        snapshot.restore(memory)
+
+    activations = expected = inputs
+    skipped = None
+    npu_ns = 0
+    wall = time.perf_counter()
+    for index, stage in enumerate(stages):
+        name = stage.name
+        layers = [stream_layers[layer] for layer in stage.names]
+        schedule = memory_plan.compile(index, activations)
+        if snapshot is not None and name in snapshot.names():
+            # Later stages may reuse this stage's buffers, only the last
+            # stage in the snapshot still has its outputs in memory
+            activations = expected = np.clip(run_network(expected, layers), -128, 127)
+            skipped, skipped_name = schedule, name
+            continue
+        if snapshot is not None:
+            if skipped is not None:
+                assert (np.clip(skipped.read_output(memory), -128, 127) == expected).all(), \
+                    f'{skipped_name} in the snapshot is not this workload'
+            await snapshot.resume(driver, memory, schedule.jobs[0].csrs)
+            npu_ns += snapshot.sim_time_ns
+            snapshot = None
+
+        schedule.write(memory)
+
+        start = get_sim_time('ns')
+        for job in schedule.jobs:
+            driver.submit(job.csrs, name)
+        await driver.join()
+        npu_ns += get_sim_time('ns') - start
+
+        activations = np.clip(schedule.read_output(memory), -128, 127)
+        expected = np.clip(run_network(expected, layers), -128, 127)
+        assert (activations == expected).all(), f'{name} results differ from the golden model'
+
+        if snapshots:
+            os.makedirs(snapshots, exist_ok=True)
+            Snapshot.take(driver, memory, npu_ns, layer=name).save(os.path.join(snapshots, f'{name}.npz'))
+
+    wall = time.perf_counter() - wall
+    print(f'{len(inputs)} inferences in {npu_ns / CLK_PERIOD:.0f} cycles: '
+          f'{len(inputs) / (npu_ns * 1e-9):.0f} inferences/s at {1e3 / CLK_PERIOD:.0f} MHz, '
+          f'{len(inputs) / wall:.1f} inferences/s simulated')
+    print(mem_if.report())
 
-    await ClockCycles(dut.clk_npu, 10)
+
+@cocotb.test()
+async def test_hs_npu_differential(dut):
+    """Thousands of random layers in one session, checked against the golden model."""
+    clock = Clock(dut.clk_npu, CLK_PERIOD, units="ns")
+    cocotb.start_soon(clock.start())
+
+    dut.rst_n.value = 0
+    await ClockCycles(dut.clk_npu, 5)
+    dut.rst_n.value = 1
+
+    # HS_NPU_DIFF_SEED reproduces a failing run, case indices stay the same
+    count = int(os.environ.get('HS_NPU_DIFF_CASES', 2000))
+    seed = int(os.environ.get('HS_NPU_DIFF_SEED', 0))
+    cases = random_cases(count, seed)
+    expected = reference(cases)
+    dut._log.info(f'{count} cases, {sum(len(case.schedule.jobs) for case in cases)} jobs, seed {seed}')
+
+    # predict_dense counts jobs analytically, it has to agree with the schedules
+    for case in cases:
+        rows, depth = case.inputs.shape
+        assert predict_dense(rows, depth, case.weights.shape[1], case.bias is not None) == \
+            predict_jobs(case.schedule.jobs), f'case {case.index}: predict_dense counts other jobs'
+
+    # Every case has its own region, so the whole batch is written up front
+    # and the jobs go back to back without host round trips in between
+    memory = bytearray(cases[-1].schedule.end_address)
+    for case in cases:
+        case.schedule.write(memory)
+
+    # The transaction-level model runs the same jobs on its own copy, every
+    # byte the NPU writes has to match, padding lanes included
+    model_memory = bytearray(memory)
+    model = TransactionModel(model_memory)
+    model_wall = time.perf_counter()
+    for case in cases:
+        model.run_all(job.csrs for job in case.schedule.jobs)
+    model_wall = time.perf_counter() - model_wall
+
+    csr_if = AXI4LiteMaster(dut, "csr", dut.clk_npu, case_insensitive=True)
+    mem_if = AXI4Agent(dut, "mem", dut.clk_npu, memory, case_insensitive=False)
+    driver = NpuDriver(csr_if, dut.irq)
+
+    wall = time.perf_counter()
+    npu_ns = get_sim_time('ns')
+    for case in cases:
+        for job in case.schedule.jobs:
+            driver.submit(job.csrs, f'case{case.index}')
+    await driver.join()
+    npu_ns = get_sim_time('ns') - npu_ns
+    wall = time.perf_counter() - wall
+
+    dut._log.info(f'transaction model: {model.cycles} cycles estimated, '
+                  f'{npu_ns / CLK_PERIOD:.0f} simulated, {wall / model_wall:.0f}x faster')
+    differ = np.flatnonzero(np.frombuffer(memory, np.uint8) != np.frombuffer(model_memory, np.uint8))
+    if len(differ):
+        dut._log.error(f'{len(differ)} bytes differ from the transaction model, first at {differ[0]:#x}')
+
+    failed = mismatches(cases, expected, memory)
+    for failure in failed[:20]:
+        dut._log.error(describe(*failure))
+    dut._log.info(f'{count - len(failed)}/{count} cases match, {count / wall:.1f} cases/s simulated')
+    assert not failed, f'{len(failed)} of {count} cases differ from the golden model (seed {seed})'
+    assert not len(differ), 'memory differs from the transaction model'
+
+
+@cocotb.test()
+async def test_hs_npu_deep(dut):
+    """A full range int8 layer deeper than SIZE, partial sums chained through USE_SUMM."""
+    clock = Clock(dut.clk_npu, CLK_PERIOD, units="ns")
+    cocotb.start_soon(clock.start())
+
+    dut.rst_n.value = 0
+    await ClockCycles(dut.clk_npu, 5)
+    dut.rst_n.value = 1
+
+    params = NpuParams.from_rtl()
+    size = params.SIZE
+    rng = np.random.default_rng(3)
+    inputs = rng.integers(-128, 128, (6, 3 * size))
+    weights = rng.integers(-128, 128, (3 * size, 10))
+    bias = rng.integers(-1024, 1024, 10)
+
+    # Partial sums go through the 16 bit activation output between depth
+    # tiles, full range operands overflow it and the compiler must refuse
+    try:
+        compile_dense(inputs, weights, bias, params=params)
+    except ValueError as error:
+        dut._log.info(f'overflowing layer refused: {error}')
+    else:
+        assert False, 'a layer with overflowing partial sums was compiled'
+
+    # Only one weight per column ahead of the last depth tile: every
+    # product is still full range, yet the partial sums fit
+    keep = rng.integers(0, 2 * size, 10)
+    weights[:2 * size] *= np.arange(2 * size)[:, None] == keep
+    weights[keep, np.arange(10)] = rng.choice([-128, 127], 10)
+    inputs[:, keep] = -128
+    schedule = compile_dense(inputs, weights, bias, shift=4, relu=True, params=params)
+    expected = dense(inputs, weights, bias, shift=4, relu=True, params=params)
+    assert predict_dense(*inputs.shape, weights.shape[1], params=params) == \
+        predict_jobs(schedule.jobs, params), 'predict_dense counts other chained jobs'
+
+    memory = bytearray(schedule.end_address)
+    schedule.write(memory)
+    model_memory = bytearray(memory)
+    TransactionModel(model_memory, params=params).run_all(job.csrs for job in schedule.jobs)
+
+    csr_if = AXI4LiteMaster(dut, "csr", dut.clk_npu, case_insensitive=True)
+    mem_if = AXI4Agent(dut, "mem", dut.clk_npu, memory, case_insensitive=False)
+    driver = NpuDriver(csr_if, dut.irq)
+    for job in schedule.jobs:
+        driver.submit(job.csrs, 'deep')
+    await driver.join()
+
+    assert (schedule.read_output(memory) == expected).all(), 'results differ from the golden model'
+    assert memory == model_memory, 'memory differs from the transaction model'
+
+
+@cocotb.test()
+async def test_hs_npu_conv(dut):
+    """Conv2D layers lowered through im2col, strided, padded and 3x3 deep."""
+    clock = Clock(dut.clk_npu, CLK_PERIOD, units="ns")
+    cocotb.start_soon(clock.start())
+
+    dut.rst_n.value = 0
+    await ClockCycles(dut.clk_npu, 5)
+    dut.rst_n.value = 1
+
+    params = NpuParams.from_rtl()
+    rng = np.random.default_rng(4)
+    inputs = rng.integers(-128, 128, (1, 8, 8, 2))
+
+    # A full range 3x3 kernel has more taps than SIZE, its partial sums
+    # overflow the 16 bit activation output and the compiler must refuse it
+    deep = ConvLayer(rng.integers(-128, 128, (3, 3, 2, 4)), padding='same')
+    try:
+        compile_conv(inputs, deep, params=params)
+    except ValueError as error:
+        dut._log.info(f'overflowing 3x3 kernel refused: {error}')
+    else:
+        assert False, 'a 3x3 kernel with overflowing partial sums was compiled'
+
+    # Full range within SIZE taps, and a 3x3 kernel small enough to chain
+    layers = {
+        'conv2x2': (inputs, ConvLayer(rng.integers(-128, 128, (2, 2, 2, 6)),
+                                      rng.integers(-1024, 1024, 6), stride=2, padding='same',
+                                      shift=6, relu=True)),
+        'conv3x3': (inputs >> 4, ConvLayer(rng.integers(-8, 8, (3, 3, 2, 4)),
+                                           rng.integers(-64, 64, 4), padding=1, dilation=(2, 1),
+                                           shift=2)),
+    }
+
+    schedules = {}
+    address = 0
+    for name, (data, layer) in layers.items():
+        schedules[name] = compile_conv(data, layer, base_address=address, params=params)
+        address = schedules[name].schedule.end_address
+
+    memory = bytearray(address)
+    for schedule in schedules.values():
+        schedule.write(memory)
+    model_memory = bytearray(memory)
+    model = TransactionModel(model_memory, params=params)
+
+    csr_if = AXI4LiteMaster(dut, "csr", dut.clk_npu, case_insensitive=True)
+    mem_if = AXI4Agent(dut, "mem", dut.clk_npu, memory, case_insensitive=False)
+    driver = NpuDriver(csr_if, dut.irq)
+    for name, schedule in schedules.items():
+        model.run_all(job.csrs for job in schedule.schedule.jobs)
+        for job in schedule.schedule.jobs:
+            driver.submit(job.csrs, name)
+    await driver.join()
+
+    for name, (data, layer) in layers.items():
+        expected = conv2d(data, layer, params)
+        assert (schedules[name].read_output(memory) == expected).all(), \
+            f'{name} results differ from the golden model'
+    assert memory == model_memory, 'memory differs from the transaction model'
+
+
+# tb/bench.py opts in by setting HS_NPU_BENCH_LAYERS. Plain runs of the
+# package skip it, the other tests already cover what it checks
+@cocotb.test(skip='HS_NPU_BENCH_LAYERS' not in os.environ)
+async def test_hs_npu_benchmark(dut):
+    """Run the benchmark workload on whatever parameters the top was elaborated with."""
+    clock = Clock(dut.clk_npu, CLK_PERIOD, units="ns")
+    cocotb.start_soon(clock.start())
+
+    dut.rst_n.value = 0
+    await ClockCycles(dut.clk_npu, 5)
+    dut.rst_n.value = 1
+
+    params = bench_params()
+    layers = bench_layers(params)
+    rows = int(os.environ.get('HS_NPU_BENCH_ROWS', 32))
+    inputs = np.random.default_rng(2).integers(-128, 128, (rows, next(iter(layers.values())).weights.shape[0]))
+
+    bases = {}
+    address = 0
+    for name, layer in layers.items():
+        bases[name] = address
+        placeholder = np.zeros((rows, layer.weights.shape[0]), dtype=np.int64)
+        address = compile_dense(placeholder, layer.weights, layer.bias, base_address=address,
+                                params=params).end_address
+
+    memory = bytearray(address)
+
+    csr_if = AXI4LiteMaster(dut, "csr", dut.clk_npu, case_insensitive=True)
+    mem_if = AXI4Agent(dut, "mem", dut.clk_npu, memory, case_insensitive=False)
+    mem_mon = AXIMonitor(dut, "mem", dut.clk_npu, beats=params.beats, case_insensitive=False)
+    profiler = LayerProfiler(dut, dut.clk_npu, params)
+    driver = NpuDriver(csr_if, dut.irq, observers=(mem_mon, profiler))
+
+    report = {'params': dataclasses.asdict(params), 'rows': rows, 'layers': []}
+    activations = expected = inputs
+    for name, layer in layers.items():
+        schedule = compile_dense(activations, layer.weights, layer.bias, shift=layer.shift,
+                                 relu=layer.relu, base_address=bases[name], params=params)
+        schedule.write(memory)
+
+        wall = time.perf_counter()
+        for job in schedule.jobs:
+            driver.submit(job.csrs, name)
+        await driver.join()
+        wall = time.perf_counter() - wall
+
+        activations = np.clip(schedule.read_output(memory), -128, 127)
+        expected = np.clip(dense(expected, layer.weights, layer.bias, shift=layer.shift,
+                                 relu=layer.relu, params=params), -128, 127)
+        assert (activations == expected).all(), f'{name} results differ from the golden model'
+
+        # A layer is several jobs, the profiler and monitor see each of them
+        jobs = [profile for profile in profiler.layers if profile.name == name]
+        cycles = sum(profile.cycles or 0 for profile in jobs)
+        macs = rows * layer.weights.size
+        traffic = mem_mon.summary().get(name, {}).get('channels', {})
+        report['layers'].append({
+            'name': name,
+            'jobs': len(jobs),
+            'cycles': cycles,
+            'macs': macs,
+            'utilization': macs / (cycles * params.SIZE ** 2) if cycles else None,
+            'read_bytes': traffic.get('r', {}).get('bytes', 0),
+            'write_bytes': traffic.get('w', {}).get('bytes', 0),
+            'wall_time': wall,
+        })
+
+    print(json.dumps(report, indent=2))
+    # Next to results.xml, where tb/bench.py collects it
+    results = os.environ.get('COCOTB_RESULTS_FILE', 'results.xml')
+    with open(os.path.join(os.path.dirname(results), 'benchmark.json'), 'w') as f:
+        json.dump(report, f, indent=2)
+    profiler.to_samples(os.path.join(os.path.dirname(results), 'latency_samples.json'),
+                        driver.history, params)
@@ -0,0 +1,163 @@
+import json
+import pathlib
+import re
+
+import numpy as np
+
+import cocotb
+from cocotb.handle import NonHierarchyIndexableObject
+from cocotb.triggers import RisingEdge, ReadOnly
+
+# Stored for X/Z samples, raw values are never negative
+UNRESOLVED = -1
+
+_INDEX = re.compile(r'(\w+)((?:\[\d+\])*)')
+
+
+def resolve(dut, path):
+    '''Handle for a dotted path below dut, unpacked array elements as name[i].'''
+    handle = dut
+    for part in path.split('.'):
+        match = _INDEX.fullmatch(part)
+        if match is None:
+            raise ValueError(f'bad signal path {path!r}')
+        handle = getattr(handle, match.group(1))
+        for index in re.findall(r'\d+', match.group(2)):
+            handle = handle[int(index)]
+    return handle
+
+
+def _leaves(path, handle):
+    # Unpacked arrays (systolic results, FIFO rows) become one column per
+    # element, packed vectors stay whole
+    if not isinstance(handle, NonHierarchyIndexableObject):
+        return [(path, handle)]
+    return [leaf for i, element in enumerate(handle) for leaf in _leaves(f'{path}[{i}]', element)]
+
+
+class TraceRecorder:
+    '''
+    Samples a list of hierarchical signals once per clock into columns
+
+    signals are dotted paths below dut (hs_npu.inference.mm_unit.systolic_array.result),
+    arrays are expanded to one column per element. Samples land in a
+    preallocated (chunk, columns) int64 buffer, written as one npz file per
+    full chunk when directory is given and kept in memory otherwise. Values
+    are raw, unsigned bit patterns, UNRESOLVED for X or Z, see Trace.signed().
+    Only cycles with enabled set are recorded.
+    '''
+
+    def __init__(self, dut, clock, signals, directory=None, chunk=4096):
+        self.clock = clock
+        self.enabled = True
+        self.cycle = 0
+
+        self._handles = []
+        for path in signals:
+            self._handles.extend(_leaves(path, resolve(dut, path)))
+        self.columns = ['cycle'] + [name for name, _ in self._handles]
+        self.widths = {name: len(handle) for name, handle in self._handles}
+
+        self.directory = pathlib.Path(directory) if directory is not None else None
+        self.chunks = []
+        self._written = 0
+        self._buffer = np.empty((chunk, len(self.columns)), dtype=np.int64)
+        self._fill = 0
+
+        if self.directory is not None:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            with open(self.directory / 'columns.json', 'w') as f:
+                json.dump({'columns': self.columns, 'widths': self.widths}, f, indent=2)
+
+        self._sampler = cocotb.start_soon(self._sample())
+
+    async def _sample(self):
+        clock_re = RisingEdge(self.clock)
+        read_only = ReadOnly()
+        handles = [handle for _, handle in self._handles]
+        buffer = self._buffer
+
+        while True:
+            await clock_re
+            await read_only
+            self.cycle += 1
+            if not self.enabled:
+                continue
+
+            row = buffer[self._fill]
+            row[0] = self.cycle
+            for column, handle in enumerate(handles, 1):
+                value = handle.value
+                row[column] = value.integer if value.is_resolvable else UNRESOLVED
+
+            self._fill += 1
+            if self._fill == len(buffer):
+                self.flush()
+
+    def flush(self):
+        '''Hand off the samples taken so far as one chunk.'''
+        if not self._fill:
+            return
+
+        chunk = {name: self._buffer[:self._fill, column].copy()
+                 for column, name in enumerate(self.columns)}
+        if self.directory is None:
+            self.chunks.append(chunk)
+        else:
+            np.savez(self.directory / f'chunk_{self._written:05}.npz', **chunk)
+        self._written += 1
+        self._fill = 0
+
+    def stop(self):
+        '''Stop sampling and flush what is left.'''
+        self._sampler.kill()
+        self.flush()
+
+    def trace(self):
+        '''Everything recorded so far as a Trace.'''
+        self.flush()
+        if self.directory is not None:
+            return Trace.load(self.directory)
+        return Trace(_concatenate(self.chunks, self.columns), self.widths)
+
+
+def _concatenate(chunks, columns):
+    return {name: np.concatenate([chunk[name] for chunk in chunks]) if chunks
+            else np.empty(0, dtype=np.int64) for name in columns}
+
+
+class Trace:
+    '''Recorded columns, each a NumPy array with one entry per sampled cycle.'''
+
+    def __init__(self, columns, widths):
+        self.columns = columns
+        self.widths = widths
+
+    @classmethod
+    def load(cls, directory):
+        directory = pathlib.Path(directory)
+        meta = json.loads((directory / 'columns.json').read_text())
+
+        chunks = []
+        for path in sorted(directory.glob('chunk_*.npz')):
+            with np.load(path) as data:
+                chunks.append({name: data[name] for name in meta['columns']})
+        return cls(_concatenate(chunks, meta['columns']), meta['widths'])
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def __len__(self):
+        return len(self.columns['cycle'])
+
+    def signed(self, name):
+        '''Column as two's complement values of its signal width.'''
+        values = self.columns[name]
+        half = 1 << (self.widths[name] - 1)
+        return np.where(values == UNRESOLVED, 0, ((values + half) % (2 * half)) - half)
+
+    def matrix(self, name):
+        '''Every element column of an array signal, as (cycles, elements).'''
+        names = sorted((column for column in self.columns if column.startswith(f'{name}[')),
+                       key=lambda column: [int(i) for i in re.findall(r'\[(\d+)\]', column)])
+        return np.stack([self.columns[column] for column in names], axis=-1)
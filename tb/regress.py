@@ -0,0 +1,350 @@
+'''
+Parallel cocotb regression
+
+Runs the CocotbTestPackages declared in tb/mk.py with one simulation per
+test and parameter point, spread over a pool of workers:
+
+    python tb/regress.py -j 64 --junit regress.xml
+    python tb/regress.py tb_hs_npu -k stream --param HS_NPU_STREAM_LENGTH=64,1024
+
+Tests are found by reading each package's cocotb modules for @cocotb.test()
+functions and picked one at a time with TESTCASE. Every run gets its own
+directory under --work holding its results.xml and log. Runs of the same
+package and top level parameters share one simulator build next to them:
+the first run elaborates it alone, the others only simulate and go in
+parallel once it is done. Parameter points are passed to the simulation as
+environment variables, the cross product of every --param is run, so they
+never need a build of their own. Per-test outcomes, cocotb's sim time and the wall time of each
+simulation go into one JUnit file.
+
+The simulation is started with --command, a template over {root},
+{package}, {top}, {build}, {testcase} and {generics}, run from the run's
+directory. The default goes through the mk flow with SIM_BUILD pointed at
+the shared build directory. That flow lives in the mk submodule, outside
+this tree, and isolation rests on it honoring SIM_BUILD: a default run that
+leaves no sim_build there is reported as an error rather than trusted. A
+custom --command has to keep its build under {build} itself. Top level
+parameter overrides (see tb/bench.py) are passed as -GNAME=value in
+{generics} and to the testbench as HS_NPU_PARAMS.
+'''
+import argparse
+import ast
+import concurrent.futures
+import dataclasses
+import itertools
+import os
+import pathlib
+import re
+import shlex
+import subprocess
+import sys
+import time
+import xml.etree.ElementTree as ET
+
+TB = pathlib.Path(__file__).resolve().parent
+ROOT = TB.parent
+
+DEFAULT_COMMAND = 'make -C {root} {package} SIM_BUILD={build}/sim_build EXTRA_ARGS="{generics}"'
+
+
+@dataclasses.dataclass
+class TestPackage:
+    name: str
+    top: str = None
+    paths: list = dataclasses.field(default_factory=list)
+    modules: list = dataclasses.field(default_factory=list)
+
+
+@dataclasses.dataclass
+class TestRun:
+    package: TestPackage
+    testcase: str
+    params: dict
+    generics: dict = dataclasses.field(default_factory=dict)
+
+    @property
+    def name(self):
+        suffix = ','.join(f'{key}={value}' for key, value in {**self.generics, **self.params}.items())
+        return f'{self.testcase}[{suffix}]' if suffix else self.testcase
+
+    @property
+    def directory(self):
+        return pathlib.Path(self.package.name, _sanitize(self.name))
+
+    @property
+    def build_directory(self):
+        '''Shared by every run of the package with the same generics.'''
+        generics = ','.join(f'{key}={value}' for key, value in self.generics.items())
+        return pathlib.Path(self.package.name, _sanitize(f'build[{generics}]' if generics else 'build'))
+
+
+def _sanitize(name):
+    return re.sub(r'[^\w.=,-]+', '_', name)
+
+
+@dataclasses.dataclass
+class TestResult:
+    run: TestRun
+    outcome: str
+    wall_time: float
+    sim_time_ns: float = None
+    message: str = ''
+    log: pathlib.Path = None
+
+
+def read_packages(path=TB / 'mk.py'):
+    '''
+    CocotbTestPackages declared in a mk.py, by name
+
+    The file is only parsed, not run: declarations are the
+    `name = CocotbTestPackage('...')` assignments and `name.method(literal)`
+    calls that follow them.
+    '''
+    packages = {}
+    variables = {}
+    for statement in ast.parse(pathlib.Path(path).read_text()).body:
+        node = getattr(statement, 'value', None)
+        if not isinstance(node, ast.Call):
+            continue
+
+        function = node.func
+        if isinstance(statement, ast.Assign) and isinstance(function, ast.Name) \
+                and function.id == 'CocotbTestPackage':
+            package = TestPackage(ast.literal_eval(node.args[0]))
+            packages[package.name] = package
+            for target in statement.targets:
+                variables[target.id] = package
+
+        elif isinstance(function, ast.Attribute) and isinstance(function.value, ast.Name) \
+                and function.value.id in variables and node.args:
+            package = variables[function.value.id]
+            try:
+                value = ast.literal_eval(node.args[0])
+            except ValueError:
+                continue  # requires(other_package) and the like
+
+            if function.attr == 'top':
+                package.top = value
+            elif function.attr == 'cocotb_paths':
+                package.paths = list(value)
+            elif function.attr == 'cocotb_modules':
+                package.modules = list(value)
+
+    return packages
+
+
+def _is_cocotb_test(decorator):
+    if isinstance(decorator, ast.Call):
+        decorator = decorator.func
+    return isinstance(decorator, ast.Attribute) and decorator.attr == 'test' \
+        and isinstance(decorator.value, ast.Name) and decorator.value.id == 'cocotb'
+
+
+def find_tests(package, base=TB):
+    '''Names of the @cocotb.test() functions in a package's modules.'''
+    tests = []
+    for module in package.modules:
+        for path in package.paths:
+            source = base / path / f'{module}.py'
+            if source.exists():
+                break
+        else:
+            raise FileNotFoundError(f'{package.name}: module {module} not in {package.paths}')
+
+        for node in ast.parse(source.read_text()).body:
+            if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)) \
+                    and any(_is_cocotb_test(decorator) for decorator in node.decorator_list):
+                tests.append(node.name)
+    return tests
+
+
+def parameter_points(params):
+    '''Cross product of NAME=v1,v2 specs as a list of {NAME: value} dicts.'''
+    axes = []
+    for spec in params:
+        name, _, values = spec.partition('=')
+        if not name or not values:
+            raise ValueError(f'parameter {spec!r} is not NAME=value[,value...]')
+        axes.append([(name, value) for value in values.split(',')])
+    return [dict(point) for point in itertools.product(*axes)]
+
+
+def _read_results(path, testcase):
+    # cocotb writes one testcase element per test it ran, with a failure or
+    # skipped child when it did not pass
+    for element in ET.parse(path).iter('testcase'):
+        if element.get('name') != testcase:
+            continue
+        sim_time = element.get('sim_time_ns')
+        sim_time = float(sim_time) if sim_time is not None else None
+        for outcome in ('failure', 'error', 'skipped'):
+            child = element.find(outcome)
+            if child is not None:
+                return outcome, sim_time, child.get('message', '')
+        return 'passed', sim_time, ''
+    return 'error', None, f'{testcase} missing from {path.name}'
+
+
+def run_test(run, work, command=DEFAULT_COMMAND, timeout=None):
+    '''Simulate one test in its own directory under work, on its shared build.'''
+    directory = (work / run.directory).resolve()
+    directory.mkdir(parents=True, exist_ok=True)
+    build = (work / run.build_directory).resolve()
+    build.mkdir(parents=True, exist_ok=True)
+    results = directory / 'results.xml'
+    log = directory / 'sim.log'
+    results.unlink(missing_ok=True)
+
+    env = dict(os.environ, **run.params)
+    env['TESTCASE'] = run.testcase
+    env['COCOTB_RESULTS_FILE'] = str(results)
+    if run.generics:
+        env['HS_NPU_PARAMS'] = ','.join(f'{key}={value}' for key, value in run.generics.items())
+
+    generics = ' '.join(f'-G{key}={value}' for key, value in run.generics.items())
+    argv = shlex.split(command.format(root=ROOT, package=run.package.name, top=run.package.top,
+                                      build=build, testcase=run.testcase, generics=generics))
+
+    start = time.perf_counter()
+    with open(log, 'w') as output:
+        try:
+            process = subprocess.run(argv, cwd=directory, env=env, stdout=output,
+                                     stderr=subprocess.STDOUT, timeout=timeout)
+            returncode = process.returncode
+        except subprocess.TimeoutExpired:
+            returncode = None
+        except OSError as error:
+            output.write(f'{error}\n')
+            returncode = -1
+    wall_time = time.perf_counter() - start
+
+    if returncode is None:
+        return TestResult(run, 'error', wall_time, message=f'timed out after {timeout} s', log=log)
+    if command == DEFAULT_COMMAND and not (build / 'sim_build').is_dir():
+        return TestResult(run, 'error', wall_time,
+                          message='the mk flow ignored SIM_BUILD, the build was not isolated', log=log)
+    if not results.exists():
+        return TestResult(run, 'error', wall_time,
+                          message=f'no results.xml, simulation exited with {returncode}', log=log)
+
+    outcome, sim_time, message = _read_results(results, run.testcase)
+    return TestResult(run, outcome, wall_time, sim_time, message, log)
+
+
+def run_tests(runs, work, command=DEFAULT_COMMAND, timeout=None, jobs=None):
+    '''
+    Simulate runs on up to jobs workers, yields each TestResult as it ends
+
+    The first run of every build goes alone and elaborates it, the other
+    runs on that build start once it is done. When it fails without leaving
+    a build behind they are reported as errors instead of each retrying it.
+    '''
+    builds = {}
+    for run in runs:
+        builds.setdefault(run.build_directory, []).append(run)
+
+    # Each worker only waits on its simulator process, threads are enough to
+    # keep jobs simulations going
+    with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as pool:
+        pending = {pool.submit(run_test, group[0], work, command, timeout): group[1:]
+                   for group in builds.values()}
+        while pending:
+            done, _ = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                rest = pending.pop(future)
+                result = future.result()
+                yield result
+
+                built = command != DEFAULT_COMMAND or \
+                    (work / result.run.build_directory / 'sim_build').is_dir()
+                for run in rest:
+                    if built:
+                        pending[pool.submit(run_test, run, work, command, timeout)] = []
+                    else:
+                        yield TestResult(run, 'error', 0.0, message=f'{result.run.name} did not '
+                                         f'build {run.build_directory}, see {result.log}')
+
+
+def to_junit(results, path):
+    '''One testsuite per package, testcase times are simulation wall times.'''
+    suites = ET.Element('testsuites', name='hs_npu regression')
+    for package, group in itertools.groupby(sorted(results, key=lambda r: r.run.package.name),
+                                            key=lambda r: r.run.package.name):
+        group = list(group)
+        suite = ET.SubElement(suites, 'testsuite', name=package, tests=str(len(group)),
+                              failures=str(sum(r.outcome == 'failure' for r in group)),
+                              errors=str(sum(r.outcome == 'error' for r in group)),
+                              skipped=str(sum(r.outcome == 'skipped' for r in group)),
+                              time=f'{sum(r.wall_time for r in group):.3f}')
+        for result in group:
+            attributes = {'name': result.run.name, 'classname': package,
+                          'time': f'{result.wall_time:.3f}'}
+            if result.sim_time_ns is not None:
+                attributes['sim_time_ns'] = repr(result.sim_time_ns)
+            testcase = ET.SubElement(suite, 'testcase', **attributes)
+            if result.outcome != 'passed':
+                ET.SubElement(testcase, result.outcome, message=result.message)
+            if result.log is not None:
+                ET.SubElement(testcase, 'system-out').text = f'[[ATTACHMENT|{result.log}]]'
+
+    ET.indent(suites)
+    ET.ElementTree(suites).write(path, encoding='utf-8', xml_declaration=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('packages', nargs='*', help='packages to run, all of tb/mk.py by default')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(),
+                        help='simulations run at once')
+    parser.add_argument('-k', '--filter', help='only tests whose name matches this regex')
+    parser.add_argument('--param', action='append', default=[], metavar='NAME=V1,V2',
+                        help='environment variable swept over, may be repeated')
+    parser.add_argument('--work', type=pathlib.Path, default=pathlib.Path('regress'),
+                        help='directory for builds and per-run logs')
+    parser.add_argument('--junit', type=pathlib.Path, default=pathlib.Path('regress.xml'))
+    parser.add_argument('--command', default=DEFAULT_COMMAND, help='simulation command template')
+    parser.add_argument('--timeout', type=float, help='seconds before a simulation is killed')
+    parser.add_argument('--list', action='store_true', help='print the runs and exit')
+    args = parser.parse_args(argv)
+
+    packages = read_packages()
+    unknown = set(args.packages) - set(packages)
+    if unknown:
+        parser.error(f'unknown packages: {", ".join(sorted(unknown))}')
+
+    runs = []
+    points = parameter_points(args.param)
+    for name in args.packages or packages:
+        for testcase in find_tests(packages[name]):
+            if args.filter and not re.search(args.filter, testcase):
+                continue
+            runs.extend(TestRun(packages[name], testcase, point) for point in points)
+
+    if args.list:
+        for run in runs:
+            print(f'{run.package.name}::{run.name}')
+        return 0
+
+    results = []
+    for result in run_tests(runs, args.work, args.command, args.timeout, args.jobs):
+        results.append(result)
+        print(f'{result.outcome.upper():8} {result.wall_time:8.1f} s  '
+              f'{result.run.package.name}::{result.run.name}', flush=True)
+
+    to_junit(results, args.junit)
+
+    width = max((len(f'{r.run.package.name}::{r.run.name}') for r in results), default=0)
+    print(f'\n{"test":{width}}  {"outcome":8}  {"wall s":>8}  {"sim ns":>12}')
+    for result in sorted(results, key=lambda r: r.wall_time, reverse=True):
+        sim_time = f'{result.sim_time_ns:.0f}' if result.sim_time_ns is not None else '-'
+        print(f'{result.run.package.name + "::" + result.run.name:{width}}  '
+              f'{result.outcome:8}  {result.wall_time:8.1f}  {sim_time:>12}')
+
+    failed = [r for r in results if r.outcome in ('failure', 'error')]
+    print(f'\n{len(results) - len(failed)}/{len(results)} passed, '
+          f'{sum(r.wall_time for r in results):.1f} s of simulation, JUnit in {args.junit}')
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())